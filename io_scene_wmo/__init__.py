@@ -84,6 +84,32 @@ class WMOPreferences(bpy.types.AddonPreferences):
         subtype='FILE_PATH'
     )
 
+    file_cache_size = bpy.props.IntProperty(
+        name="Game File Cache (MB)",
+        description="Memory budget for keeping recently read game files decompressed. 0 disables the cache",
+        default=256,
+        min=0
+    )
+
+    blp_workers = bpy.props.IntProperty(
+        name="BLP Conversion Processes",
+        description="Number of BLP converter processes to run at once. 0 uses one per CPU core",
+        default=0,
+        min=0
+    )
+
+    direct_textures = bpy.props.BoolProperty(
+        name="Load Textures In Memory",
+        description="Decode textures in-process and hand pixels directly to Blender images instead of extracting PNG files",
+        default=True
+    )
+
+    pack_textures = bpy.props.BoolProperty(
+        name="Pack Imported Textures",
+        description="Pack textures loaded in memory into the .blend file, so that they are saved with it",
+        default=False
+    )
+
     # addon updater preferences
 
     auto_check_update = bpy.props.BoolProperty(
@@ -124,6 +150,10 @@ class WMOPreferences(bpy.types.AddonPreferences):
         self.layout.prop(self, "wmv_path")
         self.layout.prop(self, "blp_path")
         self.layout.prop(self, "fileinfo_path")
+        self.layout.prop(self, "file_cache_size")
+        self.layout.prop(self, "blp_workers")
+        self.layout.prop(self, "direct_textures")
+        self.layout.prop(self, "pack_textures")
         addon_updater_ops.update_settings_ui(self, context)
 
 class WMOImporter(bpy.types.Operator):
@@ -194,9 +224,22 @@ class WMOExporter(bpy.types.Operator, ExportHelper):
         default=True,
         )
 
+    pack_mpq = BoolProperty(
+        name="Pack to patch MPQ",
+        description="Also package the exported root and group files into an MPQ archive next to them",
+        default=False,
+        )
+
+    mpq_dir = StringProperty(
+        name="Directory in MPQ",
+        description="Game data directory to store the WMO files under inside the archive",
+        default="World\\wmo",
+        )
+
 
     def execute(self, context):
-        export_wmo.export_wmo_from_blender_scene(self.filepath, self.autofill_textures, self.export_selected)
+        export_wmo.export_wmo_from_blender_scene(self.filepath, self.autofill_textures, self.export_selected,
+                                                 self.pack_mpq, self.mpq_dir)
 
         return {'FINISHED'}
 
@@ -4,7 +4,7 @@ from . import m2 as m2_
 from . import skin as skin_
 
 
-def m2_to_blender_mesh(dir, filepath, filedata):
+def m2_to_blender_mesh(dir, filepath, filedata, max_texture_size=0):
     """Import World of Warcraft M2 model to scene."""
 
     print("\nImporting model: <<" + filepath + ">>")
@@ -66,23 +66,27 @@ def m2_to_blender_mesh(dir, filepath, filedata):
     for texture in m2.textures:
         texture_paths.append(texture.name.decode("utf-8").rstrip('\0'))
 
-    filedata.extract_textures_as_png(dir, texture_paths)
+    textures = filedata.import_textures(dir, texture_paths, max_texture_size)
 
     # set textures
     for batch in skin.texunit:
         m2_mesh = skin.mesh[batch.submesh]
 
         # check if forced decompression is required here !!!
-        path = os.path.splitext(
-            m2.textures[m2.tex_lookup[batch.texture].Id].name.decode("utf-8").rstrip('\0')
-        )[0] + ".png"
+        texture_path = m2.textures[m2.tex_lookup[batch.texture].Id].name.decode("utf-8").rstrip('\0')
+        path = os.path.splitext(texture_path)[0] + ".png"
 
         img = None
 
-        try:
-            img = bpy.data.images.load(os.path.join(dir, path), check_existing=True)
-        except:
-            print("\nFailed to load texture: " + path + " File is missing or invalid.")
+        if textures is not None:
+            img = textures.get(filedata.normalize_path(texture_path))
+            if not img:
+                print("\nFailed to load texture: " + texture_path + " File is missing or invalid.")
+        else:
+            try:
+                img = bpy.data.images.load(os.path.join(dir, path), check_existing=True)
+            except:
+                print("\nFailed to load texture: " + path + " File is missing or invalid.")
 
         if img:
             for i in range(m2_mesh.tri_offset // 3, (m2_mesh.tri_offset + m2_mesh.num_tris) // 3):
@@ -0,0 +1,224 @@
+import struct
+import zlib
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BLP_COMPRESSION_JPEG = 0
+BLP_COMPRESSION_PALETTE = 1
+BLP_COMPRESSION_DXT = 2
+BLP_COMPRESSION_ARGB8888 = 3
+
+BLP_ALPHA_DXT1 = 0
+BLP_ALPHA_DXT3 = 1
+BLP_ALPHA_DXT5 = 7
+
+BLPHeader = namedtuple('BLPHeader', ['magic', 'compression', 'alpha_depth', 'alpha_type', 'has_mips',
+                                     'width', 'height', 'mip_offsets', 'mip_sizes', 'palette_offset'])
+
+
+def read_header(data):
+    """ Parse the header of a BLP1 or BLP2 texture. BLP1 compression values are mapped onto BLP2 ones. """
+    magic = bytes(data[:4])
+
+    if magic == b'BLP2':
+        type, compression, alpha_depth, alpha_type, has_mips, width, height = struct.unpack_from('<I4B2I', data, 4)
+        offsets = struct.unpack_from('<16I', data, 20)
+        sizes = struct.unpack_from('<16I', data, 84)
+        if type == 0:
+            compression = BLP_COMPRESSION_JPEG
+        return BLPHeader(magic, compression, alpha_depth, alpha_type, has_mips, width, height, offsets, sizes, 148)
+
+    if magic == b'BLP1':
+        compression, alpha_depth, width, height, picture_type, has_mips = struct.unpack_from('<6I', data, 4)
+        offsets = struct.unpack_from('<16I', data, 28)
+        sizes = struct.unpack_from('<16I', data, 92)
+        compression = BLP_COMPRESSION_PALETTE if compression == 1 else BLP_COMPRESSION_JPEG
+        return BLPHeader(magic, compression, alpha_depth, 0, has_mips, width, height, offsets, sizes, 156)
+
+    raise ValueError("Invalid BLP file header.")
+
+
+def get_mip_count(header):
+    """ Get the number of mip levels stored in a texture. """
+    if not header.has_mips:
+        return 1
+    count = 0
+    while count < 16 and header.mip_offsets[count] and header.mip_sizes[count]:
+        count += 1
+    return max(count, 1)
+
+
+def get_mip_size(header, mip_level):
+    return max(1, header.width >> mip_level), max(1, header.height >> mip_level)
+
+
+def get_mip_level_for_size(header, max_size):
+    """ Get the first stored mip level with neither side larger than max_size, or the last stored one. """
+    mip_level = 0
+    while max(get_mip_size(header, mip_level)) > max_size and mip_level < get_mip_count(header) - 1:
+        mip_level += 1
+    return mip_level
+
+
+def decode_rgb565(colors):
+    """ Expand RGB565 values to an array of 8-bit RGB triples. """
+    colors = colors.astype(numpy.uint32)
+    r = colors >> 11 & 0x1F
+    g = colors >> 5 & 0x3F
+    b = colors & 0x1F
+    return numpy.stack((r << 3 | r >> 2, g << 2 | g >> 4, b << 3 | b >> 2), axis=-1)
+
+
+def decode_dxt_colors(blocks, has_alpha, force_four_colors):
+    """ Decode the colour part of DXT blocks into RGBA pixels of shape (blocks, 16, 4). """
+    c0 = blocks[:, 0].astype(numpy.uint32) | blocks[:, 1].astype(numpy.uint32) << 8
+    c1 = blocks[:, 2].astype(numpy.uint32) | blocks[:, 3].astype(numpy.uint32) << 8
+    rgb0 = decode_rgb565(c0)
+    rgb1 = decode_rgb565(c1)
+
+    four_colors = (c0 > c1)[:, None] | force_four_colors
+    palette = numpy.empty((len(blocks), 4, 4), dtype=numpy.uint32)
+    palette[:, 0, :3] = rgb0
+    palette[:, 1, :3] = rgb1
+    palette[:, 2, :3] = numpy.where(four_colors, (2 * rgb0 + rgb1) // 3, (rgb0 + rgb1) // 2)
+    palette[:, 3, :3] = numpy.where(four_colors, (rgb0 + 2 * rgb1) // 3, 0)
+    palette[:, :, 3] = 255
+    if has_alpha:
+        palette[:, 3, 3] = numpy.where(four_colors[:, 0], 255, 0)
+
+    indices = blocks[:, 4:8].copy().view('<u4')[:, 0]
+    indices = indices[:, None] >> numpy.arange(0, 32, 2, dtype=numpy.uint32) & 3
+
+    return palette[numpy.arange(len(blocks))[:, None], indices]
+
+
+def decode_dxt3_alpha(blocks):
+    nibbles = numpy.empty((len(blocks), 16), dtype=numpy.uint32)
+    nibbles[:, 0::2] = blocks[:, :8] & 0x0F
+    nibbles[:, 1::2] = blocks[:, :8] >> 4
+    return nibbles * 17
+
+
+def decode_dxt5_alpha(blocks):
+    a0 = blocks[:, 0].astype(numpy.uint32)[:, None]
+    a1 = blocks[:, 1].astype(numpy.uint32)[:, None]
+    steps = numpy.arange(1, 7, dtype=numpy.uint32)
+
+    eight = ((7 - steps) * a0 + steps * a1) // 7
+    six = ((5 - steps[:4]) * a0 + steps[:4] * a1) // 5
+    six = numpy.concatenate((six, numpy.zeros_like(a0), numpy.full_like(a0, 255)), axis=1)
+
+    palette = numpy.concatenate((a0, a1, numpy.where(a0 > a1, eight, six)), axis=1)
+
+    bits = numpy.zeros((len(blocks), 8), dtype=numpy.uint8)
+    bits[:, :6] = blocks[:, 2:8]
+    bits = bits.view('<u8')[:, 0]
+    indices = bits[:, None] >> numpy.arange(0, 48, 3, dtype=numpy.uint64) & 7
+
+    return palette[numpy.arange(len(blocks))[:, None], indices.astype(numpy.intp)]
+
+
+def decode_dxt(data, width, height, alpha_depth, alpha_type):
+    """ Decode DXT1/3/5 compressed pixel data into an RGBA array of shape (height, width, 4). """
+    blocks_x = (width + 3) // 4
+    blocks_y = (height + 3) // 4
+    block_size = 8 if alpha_type == BLP_ALPHA_DXT1 else 16
+
+    blocks = numpy.frombuffer(data, dtype=numpy.uint8, count=blocks_x * blocks_y * block_size)
+    blocks = blocks.reshape(-1, block_size)
+
+    if alpha_type == BLP_ALPHA_DXT1:
+        pixels = decode_dxt_colors(blocks, alpha_depth > 0, False)
+    else:
+        pixels = decode_dxt_colors(blocks[:, 8:], False, True)
+        if alpha_type == BLP_ALPHA_DXT5:
+            pixels[:, :, 3] = decode_dxt5_alpha(blocks)
+        else:
+            pixels[:, :, 3] = decode_dxt3_alpha(blocks)
+
+    # (block row, block column, pixel row, pixel column) to image rows
+    pixels = pixels.reshape(blocks_y, blocks_x, 4, 4, 4).transpose(0, 2, 1, 3, 4)
+    pixels = pixels.reshape(blocks_y * 4, blocks_x * 4, 4)
+
+    return numpy.ascontiguousarray(pixels[:height, :width], dtype=numpy.uint8)
+
+
+def decode_alpha(data, count, alpha_depth):
+    """ Unpack a plane of 1, 4 or 8-bit alpha values to 8-bit. """
+    data = numpy.frombuffer(data, dtype=numpy.uint8)
+
+    if alpha_depth == 1:
+        bits = data[:, None] >> numpy.arange(8, dtype=numpy.uint8) & 1
+        return bits.reshape(-1)[:count] * numpy.uint8(255)
+    if alpha_depth == 4:
+        alpha = numpy.empty(len(data) * 2, dtype=numpy.uint8)
+        alpha[0::2] = data & 0x0F
+        alpha[1::2] = data >> 4
+        return alpha[:count] * numpy.uint8(17)
+    if alpha_depth == 8:
+        return data[:count]
+
+    raise ValueError("Unsupported BLP alpha depth: {}".format(alpha_depth))
+
+
+def decode_palette(data, palette, width, height, alpha_depth):
+    """ Decode palettized pixel data followed by an optional alpha plane into an RGBA array. """
+    count = width * height
+    indices = numpy.frombuffer(data, dtype=numpy.uint8, count=count)
+
+    # palette entries are stored as BGRA
+    pixels = palette[indices][:, [2, 1, 0, 3]]
+    if alpha_depth:
+        pixels[:, 3] = decode_alpha(data[count:count + (count * alpha_depth + 7) // 8], count, alpha_depth)
+    else:
+        pixels[:, 3] = 255
+
+    return pixels.reshape(height, width, 4)
+
+
+def decode_blp(data, mip_level=0):
+    """ Decode a mip level of a BLP1 or BLP2 texture into a NumPy RGBA array of shape (height, width, 4).
+    Rows are ordered top to bottom. JPEG compressed textures are not supported. """
+    if numpy is None:
+        raise ImportError("NumPy is required to decode BLP textures.")
+
+    header = read_header(data)
+    mip_level = min(mip_level, get_mip_count(header) - 1)
+    width, height = get_mip_size(header, mip_level)
+    offset = header.mip_offsets[mip_level]
+    mip_data = data[offset:offset + header.mip_sizes[mip_level]]
+
+    if header.compression == BLP_COMPRESSION_PALETTE:
+        palette = numpy.frombuffer(data, dtype=numpy.uint8, count=1024, offset=header.palette_offset)
+        return decode_palette(mip_data, palette.reshape(256, 4), width, height, header.alpha_depth)
+
+    if header.compression == BLP_COMPRESSION_DXT:
+        return decode_dxt(mip_data, width, height, header.alpha_depth, header.alpha_type)
+
+    if header.compression == BLP_COMPRESSION_ARGB8888:
+        pixels = numpy.frombuffer(mip_data, dtype=numpy.uint8, count=width * height * 4).reshape(height, width, 4)
+        return numpy.ascontiguousarray(pixels[:, :, [2, 1, 0, 3]])
+
+    raise NotImplementedError("JPEG compressed BLP textures are not supported.")
+
+
+def write_png(filepath, pixels):
+    """ Write an RGBA array of shape (height, width, 4) to a PNG file. """
+    height, width = pixels.shape[:2]
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+    # every row starts with filter type 0
+    rows = numpy.zeros((height, width * 4 + 1), dtype=numpy.uint8)
+    rows[:, 1:] = pixels.reshape(height, width * 4)
+
+    with open(filepath, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>2I5B', width, height, 8, 6, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
@@ -0,0 +1,63 @@
+import os
+import json
+
+MANIFEST_NAME = '.wow_extraction_manifest.json'
+MANIFEST_VERSION = 1
+
+
+class ExtractionManifest:
+    """ Record of files extracted or converted into a directory, keyed by game file path.
+    Each entry stores the signature of the game data it was produced from (source archive and block,
+    or loose file stat) and the output path relative to the directory. An output is only
+    regenerated when the signature of its source changes or the output is gone. """
+
+    def __init__(self, dir):
+        self.dir = dir
+        self.path = os.path.join(dir, MANIFEST_NAME)
+        self.entries = {}
+        self.modified = False
+
+        try:
+            with open(self.path, 'r') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                self.entries = manifest['entries']
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    def get_outdated(self, sources):
+        """ Get game file paths whose recorded output is missing or was produced from different game data.
+        'sources' maps game file paths to (source signature, output path relative to the directory).
+        Output presence is checked with one directory listing per output directory. """
+
+        listings = {}
+
+        def output_exists(output):
+            output_dir, name = os.path.split(os.path.join(self.dir, output))
+            if output_dir not in listings:
+                try:
+                    listings[output_dir] = set(os.listdir(output_dir))
+                except OSError:
+                    listings[output_dir] = set()
+            return name in listings[output_dir]
+
+        return [filepath for filepath, (source, output) in sources.items()
+                if self.entries.get(filepath) != [source, output] or not output_exists(output)]
+
+    def update(self, filepath, source, output):
+        self.entries[filepath] = [source, output]
+        self.modified = True
+
+    def save(self):
+        """ Write the manifest if it changed, through a temporary file so that a reader never sees it partially. """
+        if not self.modified:
+            return
+
+        os.makedirs(self.dir, exist_ok=True)
+        temp_path = self.path + '.tmp'
+
+        with open(temp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f)
+
+        os.replace(temp_path, self.path)
+        self.modified = False
@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+
+from . import mpyq
+
+CACHE_MAGIC = b'WOWIDX01'
+CACHE_ALIGNMENT = 8
+
+
+class GameFileIndex:
+    """ Merged index of game files over all loaded archives and folder patches.
+    Archive entries are kept as parallel arrays sorted by (hash_a << 32 | hash_b) key, so they can be
+    used straight from a memory-mapped cache. Files of folder patches are kept in a small dictionary. """
+
+    def __init__(self, resource_map, keys, owners, blocks, loose_files):
+        self.resource_map = resource_map
+        self.keys = keys
+        self.owners = owners
+        self.blocks = blocks
+        self.loose_files = loose_files
+
+    def __len__(self):
+        return len(self.keys) + len(self.loose_files)
+
+    def get(self, key, default=None):
+        """ Return (archive, block entry) or (absolute path, None) for a (hash_a, hash_b) key. """
+        owner = None
+        combined = key[0] << 32 | key[1]
+
+        i = bisect_left(self.keys, combined)
+        if i < len(self.keys) and self.keys[i] == combined:
+            owner = self.owners[i]
+
+        loose_file = self.loose_files.get(key)
+        if loose_file and (owner is None or loose_file[0] < owner):
+            return loose_file[1], None
+
+        if owner is None:
+            return default
+
+        archive = self.resource_map[owner][0]
+        return archive, archive.get_block_entry(self.blocks[i])
+
+
+def hash_path(filepath):
+    """ Get the (hash_a, hash_b) key of a game file path. """
+    filepath = filepath.replace('/', '\\')
+    return mpyq.MPQArchive._hash(filepath, 'HASH_A'), mpyq.MPQArchive._hash(filepath, 'HASH_B')
+
+
+def is_hashable_path(filepath):
+    """ Check if a path can be hashed. MPQ names are latin-1 strings, so no game file has a name that can not be
+    encoded as one. """
+    try:
+        mpyq.MPQArchive._encode_name(filepath)
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def hash_paths(filepaths):
+    """ Get the (hash_a, hash_b) keys of many game file paths at once. """
+    return mpyq.MPQArchive._hash_many([filepath.replace('/', '\\') for filepath in filepaths])
+
+
+def index_loose_files(resource_map):
+    """ Walk folder patches and index their files by path hash. Earlier resources win. """
+    loose_files = {}
+
+    for owner, (storage, type) in enumerate(resource_map):
+        if type:
+            continue
+
+        for root, dirs, filenames in os.walk(storage):
+            for filename in filenames:
+                abs_path = os.path.join(root, filename)
+                rel_path = os.path.relpath(abs_path, storage)
+                if not is_hashable_path(rel_path):
+                    print("\nSkipped folder patch file <<{}>>, not a valid game file name.".format(abs_path))
+                    continue
+
+                key = hash_path(rel_path)
+                if key not in loose_files:
+                    loose_files[key] = (owner, abs_path)
+
+    return loose_files
+
+
+def build_file_index(resource_map):
+    """ Build the merged file index from the hash tables of the loaded archives. Earlier resources win.
+    Hash entries pointing past the end of the block table, as found in protected archives, are skipped. """
+    entries = {}
+
+    for owner, (storage, type) in enumerate(resource_map):
+        if not type:
+            continue
+
+        n_blocks = len(storage.block_table)
+        for (hash_a, hash_b), hash_entry in storage.hash_index.items():
+            key = hash_a << 32 | hash_b
+            if key in entries or hash_entry.block_table_index >= n_blocks:
+                continue
+
+            block_entry = storage.block_table[hash_entry.block_table_index]
+            if block_entry.flags & mpyq.MPQ_FILE_EXISTS and block_entry.archived_size:
+                entries[key] = (owner, hash_entry.block_table_index)
+
+    keys = array('Q', sorted(entries))
+    owners = array('H', (entries[key][0] for key in keys))
+    blocks = array('I', (entries[key][1] for key in keys))
+
+    return GameFileIndex(resource_map, keys, owners, blocks, index_loose_files(resource_map))
+
+
+def get_resource_signature(package):
+    """ Describe a resource so that a cache built for it can be invalidated when it changes. """
+    if os.path.isfile(package):
+        stat = os.stat(package)
+        return [package, True, stat.st_size, stat.st_mtime_ns]
+
+    return [package, False, 0, 0]
+
+
+def encode_header(header):
+    """ Make an MPQ header dictionary JSON-serializable. """
+    result = {}
+    for key, value in header.items():
+        if isinstance(value, dict):
+            value = encode_header(value)
+        elif isinstance(value, bytes):
+            value = {'bytes': value.hex()}
+        result[key] = value
+    return result
+
+
+def decode_header(header):
+    """ Restore an MPQ header dictionary encoded with encode_header(). """
+    result = {}
+    for key, value in header.items():
+        if isinstance(value, dict):
+            value = bytes.fromhex(value['bytes']) if 'bytes' in value else decode_header(value)
+        result[key] = value
+    return result
+
+
+def save_cache(cache_path, packages, resource_map, file_index):
+    """ Write decoded archive tables and the merged file index to a binary cache file.
+    The file is a JSON metadata block followed by aligned raw sections. It is written to a temporary
+    file first and then moved in place, so a reader never sees a partial cache. """
+
+    sections = []
+    archives = []
+
+    def add_section(data):
+        sections.append(bytes(data))
+        return len(sections) - 1
+
+    for package, (storage, type) in zip(packages, resource_map):
+        if type:
+            archives.append({'header': encode_header(storage.header),
+                             'hash': add_section(storage.hash_table_data),
+                             'block': add_section(storage.block_table_data)})
+        else:
+            archives.append(None)
+
+    metadata = {'byteorder': sys.byteorder,
+                'resources': [get_resource_signature(package) for package in packages],
+                'archives': archives,
+                'index': [add_section(file_index.keys),
+                          add_section(file_index.owners),
+                          add_section(file_index.blocks)]}
+
+    # section offsets depend on metadata size, so reserve room for them first
+    section_table_size = len(sections) * 16
+    metadata = json.dumps(metadata).encode('utf-8')
+    offset = len(CACHE_MAGIC) + 8 + len(metadata) + section_table_size
+    offset += -offset % CACHE_ALIGNMENT
+
+    section_table = bytearray()
+    for data in sections:
+        section_table += struct.pack('<2Q', offset, len(data))
+        offset += len(data) + (-len(data) % CACHE_ALIGNMENT)
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temp_path = cache_path + '.tmp'
+
+    with open(temp_path, 'wb') as f:
+        f.write(CACHE_MAGIC)
+        f.write(struct.pack('<2I', len(metadata), len(sections)))
+        f.write(metadata)
+        f.write(section_table)
+        for data in sections:
+            f.write(b'\0' * (-f.tell() % CACHE_ALIGNMENT))
+            f.write(data)
+
+    os.replace(temp_path, cache_path)
+
+
+def load_cache(cache_path, packages, archive_options):
+    """ Map a cache file written by save_cache() and validate it against the current resources.
+    Archives are opened with the given MPQArchive keyword arguments.
+    Returns the opened resource map and merged file index, or None if the cache is missing or stale. """
+
+    if not os.path.isfile(cache_path):
+        return None
+
+    with open(cache_path, 'rb') as f:
+        if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+            return None
+
+        mapping = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    start = len(CACHE_MAGIC)
+    metadata_size, n_sections = struct.unpack_from('<2I', mapping, start)
+    start += 8
+    metadata = json.loads(bytes(mapping[start:start + metadata_size]).decode('utf-8'))
+    start += metadata_size
+
+    if metadata['byteorder'] != sys.byteorder \
+    or metadata['resources'] != [get_resource_signature(package) for package in packages]:
+        return None
+
+    def get_section(i, format=None):
+        offset, size = struct.unpack_from('<2Q', mapping, start + i * 16)
+        section = mapping[offset:offset + size]
+        return section.cast(format) if format else section
+
+    resource_map = []
+    for package, archive in zip(packages, metadata['archives']):
+        if archive:
+            tables = (decode_header(archive['header']), get_section(archive['hash']), get_section(archive['block']))
+            resource_map.append((mpyq.MPQArchive(package, tables=tables, **archive_options), True))
+        else:
+            resource_map.append((package, False))
+
+    keys, owners, blocks = metadata['index']
+    file_index = GameFileIndex(resource_map, get_section(keys, 'Q'), get_section(owners, 'H'),
+                               get_section(blocks, 'I'), index_loose_files(resource_map))
+
+    return resource_map, file_index
@@ -0,0 +1,130 @@
+import re
+import fnmatch
+
+
+def normalize_path(filepath):
+    """ Get the case and separator independent form of a game file path. """
+    return filepath.replace('/', '\\').lower()
+
+
+def read_listfile(data):
+    """ Split listfile contents into file paths. Accepts newline, carriage return and semicolon separators. """
+    if not isinstance(data, str):
+        data = bytes(data).decode('latin-1')
+
+    return [path.strip() for path in re.split(r'[\r\n;]+', data) if path.strip()]
+
+
+class PathTrieNode:
+    __slots__ = ('name', 'children')
+
+    def __init__(self, name):
+        self.name = name
+        self.children = {}
+
+
+class PathTrie:
+    """ Prefix tree of game file paths split by directory.
+    Lookups are case-insensitive but return paths as spelled in the first listfile that contained them.
+    Directory nodes map lower case component names to child nodes, files map them to their full path. """
+
+    def __init__(self):
+        self.root = PathTrieNode('')
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, filepath):
+        return self.find(filepath) is not None
+
+    def add(self, filepath):
+        components = filepath.replace('/', '\\').split('\\')
+        node = self.root
+
+        for component in components[:-1]:
+            child = node.children.get(component.lower())
+            if child is None:
+                child = node.children[component.lower()] = PathTrieNode(component)
+            elif not isinstance(child, PathTrieNode):
+                return
+            node = child
+
+        key = components[-1].lower()
+        if key not in node.children:
+            node.children[key] = '\\'.join(components)
+            self.count += 1
+
+    def get_node(self, dirpath):
+        node = self.root
+        for component in normalize_path(dirpath).strip('\\').split('\\'):
+            if not component:
+                continue
+            node = node.children.get(component) if isinstance(node, PathTrieNode) else None
+            if node is None:
+                return None
+        return node
+
+    def find(self, filepath):
+        """ Return the stored spelling of a file path or None if it is not known. """
+        node = self.get_node(filepath)
+        return node if isinstance(node, str) else None
+
+    def listdir(self, dirpath=''):
+        """ List names of files and subdirectories of a directory. Directory names end with a backslash. """
+        node = self.get_node(dirpath)
+        if not isinstance(node, PathTrieNode):
+            return []
+
+        return sorted(child.name + '\\' if isinstance(child, PathTrieNode) else child.rsplit('\\', 1)[-1]
+                      for child in node.children.values())
+
+    def walk(self, node=None):
+        """ Yield full paths of all files below a node. """
+        stack = [node or self.root]
+        while stack:
+            node = stack.pop()
+            for child in node.children.values():
+                if isinstance(child, PathTrieNode):
+                    stack.append(child)
+                else:
+                    yield child
+
+    def glob(self, pattern):
+        """ Find file paths matching a shell-style pattern, case-insensitively.
+        Wildcards match within a single path component, except for a '**' component that matches any
+        number of directories. Components without wildcards are looked up directly. """
+        components = normalize_path(pattern).split('\\')
+        nodes = [self.root]
+
+        for i, component in enumerate(components):
+            is_last = i == len(components) - 1
+            next_nodes = []
+
+            for node in nodes:
+                if component == '**':
+                    if is_last:
+                        return sorted(path for node in nodes for path in self.walk(node))
+                    next_nodes.append(node)
+                    next_nodes.extend(self.walk_dirs(node))
+                elif not any(char in component for char in '*?['):
+                    child = node.children.get(component)
+                    if child is not None:
+                        next_nodes.append(child)
+                else:
+                    next_nodes.extend(child for name, child in node.children.items()
+                                      if fnmatch.fnmatchcase(name, component))
+
+            nodes = [node for node in next_nodes if isinstance(node, PathTrieNode) != is_last]
+
+        return sorted(set(nodes))
+
+    @staticmethod
+    def walk_dirs(node):
+        """ Yield all directory nodes below a node. """
+        stack = [node]
+        while stack:
+            for child in stack.pop().children.values():
+                if isinstance(child, PathTrieNode):
+                    stack.append(child)
+                    yield child
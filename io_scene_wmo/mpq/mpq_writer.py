@@ -0,0 +1,134 @@
+import os
+import struct
+import zlib
+from collections import OrderedDict
+
+from .mpyq import (MPQArchive, MPQFileHeader, MPQHashTableEntry, MPQBlockTableEntry, get_sector_pool,
+                   MPQ_FILE_COMPRESS, MPQ_FILE_EXISTS, MPQ_HASH_ENTRY_EMPTY,
+                   MPQ_LOCALE_NEUTRAL, MPQ_PLATFORM_NEUTRAL)
+
+# Sectors of a file are handed to the pool in runs of this many, so that
+# small files do not pay the pool overhead per sector.
+SECTORS_PER_JOB = 64
+
+
+def compress_sectors(data, sector_size, first, last, level):
+    """ Compress sectors [first, last) of a file. A sector is stored uncompressed unless zlib gains at least a byte. """
+    result = []
+    for i in range(first, last):
+        sector = data[i * sector_size:(i + 1) * sector_size]
+        compressed = b'\x02' + zlib.compress(sector, level)
+        result.append(compressed if len(compressed) < len(sector) else sector)
+    return result
+
+
+class MPQWriter:
+    """ Writer of new MPQ archives, e.g. patch archives of exported files.
+    Files are collected in memory and written out on close(), with sectors compressed on a thread pool. """
+
+    def __init__(self, filename, sector_size_shift=3, workers=None, compression_level=6, listfile=True):
+        self.filename = filename
+        self.sector_size_shift = sector_size_shift
+        self.sector_size = 512 << sector_size_shift
+        self.workers = workers or os.cpu_count() or 1
+        self.compression_level = compression_level
+        self.listfile = listfile
+        self.files = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def add_file(self, name, data):
+        """ Add a file under an archive path. A file added again under the same path replaces the previous one. """
+        name = name.replace('/', '\\')
+        self.files[name.upper()] = (name, bytes(data))
+
+    def add_files_from_disk(self, paths, archive_dir=''):
+        """ Add files from disk under an archive directory, keeping their base names. """
+        for path in paths:
+            with open(path, 'rb') as f:
+                self.add_file(os.path.join(archive_dir, os.path.basename(path)).replace('/', '\\'), f.read())
+
+    def compress_files(self, files):
+        """ Compress all files into sector offset tables followed by sectors, using the worker pool. """
+        pool = get_sector_pool(self.workers)
+        jobs = []
+
+        for data in files:
+            n_sectors = -(-len(data) // self.sector_size)
+            jobs.append([pool.submit(compress_sectors, data, self.sector_size, first,
+                                     min(first + SECTORS_PER_JOB, n_sectors), self.compression_level)
+                         for first in range(0, n_sectors, SECTORS_PER_JOB)])
+
+        for file_jobs in jobs:
+            sectors = [sector for job in file_jobs for sector in job.result()]
+
+            positions = [4 * (len(sectors) + 1)]
+            for sector in sectors:
+                positions.append(positions[-1] + len(sector))
+
+            yield b''.join([struct.pack('<%dI' % len(positions), *positions)] + sectors)
+
+    def build_hash_table(self, names):
+        """ Place names in a hash table of the next power of two size that keeps it at most 3/4 full. """
+        size = 16
+        while size * 3 < len(names) * 4:
+            size *= 2
+
+        table = [MPQHashTableEntry(MPQ_HASH_ENTRY_EMPTY, MPQ_HASH_ENTRY_EMPTY, 0xFFFF, 0xFFFF, MPQ_HASH_ENTRY_EMPTY)] * size
+
+        for block_index, name in enumerate(names):
+            index = MPQArchive._hash(name, 'TABLE_OFFSET') & (size - 1)
+            while table[index].block_table_index != MPQ_HASH_ENTRY_EMPTY:
+                index = (index + 1) & (size - 1)
+
+            table[index] = MPQHashTableEntry(MPQArchive._hash(name, 'HASH_A'), MPQArchive._hash(name, 'HASH_B'),
+                                             MPQ_LOCALE_NEUTRAL, MPQ_PLATFORM_NEUTRAL, block_index)
+
+        return table
+
+    def close(self):
+        """ Write the archive. It is written to a temporary file first and then moved in place. """
+        files = list(self.files.values())
+        if self.listfile:
+            files = [entry for entry in files if entry[0].upper() != '(LISTFILE)']
+            files.append(('(listfile)', '\r\n'.join(name for name, data in files).encode('latin-1')))
+
+        names = [name for name, data in files]
+        header_size = struct.calcsize(MPQFileHeader.struct_format)
+        temp_path = self.filename + '.tmp'
+
+        with open(temp_path, 'wb') as f:
+            f.seek(header_size)
+            block_table = []
+
+            for (name, data), block in zip(files, self.compress_files([data for name, data in files])):
+                flags = MPQ_FILE_EXISTS | MPQ_FILE_COMPRESS if data else MPQ_FILE_EXISTS
+                if not data:
+                    block = b''
+                block_table.append(MPQBlockTableEntry(f.tell(), len(block), len(data), flags))
+                f.write(block)
+
+            hash_table = self.build_hash_table(names)
+            hash_table_offset = f.tell()
+            f.write(MPQArchive._encrypt(
+                b''.join(struct.pack('<' + MPQHashTableEntry.struct_format, *entry) for entry in hash_table),
+                MPQArchive._hash('(hash table)', 'TABLE')))
+
+            block_table_offset = f.tell()
+            f.write(MPQArchive._encrypt(
+                b''.join(struct.pack('<' + MPQBlockTableEntry.struct_format, *entry) for entry in block_table),
+                MPQArchive._hash('(block table)', 'TABLE')))
+
+            archive_size = f.tell()
+            f.seek(0)
+            f.write(struct.pack(MPQFileHeader.struct_format, b'MPQ\x1a', header_size, archive_size, 0,
+                                self.sector_size_shift, hash_table_offset, block_table_offset,
+                                len(hash_table), len(block_table)))
+
+        os.replace(temp_path, self.filename)
+        self.files.clear()
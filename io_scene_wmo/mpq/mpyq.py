@@ -8,13 +8,24 @@ mpyq is a Python library for reading MPQ (MoPaQ) archives.
 from __future__ import print_function
 
 import bz2
+import io
+import mmap
 import os
 import struct
+import sys
+import threading
 import zlib
 import re
-from collections import namedtuple
+from array import array
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 __author__ = "Aku Kotkavuo"
 __version__ = "0.2.5"
@@ -53,6 +64,33 @@ MPQFileHeaderExt = namedtuple('MPQFileHeaderExt',
 )
 MPQFileHeaderExt.struct_format = 'q2h'
 
+MPQFileHeaderV3 = namedtuple('MPQFileHeaderV3',
+    '''
+    archive_size_64
+    bet_table_offset
+    het_table_offset
+    '''
+)
+MPQFileHeaderV3.struct_format = '<3Q'
+
+MPQFileHeaderV4 = namedtuple('MPQFileHeaderV4',
+    '''
+    hash_table_size_64
+    block_table_size_64
+    hi_block_table_size_64
+    het_table_size_64
+    bet_table_size_64
+    raw_chunk_size
+    md5_block_table
+    md5_hash_table
+    md5_hi_block_table
+    md5_bet_table
+    md5_het_table
+    md5_mpq_header
+    '''
+)
+MPQFileHeaderV4.struct_format = '<5QI16s16s16s16s16s16s'
+
 MPQUserDataHeader = namedtuple('MPQUserDataHeader',
     '''
     magic
@@ -84,30 +122,480 @@ MPQBlockTableEntry = namedtuple('MPQBlockTableEntry',
 )
 MPQBlockTableEntry.struct_format = '4I'
 
+MPQExtTableHeader = namedtuple('MPQExtTableHeader',
+    '''
+    signature
+    version
+    data_size
+    '''
+)
+MPQExtTableHeader.struct_format = '<4s2I'
+
+MPQHetTableHeader = namedtuple('MPQHetTableHeader',
+    '''
+    table_size
+    entry_count
+    total_count
+    name_hash_bit_size
+    index_size_total
+    index_size_extra
+    index_size
+    index_table_size
+    '''
+)
+MPQHetTableHeader.struct_format = '<8I'
+
+MPQBetTableHeader = namedtuple('MPQBetTableHeader',
+    '''
+    table_size
+    entry_count
+    unknown_08
+    table_entry_size
+    bit_index_file_pos
+    bit_index_file_size
+    bit_index_cmp_size
+    bit_index_flag_index
+    bit_index_unknown
+    bit_count_file_pos
+    bit_count_file_size
+    bit_count_cmp_size
+    bit_count_flag_index
+    bit_count_unknown
+    bit_total_name_hash_2
+    bit_extra_name_hash_2
+    bit_count_name_hash_2
+    name_hash_array_size
+    flag_count
+    '''
+)
+MPQBetTableHeader.struct_format = '<19I'
+
+MPQ_HASH_ENTRY_EMPTY    = 0xFFFFFFFF
+MPQ_HASH_ENTRY_DELETED  = 0xFFFFFFFE
+MPQ_LOCALE_NEUTRAL      = 0
+MPQ_PLATFORM_NEUTRAL    = 0
+MPQ_HET_ENTRY_FREE      = 0x00
+
+
+# Files smaller than this are always decompressed serially, as the pool
+# overhead outweighs the gain on them. See MPQArchive.read_entry, and
+# benchmark_decompression to measure the crossover on a multi-core machine.
+PARALLEL_DECOMPRESSION_MIN_SIZE = 256 * 1024
+
+_sector_pools = {}
+_sector_pools_lock = threading.Lock()
+
+
+def get_sector_pool(workers):
+    """Return the thread pool shared by all archives for sector decompression.
+
+    There is one pool per number of workers. Pools are kept for the life of
+    the process and never shut down, as a caller may still be submitting
+    jobs to a pool it got earlier.
+    """
+    with _sector_pools_lock:
+        pool = _sector_pools.get(workers)
+        if pool is None:
+            pool = _sector_pools[workers] = ThreadPoolExecutor(max_workers=workers)
+        return pool
+
+
+class MPQHandlePool(object):
+    """Bound the number of archives kept open at the same time.
+
+    Archives are closed in least recently used order when the limit is
+    exceeded, and reopened transparently by their next read.
+    """
+
+    def __init__(self, max_open):
+        self.max_open = max_open
+        self.archives = OrderedDict()
+        self.lock = threading.Lock()
+
+    def acquire(self, archive):
+        """Open an archive, mark it as most recently used and return its handle."""
+        with self.lock:
+            handle = archive._open()
+            self.archives[archive] = True
+            self.archives.move_to_end(archive)
+
+            while len(self.archives) > self.max_open:
+                evicted, _ = self.archives.popitem(last=False)
+                evicted._close()
+
+            return handle
+
+    def release(self, archive):
+        with self.lock:
+            self.archives.pop(archive, None)
+            archive._close()
+
+    def close_all(self):
+        with self.lock:
+            for archive in self.archives:
+                archive._close()
+            self.archives.clear()
+
+
+def read_bits(data, offset, count):
+    """Read an unsigned integer of count bits at a bit offset of a
+    little-endian bit array."""
+    start = offset >> 3
+    end = (offset + count + 7) >> 3
+    return int.from_bytes(data[start:end], 'little') >> (offset & 7) & ((1 << count) - 1)
+
+
+def _rot(value, count):
+    return (value << count | value >> (32 - count)) & 0xFFFFFFFF
+
+
+def hashlittle2(data, pc=0, pb=0):
+    """Bob Jenkins' lookup3 hashlittle2. Returns the (c, b) pair."""
+    length = len(data)
+    a = b = c = 0xDEADBEEF + length + pc & 0xFFFFFFFF
+    c = c + pb & 0xFFFFFFFF
+    if not length:
+        return c, b
+
+    data = bytes(data) + b'\0' * (-length % 12)
+    words = struct.unpack('<%dI' % (len(data) // 4), data)
+
+    for i in range(0, len(words) - 3, 3):
+        a = a + words[i] & 0xFFFFFFFF
+        b = b + words[i + 1] & 0xFFFFFFFF
+        c = c + words[i + 2] & 0xFFFFFFFF
+        a = (a - c & 0xFFFFFFFF) ^ _rot(c, 4); c = c + b & 0xFFFFFFFF
+        b = (b - a & 0xFFFFFFFF) ^ _rot(a, 6); a = a + c & 0xFFFFFFFF
+        c = (c - b & 0xFFFFFFFF) ^ _rot(b, 8); b = b + a & 0xFFFFFFFF
+        a = (a - c & 0xFFFFFFFF) ^ _rot(c, 16); c = c + b & 0xFFFFFFFF
+        b = (b - a & 0xFFFFFFFF) ^ _rot(a, 19); a = a + c & 0xFFFFFFFF
+        c = (c - b & 0xFFFFFFFF) ^ _rot(b, 4); b = b + a & 0xFFFFFFFF
+
+    # last, possibly partial, block; padding bytes are zero
+    a = a + words[-3] & 0xFFFFFFFF
+    b = b + words[-2] & 0xFFFFFFFF
+    c = c + words[-1] & 0xFFFFFFFF
+
+    c ^= b; c = c - _rot(b, 14) & 0xFFFFFFFF
+    a ^= c; a = a - _rot(c, 11) & 0xFFFFFFFF
+    b ^= a; b = b - _rot(a, 25) & 0xFFFFFFFF
+    c ^= b; c = c - _rot(b, 16) & 0xFFFFFFFF
+    a ^= c; a = a - _rot(c, 4) & 0xFFFFFFFF
+    b ^= a; b = b - _rot(a, 14) & 0xFFFFFFFF
+    c ^= b; c = c - _rot(b, 24) & 0xFFFFFFFF
+
+    return c, b
+
+
+class MPQHetTable(object):
+    """HET table of format v3 and later archives.
+
+    It is a linearly probed hash table of 8-bit name hashes with a
+    bit-packed array of file indices, looked up in place without
+    unpacking any entries.
+    """
+
+    def __init__(self, data):
+        self.header = MPQHetTableHeader._make(struct.unpack_from(
+            MPQHetTableHeader.struct_format, data, 12))
+        start = 12 + 32
+        total_count = self.header.total_count
+        self.name_hashes = data[start:start + total_count]
+        self.indices = data[start + total_count:
+                            start + total_count + self.header.index_table_size]
+
+        if (len(self.name_hashes) < total_count or not total_count or
+            len(self.indices) * 8 < total_count * self.header.index_size_total):
+            raise ValueError("Truncated HET table.")
+
+        bit_size = self.header.name_hash_bit_size
+        self.and_mask = (1 << bit_size) - 1
+        self.or_mask = 1 << (bit_size - 1)
+
+    def iter_file_indices(self, name_hash):
+        """Yield the file indices of all entries whose 8-bit name hash
+        matches a 64-bit name hash."""
+        header = self.header
+        name_hash_1 = name_hash >> (header.name_hash_bit_size - 8)
+        start = index = name_hash % header.total_count
+
+        while self.name_hashes[index] != MPQ_HET_ENTRY_FREE:
+            if self.name_hashes[index] == name_hash_1:
+                yield read_bits(self.indices, index * header.index_size_total,
+                                header.index_size)
+            index = (index + 1) % header.total_count
+            if index == start:
+                break
+
+
+class MPQBetTable(object):
+    """BET table of format v3 and later archives.
+
+    Holds the bit-packed file table that replaces the block table, and
+    the remaining bits of each file's name hash.
+    """
+
+    def __init__(self, data):
+        self.header = header = MPQBetTableHeader._make(struct.unpack_from(
+            MPQBetTableHeader.struct_format, data, 12))
+        start = 12 + 76
+        self.flags = struct.unpack_from('<%dI' % header.flag_count, data, start)
+        start += 4 * header.flag_count
+        table_size = (header.entry_count * header.table_entry_size + 7) // 8
+        self.table = data[start:start + table_size]
+        start += table_size
+        self.name_hashes = data[start:start + header.name_hash_array_size]
+        self.name_hash_mask = (1 << header.bit_count_name_hash_2) - 1
+
+        if (len(self.table) < table_size or
+            len(self.name_hashes) * 8 < header.entry_count * header.bit_total_name_hash_2):
+            raise ValueError("Truncated BET table.")
+
+    def get_name_hash(self, index):
+        header = self.header
+        return read_bits(self.name_hashes, index * header.bit_total_name_hash_2,
+                         header.bit_count_name_hash_2)
+
+    def get_entry(self, index):
+        """Unpack a file table entry as a block table entry."""
+        header = self.header
+        position = index * header.table_entry_size
+        flag_index = read_bits(self.table, position + header.bit_index_flag_index,
+                               header.bit_count_flag_index)
+        return MPQBlockTableEntry(
+            read_bits(self.table, position + header.bit_index_file_pos,
+                      header.bit_count_file_pos),
+            read_bits(self.table, position + header.bit_index_cmp_size,
+                      header.bit_count_cmp_size),
+            read_bits(self.table, position + header.bit_index_file_size,
+                      header.bit_count_file_size),
+            self.flags[flag_index] if header.flag_count else 0)
+
+
+def decompress(data):
+    """Read the compression type and decompress file data."""
+    compression_type = data[0]
+    if compression_type == 0:
+        return data
+    elif compression_type == 2:
+        return zlib.decompress(data[1:], 15)
+    elif compression_type == 16:
+        return bz2.decompress(data[1:])
+    else:
+        raise RuntimeError("Unsupported compression type.")
+
+
+class MPQFile(io.RawIOBase):
+    """Read-only, seekable stream over a single file of a MPQ archive.
+
+    Only the sectors touched by reads are decompressed. The most recently
+    used decoded sectors are kept in a small cache.
+    """
+
+    def __init__(self, archive, block_entry, force_decompress=False, cache_size=4):
+        super(MPQFile, self).__init__()
+        self.archive = archive
+        self.block_entry = block_entry
+        self.force_decompress = force_decompress
+        self.cache_size = max(1, cache_size)
+        self.cache = OrderedDict()
+        self.size = block_entry.size
+        self.position = 0
+        self.offset = block_entry.offset + archive.header['offset']
+
+        if block_entry.flags & MPQ_FILE_SINGLE_UNIT:
+            self.sector_size = max(self.size, 1)
+            self.positions = (0, block_entry.archived_size)
+        else:
+            self.sector_size = archive.sector_size
+            sectors = (self.size + self.sector_size - 1) // self.sector_size
+            table_size = 4 * (sectors + 2)
+            self.positions = archive.read_sector_positions(
+                block_entry, archive.read_block(self.offset, table_size))
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError("Invalid whence value.")
+        if position < 0:
+            raise ValueError("Negative seek position.")
+        self.position = position
+        return position
+
+    def get_sector(self, index):
+        """Return decoded sector data, decompressing it on a cache miss."""
+        sector = self.cache.get(index)
+        if sector is not None:
+            self.cache.move_to_end(index)
+            return sector
+
+        start, end = self.positions[index], self.positions[index + 1]
+        sector = self.archive.read_block(self.offset + start, end - start)
+
+        if self.block_entry.flags & MPQ_FILE_SINGLE_UNIT:
+            if (self.block_entry.flags & MPQ_FILE_COMPRESS and
+                (self.force_decompress or self.size > len(sector))):
+                sector = decompress(sector)
+        else:
+            sector = self.archive.decode_sector(self.block_entry, sector, index,
+                                                self.force_decompress)
+
+        self.cache[index] = sector
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return sector
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.position
+        end = min(self.position + size, self.size)
+        if end <= self.position:
+            return b''
+
+        chunks = []
+        while self.position < end:
+            index, start = divmod(self.position, self.sector_size)
+            sector = self.get_sector(index)
+            chunk = sector[start:start + end - self.position]
+            if not chunk:
+                break
+            chunks.append(chunk)
+            self.position += len(chunk)
+
+        return b''.join(chunks)
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
 
 class MPQArchive(object):
 
-    def __init__(self, filename, listfile=True):
+    def __init__(self, filename, listfile=True, locale=MPQ_LOCALE_NEUTRAL,
+                 use_mmap=False, tables=None, sector_workers=0,
+                 handle_pool=None):
         """Create a MPQArchive object.
 
         You can skip reading the listfile if you pass listfile=False
         to the constructor. The 'files' attribute will be unavailable
         if you do this.
+
+        When a file is stored in several locales, the entry matching
+        'locale' is preferred, then the neutral one.
+
+        With use_mmap=True the archive is memory-mapped and blocks are
+        served as memoryview slices of the mapping instead of being read
+        through the file object. read_file may then return a memoryview
+        for files stored uncompressed.
+
+        'tables' may hold an already decoded (header, hash table data,
+        block table data) triple, for example from a cache, in which case
+        they are not read and decrypted again. The hash and block tables
+        are only read and unpacked into entries when first accessed.
+
+        Format v3 and later archives with HET and BET tables are looked up
+        through them. The classic tables are used when they are missing
+        or not valid.
+
+        With sector_workers > 1, the sectors of large multi-sector files
+        are decompressed on a shared thread pool of that many workers.
+        Multi-sector files are returned as a bytearray.
+
+        Archives given by path are opened when first read from. With a
+        handle_pool, only the most recently used archives of the pool are
+        kept open and the others are closed until they are needed again.
         """
+        self.locale = locale
+        self.sector_workers = sector_workers
+        self.use_mmap = use_mmap
+        self.handle_pool = handle_pool
+        self.mmap = None
+        self.mapping = None
         if hasattr(filename, 'read'):
             self.file = filename
+            self.filename = getattr(filename, 'name', None)
+            self.handle_pool = None
+            self.open()
+        else:
+            self.file = None
+            self.filename = filename
+        if tables is None:
+            self.header = self.read_header()
+            self._hash_table_data = None
+            self._block_table_data = None
         else:
-            self.file = open(filename, 'rb')
-        self.header = self.read_header()
-        self.hash_table = self.read_table('hash')
-        self.block_table = self.read_table('block')
+            self.header, self._hash_table_data, self._block_table_data = tables
+        self._hash_table = None
+        self._block_table = None
+        self._hash_index = None
+        self._het_table = None
+        self._bet_table = None
         if listfile:
-            self.files = self.read_file('(listfile)').splitlines()
+            self.files = bytes(self.read_file('(listfile)')).splitlines()
         else:
             self.files = None
 
+    def open(self):
+        """Open the archive file if needed and return the handle to read from.
+
+        This is the mapping in mmap mode, the file object otherwise.
+        """
+        if self.handle_pool is not None:
+            return self.handle_pool.acquire(self)
+        return self._open()
+
+    def _open(self):
+        if self.file is None:
+            self.file = open(self.filename, 'rb')
+        if self.use_mmap and self.mapping is None:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mapping = memoryview(self.mmap)
+        return self.mapping if self.use_mmap else self.file
+
+    def close(self):
+        """Close the archive file. It is reopened on the next read.
+
+        A mapping still referenced by returned data is left for the garbage
+        collector to unmap.
+        """
+        if self.handle_pool is not None:
+            self.handle_pool.release(self)
+        else:
+            self._close()
+
+    def _close(self):
+        self.mapping = None
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError:
+                pass
+            self.mmap = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
     def read_header(self):
         """Read the header of a MPQ archive."""
+        self.open()
 
         def read_mpq_header(offset=None):
             if offset:
@@ -116,11 +604,12 @@ class MPQArchive(object):
             header = MPQFileHeader._make(
                 struct.unpack(MPQFileHeader.struct_format, data))
             header = header._asdict()
-            if header['format_version'] == 1:
-                data = self.file.read(12)
-                extended_header = MPQFileHeaderExt._make(
-                    struct.unpack(MPQFileHeaderExt.struct_format, data))
-                header.update(extended_header._asdict())
+            extended_headers = (MPQFileHeaderExt, MPQFileHeaderV3, MPQFileHeaderV4)
+            for extended_header in extended_headers[:header['format_version']]:
+                size = struct.calcsize(extended_header.struct_format)
+                data = self.file.read(size)
+                header.update(extended_header._make(
+                    struct.unpack(extended_header.struct_format, data))._asdict())
             return header
 
         def read_mpq_user_data_header():
@@ -149,6 +638,25 @@ class MPQArchive(object):
 
     def read_table(self, table_type):
         """Read either the hash or block table of a MPQ archive."""
+        return self.unpack_table(table_type, self.read_table_data(table_type))
+
+    def read_table_data(self, table_type):
+        """Read and decrypt the raw data of the hash or block table."""
+
+        if table_type not in ('hash', 'block'):
+            raise ValueError("Invalid table type.")
+
+        table_offset = self.header['%s_table_offset' % table_type]
+        table_entries = self.header['%s_table_entries' % table_type]
+        key = self._hash('(%s table)' % table_type, 'TABLE')
+
+        data = self.read_block(table_offset + self.header['offset'],
+                               table_entries * 16)
+        return self._decrypt(data, key)
+
+    @staticmethod
+    def unpack_table(table_type, data):
+        """Unpack decrypted hash or block table data into entries."""
 
         if table_type == 'hash':
             entry_class = MPQHashTableEntry
@@ -157,57 +665,214 @@ class MPQArchive(object):
         else:
             raise ValueError("Invalid table type.")
 
-        table_offset = self.header['%s_table_offset' % table_type]
-        table_entries = self.header['%s_table_entries' % table_type]
-        key = self._hash('(%s table)' % table_type, 'TABLE')
+        return [entry_class._make(entry) for entry in
+                struct.iter_unpack('<' + entry_class.struct_format, data)]
+
+    @property
+    def hash_table_data(self):
+        if self._hash_table_data is None:
+            self._hash_table_data = self.read_table_data('hash')
+        return self._hash_table_data
 
-        self.file.seek(table_offset + self.header['offset'])
-        data = self.file.read(table_entries * 16)
-        data = self._decrypt(data, key)
+    @property
+    def block_table_data(self):
+        if self._block_table_data is None:
+            self._block_table_data = self.read_table_data('block')
+        return self._block_table_data
 
-        def unpack_entry(position):
-            entry_data = data[position*16:position*16+16]
-            return entry_class._make(
-                struct.unpack(entry_class.struct_format, entry_data))
+    @property
+    def hash_table(self):
+        if self._hash_table is None:
+            self._hash_table = self.unpack_table('hash', self.hash_table_data)
+        return self._hash_table
 
-        return [unpack_entry(i) for i in range(table_entries)]
+    @property
+    def block_table(self):
+        if self._block_table is None:
+            self._block_table = self.unpack_table('block', self.block_table_data)
+        return self._block_table
+
+    def read_ext_table_data(self, table_type):
+        """Read, decrypt and decompress the HET or BET table.
+
+        Returns None if the archive has no such table or it is not valid.
+        """
+        if table_type == 'het':
+            signature, key = b'HET\x1a', self._hash('(hash table)', 'TABLE')
+        elif table_type == 'bet':
+            signature, key = b'BET\x1a', self._hash('(block table)', 'TABLE')
+        else:
+            raise ValueError("Invalid table type.")
+
+        table_offset = self.header.get('%s_table_offset' % table_type)
+        if not table_offset:
+            return None
+        table_offset += self.header['offset']
+
+        size = self.header.get('%s_table_size_64' % table_type)
+        if not size:
+            # v3 headers do not store the size, assume an uncompressed table
+            ext_header = MPQExtTableHeader._make(struct.unpack(
+                MPQExtTableHeader.struct_format, self.read_block(table_offset, 12)))
+            size = ext_header.data_size + 12
+
+        data = bytes(self.read_block(table_offset, size))
+        ext_header = MPQExtTableHeader._make(struct.unpack_from(
+            MPQExtTableHeader.struct_format, data))
+        if ext_header.signature != signature:
+            return None
+
+        # trailing bytes that do not form a whole word are not encrypted
+        body = data[12:]
+        body = self._decrypt(body, key) + body[len(body) - len(body) % 4:]
+        if ext_header.data_size > len(body):
+            body = decompress(body)
+        return data[:12] + body
+
+    def read_ext_tables(self):
+        """Read the HET and BET tables. Returns a (het, bet) pair or None
+        if the archive must be read through the classic tables."""
+        try:
+            het_data = self.read_ext_table_data('het')
+            bet_data = self.read_ext_table_data('bet')
+            if het_data is None or bet_data is None:
+                return None
+            return MPQHetTable(het_data), MPQBetTable(bet_data)
+        except (struct.error, ValueError, zlib.error, OSError):
+            return None
+
+    @property
+    def het_table(self):
+        if self._het_table is None:
+            self._het_table, self._bet_table = self.read_ext_tables() or (False, False)
+        return self._het_table or None
+
+    @property
+    def bet_table(self):
+        return self._bet_table or None if self.het_table else None
+
+    @property
+    def hash_index(self):
+        if self._hash_index is None:
+            self._hash_index = self.build_hash_index()
+        return self._hash_index
+
+    def get_block_entry(self, index):
+        """Unpack a single classic block table entry without unpacking the table.
+
+        The index is one from the classic hash table. It is not used with
+        the BET table, whose file order is not required to be the same.
+        """
+        return MPQBlockTableEntry._make(struct.unpack_from(
+            '<' + MPQBlockTableEntry.struct_format, self.block_table_data, index * 16))
+
+    def read_block(self, offset, size):
+        """Read raw bytes at an absolute offset of the archive.
+
+        Returns a memoryview of the mapping in mmap mode, bytes otherwise.
+        """
+        handle = self.open()
+        if self.use_mmap:
+            return handle[offset:offset + size]
+        handle.seek(offset)
+        return handle.read(size)
+
+    def build_hash_index(self):
+        """Index the hash table by (hash_a, hash_b).
+
+        Empty and deleted slots are skipped. If a name is present more than
+        once, the entry with the best locale/platform match wins.
+        """
+
+        def rank(entry):
+            return ((entry.locale == self.locale) * 2 + (entry.locale == MPQ_LOCALE_NEUTRAL),
+                    entry.platform == MPQ_PLATFORM_NEUTRAL)
+
+        index = {}
+        for entry in self.hash_table:
+            if entry.block_table_index >= MPQ_HASH_ENTRY_DELETED:
+                continue
+
+            key = (entry.hash_a, entry.hash_b)
+            current = index.get(key)
+            if current is None or rank(entry) > rank(current):
+                index[key] = entry
+
+        return index
 
     def get_hash_table_entry(self, filename):
         """Get the hash table entry corresponding to a given filename."""
         hash_a = self._hash(filename, 'HASH_A')
         hash_b = self._hash(filename, 'HASH_B')
-        for entry in self.hash_table:
-            if (entry.hash_a == hash_a and entry.hash_b == hash_b):
-                return entry
+        return self.hash_index.get((hash_a, hash_b))
 
-    def read_file(self, filename, force_decompress=False):
-        """Read a file from the MPQ archive."""
+    def get_het_file_index(self, filename):
+        """Get the file index of a name from the HET table, or None."""
+        het_table, bet_table = self.het_table, self.bet_table
+        name_hash = self._hash_jenkins(filename) & het_table.and_mask | het_table.or_mask
 
-        def decompress(data):
-            """Read the compression type and decompress file data."""
-            compression_type = ord(data[0:1])
-            if compression_type == 0:
-                return data
-            elif compression_type == 2:
-                return zlib.decompress(data[1:], 15)
-            elif compression_type == 16:
-                return bz2.decompress(data[1:])
-            else:
-                raise RuntimeError("Unsupported compression type.")
+        for index in het_table.iter_file_indices(name_hash):
+            if (index < bet_table.header.entry_count and
+                bet_table.get_name_hash(index) == name_hash & bet_table.name_hash_mask):
+                return index
+        return None
 
-        hash_entry = self.get_hash_table_entry(filename)
-        if hash_entry is None:
+    def get_block_table_entry(self, filename):
+        """Get the block table entry of an existing file, or None.
+
+        Archives with valid HET and BET tables are looked up through them,
+        others through the classic hash and block tables.
+        """
+        if self.het_table is not None:
+            index = self.get_het_file_index(filename)
+            block_entry = None if index is None else self.bet_table.get_entry(index)
+        else:
+            hash_entry = self.get_hash_table_entry(filename)
+            if hash_entry is None:
+                return None
+            block_entry = self.get_block_entry(hash_entry.block_table_index)
+        if block_entry is None or not block_entry.flags & MPQ_FILE_EXISTS:
             return None
-        block_entry = self.block_table[hash_entry.block_table_index]
+        return block_entry
+
+    @property
+    def sector_size(self):
+        return 512 << self.header['sector_size_shift']
+
+    def read_sector_positions(self, block_entry, data):
+        """Unpack the sector offset table found at the start of a block."""
+        sectors = (block_entry.size + self.sector_size - 1) // self.sector_size
+        if block_entry.flags & MPQ_FILE_SECTOR_CRC:
+            sectors += 1
+        return struct.unpack('<%dI' % (sectors + 1), data[:4*(sectors+1)])
+
+    def decode_sector(self, block_entry, sector, index, force_decompress=False):
+        """Decompress a single sector of a multi-sector file if needed.
+
+        A sector is only stored compressed when at least one byte is gained.
+        """
+        expected_size = min(self.sector_size,
+                            block_entry.size - index * self.sector_size)
+        if (block_entry.flags & MPQ_FILE_COMPRESS and
+            (force_decompress or expected_size > len(sector))):
+            return decompress(sector)
+        return sector
+
+    def read_file(self, filename, force_decompress=False):
+        """Read a file from the MPQ archive."""
+        return self.read_entry(self.get_block_table_entry(filename),
+                               force_decompress)
+
+    def read_entry(self, block_entry, force_decompress=False):
+        """Read a file from the MPQ archive given its block table entry."""
 
         # Read the block.
-        if block_entry.flags & MPQ_FILE_EXISTS:
+        if block_entry is not None:
             if block_entry.archived_size == 0:
                 return None
 
             offset = block_entry.offset + self.header['offset']
-            self.file.seek(offset)
-            file_data = self.file.read(block_entry.archived_size)
+            file_data = self.read_block(offset, block_entry.archived_size)
 
             if block_entry.flags & MPQ_FILE_ENCRYPTED:
                 raise NotImplementedError("Encryption is not supported yet.")
@@ -215,26 +880,34 @@ class MPQArchive(object):
             if not block_entry.flags & MPQ_FILE_SINGLE_UNIT:
                 # File consists of many sectors. They all need to be
                 # decompressed separately and united.
-                sector_size = 512 << self.header['sector_size_shift']
-                sectors = block_entry.size // sector_size + 1
-                if block_entry.flags & MPQ_FILE_SECTOR_CRC:
-                    crc = True
-                    sectors += 1
+                positions = self.read_sector_positions(block_entry, file_data)
+                sectors = (block_entry.size + self.sector_size - 1) // self.sector_size
+                result = bytearray(block_entry.size)
+                view = memoryview(result)
+
+                def decode_sectors(first, last):
+                    for i in range(first, last):
+                        sector = file_data[positions[i]:positions[i+1]]
+                        sector = self.decode_sector(block_entry, sector, i,
+                                                    force_decompress)
+                        start = i * self.sector_size
+                        view[start:start + len(sector)] = sector
+
+                if (self.sector_workers > 1 and
+                    block_entry.size >= PARALLEL_DECOMPRESSION_MIN_SIZE):
+                    # Each worker gets a contiguous run of sectors, so the
+                    # pool overhead is paid per worker and not per sector.
+                    step = -(-sectors // self.sector_workers)
+                    pool = get_sector_pool(self.sector_workers)
+                    jobs = [pool.submit(decode_sectors, first, min(first + step, sectors))
+                            for first in range(0, sectors, step)]
+                    for job in jobs:
+                        job.result()
                 else:
-                    crc = False
-                positions = struct.unpack('<%dI' % (sectors + 1),
-                                          file_data[:4*(sectors+1)])
-                result = BytesIO()
-                sector_bytes_left = block_entry.size
-                for i in range(len(positions) - (2 if crc else 1)):
-                    sector = file_data[positions[i]:positions[i+1]]
-                    if (block_entry.flags & MPQ_FILE_COMPRESS and
-                        (force_decompress or sector_bytes_left > len(sector))):
-                        sector = decompress(sector)
-
-                    sector_bytes_left -= len(sector)
-                    result.write(sector)
-                file_data = result.getvalue()
+                    decode_sectors(0, sectors)
+
+                view.release()
+                file_data = result
             else:
                 # Single unit files only need to be decompressed, but
                 # compression only happens when at least one byte is gained.
@@ -244,6 +917,23 @@ class MPQArchive(object):
 
             return file_data
 
+    def open_file(self, filename, force_decompress=False, cache_size=4):
+        """Open a file from the MPQ archive as a seekable file-like object.
+
+        Sectors are read and decompressed only when a read touches them.
+        Returns None if the file is not present.
+        """
+        return self.open_entry(self.get_block_table_entry(filename),
+                               force_decompress, cache_size)
+
+    def open_entry(self, block_entry, force_decompress=False, cache_size=4):
+        """Open a file from the MPQ archive given its block table entry."""
+        if block_entry is None:
+            return None
+        if block_entry.flags & MPQ_FILE_ENCRYPTED:
+            raise NotImplementedError("Encryption is not supported yet.")
+        return MPQFile(self, block_entry, force_decompress, cache_size)
+
     def extract(self):
         """Extract all the files inside the MPQ archive in memory."""
         if self.files:
@@ -253,7 +943,7 @@ class MPQArchive(object):
 
     def extract_to_disk(self):
         """Extract all files and write them to disk."""
-        archive_name, extension = os.path.splitext(os.path.basename(self.file.name))
+        archive_name, extension = os.path.splitext(os.path.basename(self.filename))
         if not os.path.isdir(os.path.join(os.getcwd(), archive_name)):
             os.mkdir(archive_name)
         os.chdir(archive_name)
@@ -313,49 +1003,199 @@ class MPQArchive(object):
                                                         block_entry.size,
                                                         width=width))
 
-    def _hash(self, string, hash_type):
+    hash_types = {
+        'TABLE_OFFSET': 0,
+        'HASH_A': 1,
+        'HASH_B': 2,
+        'TABLE': 3
+    }
+
+    @staticmethod
+    def _encode_name(string):
+        # only ASCII letters are upper-cased by the MPQ hash
+        if isinstance(string, bytes):
+            return string.upper()
+        return string.encode('latin-1').upper()
+
+    @classmethod
+    def _hash(cls, string, hash_type):
         """Hash a string using MPQ's hash function."""
-        hash_types = {
-            'TABLE_OFFSET': 0,
-            'HASH_A': 1,
-            'HASH_B': 2,
-            'TABLE': 3
-        }
         seed1 = 0x7FED7FED
         seed2 = 0xEEEEEEEE
 
-        for ch in string.upper():
-            if not isinstance(ch, int): ch = ord(ch)
-            value = self.encryption_table[(hash_types[hash_type] << 8) + ch]
-            seed1 = (value ^ (seed1 + seed2)) & 0xFFFFFFFF
+        string = cls._encode_name(string)
+        table = cls.encryption_table
+        offset = cls.hash_types[hash_type] << 8
+
+        for ch in string:
+            seed1 = (table[offset + ch] ^ (seed1 + seed2)) & 0xFFFFFFFF
             seed2 = ch + seed1 + seed2 + (seed2 << 5) + 3 & 0xFFFFFFFF
 
         return seed1
 
-    def _decrypt(self, data, key):
-        """Decrypt hash or block table or a sector."""
+    @staticmethod
+    def _hash_jenkins(string):
+        """Hash a string using the 64-bit name hash of HET tables."""
+        if not isinstance(string, bytes):
+            string = string.encode('latin-1')
+        c, b = hashlittle2(string.lower().replace(b'/', b'\\'), 2, 1)
+        return b << 32 | c
+
+    @classmethod
+    def _hash_many(cls, strings, hash_types=('HASH_A', 'HASH_B')):
+        """Hash many strings at once.
+
+        Returns a list with a tuple of hashes, one per requested hash type,
+        for each string. The results are identical to calling _hash for
+        every string and type. NumPy is used when available, hashing whole
+        batches of names one character position at a time.
+        """
+        strings = [cls._encode_name(string) for string in strings]
+        offsets = [cls.hash_types[hash_type] << 8 for hash_type in hash_types]
+
+        if numpy is not None:
+            hashes = cls._hash_many_numpy(strings, offsets)
+        else:
+            hashes = cls._hash_many_sorted(strings, offsets)
+
+        return list(zip(*hashes))
+
+    @classmethod
+    def _hash_many_sorted(cls, strings, offsets):
+        """Hash strings in sorted order, reusing the hash state of the
+        prefix shared with the previous string. Listfile names share
+        long directory prefixes, so most characters are not hashed again.
+        """
+        table = cls.encryption_table
+        hashes = [[0] * len(strings) for _ in offsets]
+        # seed pairs after each character of the previous string, per hash type
+        states = [[(0x7FED7FED, 0xEEEEEEEE)] for _ in offsets]
+        previous = b''
+
+        for index in sorted(range(len(strings)), key=strings.__getitem__):
+            string = strings[index]
+            common = 0
+            limit = min(len(string), len(previous))
+            while common < limit and string[common] == previous[common]:
+                common += 1
+            previous = string
+
+            for offset, seeds, result in zip(offsets, states, hashes):
+                del seeds[common + 1:]
+                seed1, seed2 = seeds[-1]
+                for ch in string[common:]:
+                    seed1 = (table[offset + ch] ^ (seed1 + seed2)) & 0xFFFFFFFF
+                    seed2 = ch + seed1 + seed2 + (seed2 << 5) + 3 & 0xFFFFFFFF
+                    seeds.append((seed1, seed2))
+                result[index] = seed1
+
+        return hashes
+
+    @classmethod
+    def _hash_many_numpy(cls, strings, offsets, batch_size=0x10000):
+        """Hash strings with NumPy in batches, as columns of a character
+        matrix. Strings are sorted longest first, so the strings still
+        being hashed at each position are always a leading slice.
+        """
+        table = numpy.array(cls.encryption_table, dtype=numpy.uint32)
+        hashes = [numpy.zeros(len(strings), dtype=numpy.uint32) for _ in offsets]
+        order = sorted(range(len(strings)), key=lambda i: len(strings[i]), reverse=True)
+
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            width = len(strings[batch[0]])
+            if not width:
+                for result in hashes:
+                    result[batch] = 0x7FED7FED
+                continue
+
+            chars = numpy.frombuffer(b''.join(strings[i].ljust(width, b'\0') for i in batch),
+                                     dtype=numpy.uint8).reshape(len(batch), width)
+            chars = numpy.ascontiguousarray(chars.T, dtype=numpy.uint32)
+
+            # number of strings longer than each position
+            lengths = numpy.array([len(strings[i]) for i in batch])
+            active = numpy.searchsorted(-lengths, -numpy.arange(width), side='left')
+
+            for offset, result in zip(offsets, hashes):
+                seed1 = numpy.full(len(batch), 0x7FED7FED, dtype=numpy.uint32)
+                seed2 = numpy.full(len(batch), 0xEEEEEEEE, dtype=numpy.uint32)
+                for position in range(width):
+                    n = active[position]
+                    ch = chars[position, :n]
+                    s1 = table[offset + ch] ^ (seed1[:n] + seed2[:n])
+                    s2 = seed2[:n]
+                    seed2[:n] = ch + s1 + s2 + (s2 << 5) + 3
+                    seed1[:n] = s1
+                result[batch] = seed1
+
+        return [result.tolist() for result in hashes]
+
+    def find_names(self, names):
+        """Return the names from a list, e.g. a listfile, that have an
+        entry in the hash table of this archive."""
+        names = list(names)
+        return [name for name, key in zip(names, self._hash_many(names)) if key in self.hash_index]
+
+    @classmethod
+    def _decrypt(cls, data, key):
+        """Decrypt hash or block table or a sector.
+
+        The buffer is read as an array of little-endian uint32 words, which
+        are decrypted one at a time: each word feeds the key of the next, so
+        the loop can not be done over the whole buffer at once. Trailing bytes
+        that do not form a whole word are dropped, as before.
+        """
+        words = array('I')
+        words.frombytes(data[:len(data) - len(data) % 4])
+        if sys.byteorder == 'big':
+            words.byteswap()
+
+        table = cls.encryption_table[0x400:0x500]
         seed1 = key
         seed2 = 0xEEEEEEEE
-        result = BytesIO()
 
-        for i in range(len(data) // 4):
-            seed2 += self.encryption_table[0x400 + (seed1 & 0xFF)]
-            seed2 &= 0xFFFFFFFF
-            value = struct.unpack("<I", data[i*4:i*4+4])[0]
+        for i, value in enumerate(words):
+            seed2 = seed2 + table[seed1 & 0xFF] & 0xFFFFFFFF
             value = (value ^ (seed1 + seed2)) & 0xFFFFFFFF
+            words[i] = value
 
-            seed1 = ((~seed1 << 0x15) + 0x11111111) | (seed1 >> 0x0B)
-            seed1 &= 0xFFFFFFFF
+            seed1 = ((~seed1 << 0x15) + 0x11111111 & 0xFFFFFFFF) | (seed1 >> 0x0B)
             seed2 = value + seed2 + (seed2 << 5) + 3 & 0xFFFFFFFF
 
-            result.write(struct.pack("<I", value))
+        if sys.byteorder == 'big':
+            words.byteswap()
+
+        return words.tobytes()
 
-        return result.getvalue()
+    @classmethod
+    def _encrypt(cls, data, key):
+        """Encrypt hash or block table data, the inverse of _decrypt."""
+        words = array('I')
+        words.frombytes(data[:len(data) - len(data) % 4])
+        if sys.byteorder == 'big':
+            words.byteswap()
+
+        table = cls.encryption_table[0x400:0x500]
+        seed1 = key
+        seed2 = 0xEEEEEEEE
+
+        for i, value in enumerate(words):
+            seed2 = seed2 + table[seed1 & 0xFF] & 0xFFFFFFFF
+            words[i] = (value ^ (seed1 + seed2)) & 0xFFFFFFFF
+
+            seed1 = ((~seed1 << 0x15) + 0x11111111 & 0xFFFFFFFF) | (seed1 >> 0x0B)
+            seed2 = value + seed2 + (seed2 << 5) + 3 & 0xFFFFFFFF
+
+        if sys.byteorder == 'big':
+            words.byteswap()
+
+        return words.tobytes()
 
     def _prepare_encryption_table():
         """Prepare encryption table for MPQ hash function."""
         seed = 0x00100001
-        crypt_table = {}
+        crypt_table = [0] * 0x500
 
         for i in range(256):
             index = i
@@ -374,11 +1214,117 @@ class MPQArchive(object):
 
     encryption_table = _prepare_encryption_table()
 
+def benchmark_hash(listfile_path):
+    """Print names per second hashed by _hash and _hash_many."""
+    import time
+
+    with open(listfile_path, 'rb') as f:
+        names = [name for name in re.split(b'[\r\n;]+', f.read()) if name]
+
+    start = time.perf_counter()
+    single = [(MPQArchive._hash(name, 'HASH_A'), MPQArchive._hash(name, 'HASH_B')) for name in names]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = MPQArchive._hash_many(names)
+    batch_time = time.perf_counter() - start
+
+    print("{} names, NumPy {}".format(len(names), "available" if numpy is not None else "not available"))
+    print("_hash:      {:>12.0f} names/s".format(len(names) / single_time))
+    print("_hash_many: {:>12.0f} names/s".format(len(names) / batch_time))
+    if single != batch:
+        print("Results differ!")
+
+
+def benchmark_decryption(entries):
+    """Print the time taken by _decrypt on a hash table of random data."""
+    import time
+
+    data = os.urandom(entries * 16)
+    key = MPQArchive._hash('(hash table)', 'TABLE')
+
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        MPQArchive._decrypt(data, key)
+        best = min(best, time.perf_counter() - start)
+
+    print("{} entries ({:.1f} MiB): {:.3f}s, {:.1f} MiB/s".format(
+        entries, len(data) / 1048576, best, len(data) / 1048576 / best))
+
+
+def benchmark_decompression(archive_path, workers):
+    """Print serial and parallel read times of multi-sector files by size.
+
+    Files are grouped by power of two sizes, and the crossover is the
+    smallest size from which the parallel reads are faster for all larger
+    sizes. Parallel reads use a pool of 'workers' threads with no minimum
+    size. Only measured times are reported: with fewer CPUs than workers
+    the parallel path can not gain anything, and the crossover found then
+    should not be used to change PARALLEL_DECOMPRESSION_MIN_SIZE.
+    """
+    import time
+    global PARALLEL_DECOMPRESSION_MIN_SIZE
+
+    def best_time(function, *args):
+        best = float('inf')
+        for _ in range(3):
+            start = time.perf_counter()
+            function(*args)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    serial = MPQArchive(archive_path, listfile=False, use_mmap=True)
+    parallel = MPQArchive(archive_path, listfile=False, use_mmap=True, sector_workers=workers)
+
+    entries = [entry for entry in serial.block_table
+               if entry.flags & MPQ_FILE_EXISTS and entry.flags & MPQ_FILE_COMPRESS
+               and not entry.flags & (MPQ_FILE_SINGLE_UNIT | MPQ_FILE_ENCRYPTED)
+               and entry.size > serial.sector_size]
+    if not entries:
+        print("No compressed multi-sector files in the archive.")
+        return
+
+    min_size = PARALLEL_DECOMPRESSION_MIN_SIZE
+    PARALLEL_DECOMPRESSION_MIN_SIZE = 0
+    try:
+        buckets = {}
+        for entry in entries:
+            times = buckets.setdefault(entry.size.bit_length() - 1, [0, 0.0, 0.0])
+            times[0] += 1
+            times[1] += best_time(serial.read_entry, entry)
+            times[2] += best_time(parallel.read_entry, entry)
+    finally:
+        PARALLEL_DECOMPRESSION_MIN_SIZE = min_size
+
+    print("{} files, {} workers, {} CPUs".format(len(entries), workers, os.cpu_count()))
+    if (os.cpu_count() or 1) < workers:
+        print("Fewer CPUs than workers, the parallel reads can not be faster here.")
+    print("{:>12} {:>6} {:>12} {:>12} {:>8}".format("size", "files", "serial ms", "parallel ms", "speedup"))
+
+    crossover = None
+    for bucket in sorted(buckets):
+        count, serial_time, parallel_time = buckets[bucket]
+        speedup = serial_time / parallel_time
+        if speedup < 1.0:
+            crossover = None
+        elif crossover is None:
+            crossover = 1 << bucket
+        print("{:>9} KiB {:>6} {:>12.3f} {:>12.3f} {:>7.2f}x".format(
+            (1 << bucket) // 1024, count, serial_time / count * 1000, parallel_time / count * 1000, speedup))
+
+    if crossover is None:
+        print("No crossover, parallel decompression does not pay off.")
+    else:
+        print("Crossover: {} KiB (PARALLEL_DECOMPRESSION_MIN_SIZE is {} KiB)".format(
+            crossover // 1024, PARALLEL_DECOMPRESSION_MIN_SIZE // 1024))
+
+
 def main():
     import argparse
     description = "mpyq reads and extracts MPQ archives."
     parser = argparse.ArgumentParser(description=description)
-    parser.add_argument("file", action="store", help="path to the archive")
+    parser.add_argument("file", action="store", nargs="?", help="path to the archive")
     parser.add_argument("-I", "--headers", action="store_true", dest="headers",
                         help="print header information from the archive")
     parser.add_argument("-H", "--hash-table", action="store_true",
@@ -391,7 +1337,24 @@ def main():
                         help="list files inside the archive")
     parser.add_argument("-x", "--extract", action="store_true", dest="extract",
                         help="extract files from the archive")
+    parser.add_argument("-B", "--benchmark-hash", action="store", dest="benchmark_hash",
+                        metavar="LISTFILE", help="measure name hashing throughput on a listfile")
+    parser.add_argument("-E", "--benchmark-decryption", action="store", type=int, dest="benchmark_decryption",
+                        metavar="ENTRIES", help="measure hash table decryption time for a number of entries")
+    parser.add_argument("-D", "--benchmark-decompression", action="store_true", dest="benchmark_decompression",
+                        help="compare serial and parallel decompression of the archive files by size")
+    parser.add_argument("-w", "--workers", action="store", type=int, dest="workers", default=4,
+                        help="thread pool size for --benchmark-decompression (default: 4)")
     args = parser.parse_args()
+    if args.benchmark_hash:
+        benchmark_hash(args.benchmark_hash)
+        return
+    if args.benchmark_decryption:
+        benchmark_decryption(args.benchmark_decryption)
+        return
+    if args.benchmark_decompression and args.file:
+        benchmark_decompression(args.file, args.workers)
+        return
     if args.file:
         if not args.skip_listfile:
             archive = MPQArchive(args.file)
@@ -2,89 +2,466 @@ import re
 import os
 import bpy
 import time
+import zlib
+import struct
+import threading
 import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from . import mpyq
+from . import index_cache
+from . import listfile
+from . import blp
+from .extraction_manifest import ExtractionManifest
 from .mpyq import *
 
+# Options used to open client archives: no listfile, memory-mapped reads and
+# large files decompressed on all cores.
+ARCHIVE_OPTIONS = {'listfile': False, 'use_mmap': True, 'sector_workers': os.cpu_count() or 1}
+
+# Maximum number of client archives kept open at the same time.
+MAX_OPEN_ARCHIVES = 16
+
+
+class FileCache:
+    """ LRU cache of decompressed game files limited by total size in bytes.
+    Files bigger than a fraction of the budget are never cached, so a single huge file
+    cannot flush the rest of the working set. Files are stored as immutable bytes copies, so that
+    a cached file neither keeps an archive mapping alive nor changes with the buffer it came from.
+    Safe to use from several threads. """
+
+    def __init__(self, max_size, max_item_fraction=8):
+        self.max_size = max_size
+        self.max_item_size = max_size // max_item_fraction
+        self.size = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """ Cache a file. Return the cached bytes copy, or data itself if it is too big to be cached. """
+        if len(data) > self.max_item_size:
+            return data
+
+        data = bytes(data)
+        with self.lock:
+            if key in self.entries:
+                return self.entries[key]
+
+            self.entries[key] = data
+            self.size += len(data)
+
+            while self.size > self.max_size:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+        return data
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'files': len(self.entries), 'size': self.size, 'max_size': self.max_size}
+
+
 class WoWFileData():
-    def __init__(self, wow_path, blp_path):
+    def __init__(self, wow_path, blp_path, cache_path=None, file_cache_size=0, blp_workers=0,
+                 direct_textures=True, pack_textures=False):
         self.wow_path = wow_path
-        self.files = self.open_game_resources(self.wow_path)
-        self.converter = BLPConverter(blp_path) if blp_path else None
+        self.cache_path = cache_path or self.get_default_cache_path(wow_path)
+        self.handle_pool = mpyq.MPQHandlePool(MAX_OPEN_ARCHIVES)
+        self.files, self.file_index = self.open_game_resources(self.wow_path, self.cache_path, self.handle_pool)
+        self.file_cache = FileCache(file_cache_size) if file_cache_size else None
+        self.converter = BLPConverter(blp_path, blp_workers) if blp_path else None
+        self.direct_textures = direct_textures and blp.numpy is not None
+        self.pack_textures = pack_textures
+        self.texture_stats = {'images': 0, 'loaded_bytes': 0, 'full_bytes': 0}
+        self.executor = None
+        self.missing_files = set()
+        self.path_trie = None
 
     def __del__(self):
         print("\nUnloading game data...")
+        if getattr(self, "file_cache", None):
+            print("File cache: {hits} hits, {misses} misses, {evictions} evictions.".format(**self.file_cache.stats()))
+        if getattr(self, "executor", None):
+            self.executor.shutdown(wait=False)
+        if getattr(self, "handle_pool", None):
+            self.handle_pool.close_all()
+
+    @staticmethod
+    def get_default_cache_path(wow_path):
+        """ Get the path of the game data index cache for a given client. """
+        cache_dir = bpy.utils.user_resource('CONFIG', "io_scene_wmo", autocreate=True)
+        return os.path.join(cache_dir, "game_data_{:08x}.idx".format(zlib.crc32(os.path.abspath(wow_path).encode('utf-8'))))
+
+    @staticmethod
+    def normalize_path(filepath):
+        """ Get the case and separator independent form of a game file path. """
+        return listfile.normalize_path(filepath)
+
+    def load_listfiles(self, listfile_paths=(), from_archives=True):
+        """ Build the path trie used for directory listing and glob queries.
+        Names come from the (listfile) of every loaded archive, the files of folder patches and
+        the given external listfiles. Only names present in loaded game data are kept. """
+
+        start_time = time.time()
+        trie = listfile.PathTrie()
+
+        def add_names(names):
+            names = [name for name in names if name not in trie and index_cache.is_hashable_path(name)]
+            for name, key in zip(names, index_cache.hash_paths(names)):
+                if self.file_index.get(key) is not None:
+                    trie.add(name)
+
+        for storage, type in self.files:
+            if type and from_archives:
+                data = storage.read_file('(listfile)')
+                if data:
+                    add_names(listfile.read_listfile(data))
+            elif not type:
+                for root, dirs, filenames in os.walk(storage):
+                    add_names(os.path.relpath(os.path.join(root, filename), storage) for filename in filenames)
+
+        for listfile_path in listfile_paths:
+            with open(listfile_path, 'rb') as f:
+                add_names(listfile.read_listfile(f.read()))
+
+        self.path_trie = trie
+        print("\nIndexed {} known file names in {:.3f} seconds.".format(len(trie), time.time() - start_time))
+
+    def get_path_trie(self):
+        if self.path_trie is None:
+            self.load_listfiles()
+        return self.path_trie
+
+    def listdir(self, dirpath=''):
+        """ List files and subdirectories of a game data directory. Subdirectory names end with a backslash. """
+        return self.get_path_trie().listdir(dirpath)
+
+    def glob(self, pattern):
+        """ Find known game file paths matching a case-insensitive shell-style pattern. """
+        return self.get_path_trie().glob(pattern)
+
+    def find_path(self, filepath):
+        """ Get the original spelling of a known game file path, looked up case-insensitively. """
+        return self.get_path_trie().find(filepath)
+
+    def find_file(self, filepath):
+        """ Find the latest version of a file in the merged file index.
+        Returns (archive, block entry), (absolute path, None) or None if the file is missing.
+        Misses are remembered, so probing the same missing path again costs a single set lookup. """
+        filepath = self.normalize_path(filepath)
+
+        if filepath in self.missing_files:
+            return None
+
+        entry = None
+        if index_cache.is_hashable_path(filepath):
+            entry = self.file_index.get(index_cache.hash_path(filepath))
+        if entry is None:
+            self.missing_files.add(filepath)
+
+        return entry
+
+    def exists(self, filepath):
+        """ Check if a file is present in loaded archives and directories. Nothing is read or printed. """
+        return self.find_file(filepath) is not None
 
     def read_file(self, filepath, force_decompress=False):
-        """ Read the latest version of the file from loaded archives and directories. """
-        file = None
-        for pair in self.files:
-            storage = pair[0]
-            type = pair[1]
-
-            if type:
-                file = storage.read_file(filepath, force_decompress)
-            else:
-                abs_path = os.path.join(storage, filepath)
-                if os.path.exists(abs_path) and os.path.isfile(abs_path):
-                    file = open(abs_path, "rb").read()
-            if file:
+        """ Read the latest version of the file from loaded archives and directories.
+        Recently read files are served from the in-memory file cache if it is enabled.
+        The file is a bytes-like object: bytes for cached and loose files, otherwise possibly a memoryview of the
+        archive mapping or a bytearray, valid only while the archive stays open. Use bytes() to keep it. """
+        key = (self.normalize_path(filepath), force_decompress)
+
+        if self.file_cache:
+            file = self.file_cache.get(key)
+            if file is not None:
                 return file
 
+        storage, block_entry = self.find_file(filepath) or (None, None)
+
+        if block_entry:
+            file = storage.read_entry(block_entry, force_decompress)
+        elif storage:
+            with open(storage, "rb") as f:
+                file = f.read()
+        else:
+            file = None
+
+        if file:
+            if self.file_cache:
+                file = self.file_cache.put(key, file)
+            return file
+
+        print("\nRequested file <<" + filepath + ">> not found in MPQ archives.")
+        return None
+
+    def open_file(self, filepath, force_decompress=False):
+        """ Open the latest version of the file from loaded archives and directories as a seekable stream.
+        Archived files are decompressed sector by sector as they are read. """
+        storage, block_entry = self.find_file(filepath) or (None, None)
+
+        if block_entry:
+            return storage.open_entry(block_entry, force_decompress)
+        elif storage:
+            return open(storage, "rb")
+
         print("\nRequested file <<" + filepath + ">> not found in MPQ archives.")
         return None
 
+    def extract_file(self, dir, filename, force_decompress=False):
+        """ Read the latest version of the file from loaded archives and directories and
+        extract it to provided working directory. Returns the path of the extracted file or None. """
+
+        file = self.read_file(filename, force_decompress)
+        if not file:
+            return None
+
+        abs_path = os.path.join(dir, filename)
+        os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+
+        with open(abs_path, 'wb') as f:
+            f.write(file)
+
+        return abs_path
+
+    def get_executor(self):
+        """ Get the thread pool used for extraction and decoding, created on first use. """
+        if not self.executor:
+            self.executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        return self.executor
+
+    def extract_files_async(self, dir, filenames, force_decompress=False):
+        """ Extract files to provided working directory on a thread pool.
+        Decompression and disk writes of different files overlap, as zlib and bz2 release the GIL.
+        Returns a dictionary of futures keyed by filename, each resolving to the extracted path or None.
+        Use concurrent.futures.wait() or asyncio.wrap_future() to wait for them. """
+
+        return {filename: self.get_executor().submit(self.extract_file, dir, filename, force_decompress)
+                for filename in filenames}
+
     def extract_files(self, dir, filenames, force_decompress=False):
         """ Read the latest version of the files from loaded archives and directories and
         extract them to provided working directory. """
 
-        result = False
+        futures = self.extract_files_async(dir, filenames, force_decompress)
+        return any([future.result() for future in futures.values()])
+
+    def get_source_signature(self, filepath, resource_signatures=None):
+        """ Describe the game data a file is read from: the archive and block table entry of the latest version,
+        or the stat of a loose file. Returns None if the file is missing.
+        Resource signatures can be memoized across calls in the given dictionary. """
+
+        entry = self.find_file(filepath)
+        if entry is None:
+            return None
+
+        storage, block_entry = entry
+        if block_entry is None:
+            return index_cache.get_resource_signature(storage)
+
+        if resource_signatures is None:
+            resource_signatures = {}
+        signature = resource_signatures.get(storage.filename)
+        if signature is None:
+            signature = resource_signatures[storage.filename] = index_cache.get_resource_signature(storage.filename)
+
+        return signature + list(block_entry)
+
+    def read_texture(self, filepath, mip_level=0):
+        """ Read a BLP texture from loaded archives and directories and decode it in-process.
+        Returns a NumPy RGBA array of shape (height, width, 4) with rows top to bottom,
+        or None if the file is missing or cannot be decoded. """
+
+        texture = self.read_texture_mip(filepath, mip_level)
+        return texture[0] if texture else None
+
+    def read_texture_mip(self, filepath, mip_level=0, max_size=0):
+        """ Decode a BLP texture at the given mip level, or at the first one fitting into max_size if provided.
+        Returns a tuple of (pixels, decoded mip level, full resolution size) or None. """
+
+        file = self.read_file(filepath)
+        if not file:
+            return None
+
+        try:
+            header = blp.read_header(file)
+            if max_size:
+                mip_level = max(mip_level, blp.get_mip_level_for_size(header, max_size))
+            mip_level = min(mip_level, blp.get_mip_count(header) - 1)
+
+            return blp.decode_blp(file, mip_level), mip_level, (header.width, header.height)
+        except (ValueError, NotImplementedError, struct.error) as exception:
+            print("\nFailed to decode texture <<{}>>: {}".format(filepath, exception))
+            return None
+
+    def decode_textures(self, filenames, mip_level=0, max_size=0):
+        """ Decode BLP textures in-process on a thread pool, without writing anything to disk.
+        Returns a dictionary of read_texture_mip() results keyed by filename. """
+
+        executor = self.get_executor()
+        futures = {filename: executor.submit(self.read_texture_mip, filename, mip_level, max_size)
+                   for filename in filenames}
+        return {filename: future.result() for filename, future in futures.items()}
+
+    def load_images(self, filenames, pack=False, mip_level=0, max_size=0):
+        """ Decode BLP textures in-process and fill new Blender images with their pixels, with no files involved.
+        With max_size, only the first mip level fitting into it is decoded and the image is marked as a proxy
+        through its "wow_mip_level" property, see load_full_resolution().
+        Images already created for the same game file are reused when their mip level is the requested one or a
+        better one, lower resolution images are refilled with the requested mip level. Decoding runs on the thread
+        pool, Blender images are created on the calling thread.
+        Returns a dictionary of Blender images keyed by normalized path. Textures that failed to decode are left out. """
+
+        images = {}
+        to_decode = {}
+        existing = {image.get("wow_path"): image for image in bpy.data.images if image.get("wow_path")}
+
         for filename in filenames:
-            file = self.read_file(filename, force_decompress)
-            if not file:
+            key = self.normalize_path(filename)
+            image = existing.get(key)
+            if image and is_mip_level_sufficient(image, mip_level, max_size):
+                images[key] = image
+            elif key not in to_decode:
+                to_decode[key] = filename
+
+        for filename, texture in self.decode_textures(list(to_decode.values()), mip_level, max_size).items():
+            if texture is not None:
+                pixels, texture_mip_level, (width, height) = texture
+                key = self.normalize_path(filename)
+                image = existing.get(key)
+
+                if image:
+                    # the stored mip level may still be the requested one when no smaller mip level exists
+                    if image.get("wow_mip_level", 0) > texture_mip_level:
+                        self.texture_stats['loaded_bytes'] += pixels.nbytes - image.size[0] * image.size[1] * 4
+                        replace_image_pixels(image, pixels)
+                        image["wow_mip_level"] = texture_mip_level
+                    images[key] = image
+                    continue
+
+                name = os.path.splitext(filename.replace("/", "\\").split("\\")[-1])[0] + ".png"
+                images[key] = create_image(name, pixels, pack)
+                images[key]["wow_path"] = key
+                images[key]["wow_mip_level"] = texture_mip_level
+
+                self.texture_stats['images'] += 1
+                self.texture_stats['loaded_bytes'] += pixels.nbytes
+                self.texture_stats['full_bytes'] += width * height * 4
+
+        return images
+
+    def load_full_resolution(self, images):
+        """ Replace the pixels of proxy images created by load_images() with the full resolution texture.
+        Returns the number of bytes of image memory added. """
+
+        proxies = {image["wow_path"]: image for image in images
+                   if image.get("wow_path") and image.get("wow_mip_level")}
+
+        added_bytes = 0
+        for filename, texture in self.decode_textures(list(proxies.keys())).items():
+            if texture is None:
                 continue
 
-            abs_path = os.path.join(dir, filename)
-            local_dir = os.path.dirname(abs_path)
+            image = proxies[filename]
+            pixels = texture[0]
+            added_bytes += pixels.nbytes - image.size[0] * image.size[1] * 4
 
-            if not os.path.exists(local_dir):
-                os.makedirs(local_dir)
+            replace_image_pixels(image, pixels)
+            image["wow_mip_level"] = 0
 
-            f = open(abs_path, 'wb')
-            f.write(file or b'')
-            f.close()
+        return added_bytes
 
-            result = True
+    def import_textures(self, dir, filenames, max_size=0):
+        """ Make textures available to importers. With direct texture loading, returns a dictionary of
+        Blender images keyed by normalized path, decoded at no more than max_size if it is provided.
+        Otherwise extracts PNG images to the directory and returns None. """
 
-        return result
+        if self.direct_textures:
+            return self.load_images(filenames, self.pack_textures, max_size=max_size)
+
+        self.extract_textures_as_png(dir, filenames)
+        return None
+
+    def write_texture_png(self, dir, filename):
+        """ Decode a BLP texture in-process and write it to provided directory as PNG image.
+        Returns the path of the PNG image or None. """
+
+        pixels = self.read_texture(filename)
+        if pixels is None:
+            return None
+
+        png_path = os.path.splitext(os.path.join(dir, filename))[0] + ".png"
+        os.makedirs(os.path.dirname(png_path), exist_ok=True)
+        blp.write_png(png_path, pixels)
+
+        return png_path
 
     def extract_textures_as_png(self, dir, filenames, force_decompress=False):
         """ Read the latest version of the texture files from loaded archives and directories and
-        extract them to current working directory as PNG images. """
-        if self.converter:
-            blp_paths = []
+        extract them to current working directory as PNG images.
+        PNG images already converted from the same game data are kept, according to the extraction manifest.
+        Textures are decoded in-process when NumPy is available, the BLP converter handles the rest. """
+        if self.converter or blp.numpy is not None:
+            manifest = ExtractionManifest(dir)
+            resource_signatures = {}
+            sources = {}
+            paths = {}
 
             for filename in filenames:
-                abs_path = os.path.join(dir, filename)
-                if not os.path.exists(os.path.splitext(abs_path)[0] + ".png"):
-                    file = self.read_file(filename, force_decompress)
-                    if not file:
-                        continue
-                    local_dir = os.path.dirname(abs_path)
+                source = self.get_source_signature(filename, resource_signatures)
+                if source is not None:
+                    key = self.normalize_path(filename)
+                    sources[key] = (source, os.path.splitext(filename)[0] + ".png")
+                    paths[key] = filename
+
+            outdated = manifest.get_outdated(sources)
 
-                    if not os.path.exists(local_dir):
-                        os.makedirs(local_dir)
+            if blp.numpy is not None:
+                futures = {key: self.get_executor().submit(self.write_texture_png, dir, paths[key]) for key in outdated}
+                for key, future in futures.items():
+                    if future.result():
+                        manifest.update(key, *sources[key])
 
-                    f = open(abs_path, 'wb')
-                    f.write(file or b'')
-                    f.close()
+                outdated = [key for key, future in futures.items() if not future.result()]
 
-                    blp_paths.append(abs_path)
+            if outdated and not self.converter:
+                print("\nPNG texture extraction failed for {} texture(s). "
+                      "No converter executable specified or found".format(len(outdated)))
+                outdated = []
 
-            self.converter.convert(blp_paths)
+            if outdated:
+                futures = self.extract_files_async(dir, [paths[key] for key in outdated], force_decompress)
+                blp_paths = {key: futures[paths[key]].result() for key in outdated}
+                blp_paths = {key: path for key, path in blp_paths.items() if path}
 
-            for blp_path in blp_paths:
-                os.remove(blp_path)
+                failed = set(self.converter.convert(list(blp_paths.values()), True))
+
+                for key, blp_path in blp_paths.items():
+                    os.remove(blp_path)
+                    if blp_path not in failed:
+                        manifest.update(key, *sources[key])
+
+            manifest.save()
 
         else:
             print("\nPNG texture extraction failed. No converter executable specified or found")
@@ -117,65 +494,186 @@ class WoWFileData():
         return False
 
     @staticmethod
-    def open_game_resources(wow_path):
-        """Open game resources and store links to them in memory"""
+    def open_game_resources(wow_path, cache_path=None, handle_pool=None):
+        """Open game resources and store links to them in memory.
+        Decoded archive tables and the merged file index are reused from the cache file when it is up to date,
+        in which case archives are not opened until a file is read from them.
+        Archive file handles are kept in the given handle pool."""
 
         print("\nProcessing available game resources of client: " + wow_path)
         start_time = time.time()
 
         if WoWFileData.is_wow_path_valid(wow_path):
             data_packages = WoWFileData.list_game_data_paths(os.path.join(wow_path, "Data\\"))
-            resource_map = []
+            archive_options = dict(ARCHIVE_OPTIONS, handle_pool=handle_pool)
+            cached = None
+
+            if cache_path:
+                try:
+                    cached = index_cache.load_cache(cache_path, data_packages, archive_options)
+                except (OSError, ValueError, KeyError, TypeError, struct.error):
+                    print("\nGame data index cache is corrupted and will be rebuilt.")
+
+            if cached:
+                resource_map, file_index = cached
+                print("\nLoaded game data index from cache: " + cache_path)
+
+            else:
+                resource_map = []
+
+                for package in data_packages:
+                    if os.path.isfile(package):
+                        resource_map.append((mpyq.MPQArchive(package, **archive_options), True))
+                        print("\nLoaded MPQ: " + os.path.basename(package))
+                    else:
+                        resource_map.append((package, False))
+                        print("\nLoaded folder patch: " + os.path.basename(package))
 
-            for package in data_packages:
-                if os.path.isfile(package):
-                    resource_map.append((mpyq.MPQArchive(package, listfile=False), True))
-                    print("\nLoaded MPQ: " + os.path.basename(package))
-                else:
-                    resource_map.append((package, False))
-                    print("\nLoaded folder patch: " + os.path.basename(package))
+                file_index = index_cache.build_file_index(resource_map)
 
-            print("\nDone initializing data packages.")
+                if cache_path:
+                    try:
+                        index_cache.save_cache(cache_path, data_packages, resource_map, file_index)
+                    except OSError as e:
+                        print("\nFailed to save game data index cache: " + str(e))
+
+            print("\nDone initializing data packages. Indexed {} game files.".format(len(file_index)))
             print("Total loading time: ", time.strftime("%M minutes %S seconds", time.gmtime(time.time() - start_time)))
-            return resource_map
+            return resource_map, file_index
         else:
             print("\nPath to World of Warcraft is empty or invalid. Failed to load game data.")
-            return None
+            return None, {}
+
+def create_image(name, pixels, pack=False):
+    """ Create a Blender image from an RGBA array of shape (height, width, 4) with rows top to bottom. """
+    height, width = pixels.shape[:2]
+    image = bpy.data.images.new(name, width, height, alpha=True)
+    set_image_pixels(image, pixels)
+
+    if pack:
+        image.pack(as_png=True)
+
+    return image
+
+
+def set_image_pixels(image, pixels):
+    """ Fill a Blender image of matching size from an RGBA array of shape (height, width, 4). """
+
+    # Blender stores float pixels with rows bottom to top
+    buffer = pixels[::-1].reshape(-1).astype(blp.numpy.float32)
+    buffer *= 1 / 255
+
+    if hasattr(image.pixels, "foreach_set"):
+        image.pixels.foreach_set(buffer)
+    else:
+        image.pixels[:] = buffer.tolist()
+
+
+def replace_image_pixels(image, pixels):
+    """ Resize a Blender image to an RGBA array of shape (height, width, 4) and fill it, repacking packed images. """
+    height, width = pixels.shape[:2]
+
+    image.scale(width, height)
+    set_image_pixels(image, pixels)
+
+    if image.packed_file:
+        image.pack(as_png=True)
+
+
+def is_mip_level_sufficient(image, mip_level=0, max_size=0):
+    """ Check if an image created by load_images() is at the requested mip level or a better one.
+    The requested level is the first one fitting into max_size, mip levels halve the size of the previous one. """
+    image_mip_level = image.get("wow_mip_level", 0)
+
+    if image_mip_level <= mip_level:
+        return True
+
+    # a larger image is a better mip level, one fitting into max_size but not into half of it is the requested one
+    return bool(max_size) and max(image.size) * 2 > max_size
+
 
 class BLPConverter:
-    def __init__(self, toolPath):
+    def __init__(self, toolPath, workers=None):
         if os.path.exists(toolPath):
             self.toolPath = toolPath
             print("\nFound BLP Converter executable: " + toolPath)
         else:
             raise Exception("\nNo BLPConverter found at given path: " + toolPath)
 
-    def convert(self, filepaths, alwaysReplace = False):
+        self.workers = workers or os.cpu_count() or 1
+
+    def make_batches(self, filepaths):
+        """ Split files into batches that fit the command line length limit.
+        Batches are also kept small enough for every worker process to get one. """
         init_length = len(self.toolPath) + 4
-        init_command = self.toolPath
+        max_count = max(1, -(-len(filepaths) // self.workers))
+        batches = []
         cur_length = 0
         cur_args = []
 
         for filepath in filepaths:
-            if alwaysReplace or not os.path.exists(os.path.splitext(filepath)[0] + ".png"):
-                length = len(filepath)
+            length = len(filepath)
+
+            if cur_args and (2047 - (cur_length + init_length) < length + 2 or len(cur_args) >= max_count):
+                batches.append(cur_args)
+                cur_length = 0
+                cur_args = []
+
+            cur_length += length + 3
+            cur_args.append(filepath)
+
+        if cur_args:
+            batches.append(cur_args)
+
+        return batches
+
+    def convert_batch(self, filepaths):
+        """ Convert a batch of files in one converter process. Returns the files that failed to convert.
+        When a batch fails, files left without a PNG are retried one by one to find the bad ones. """
+        if not subprocess.call([self.toolPath, '/M'] + filepaths):
+            return []
+
+        failed = [filepath for filepath in filepaths if not os.path.exists(os.path.splitext(filepath)[0] + ".png")]
+
+        if len(filepaths) > 1:
+            failed = [filepath for filepath in failed if subprocess.call([self.toolPath, '/M', filepath])]
+
+        return failed
+
+    def convert(self, filepaths, alwaysReplace = False):
+        """ Convert BLP files to PNG, running converter processes concurrently on the configured number of workers.
+        Returns the list of files that failed to convert. """
+        filepaths = [filepath for filepath in filepaths
+                     if alwaysReplace or not os.path.exists(os.path.splitext(filepath)[0] + ".png")]
+        if not filepaths:
+            return []
+
+        # a PNG left from an earlier run would make a failed conversion look successful
+        for filepath in filepaths:
+            try:
+                os.remove(os.path.splitext(filepath)[0] + ".png")
+            except FileNotFoundError:
+                pass
+
+        start_time = time.time()
+        batches = self.make_batches(filepaths)
+        failed = []
+        done = 0
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(batches))) as executor:
+            futures = {executor.submit(self.convert_batch, batch): batch for batch in batches}
+
+            for future in as_completed(futures):
+                failed.extend(future.result())
+                done += len(futures[future])
+                print("\nConverted BLP textures: {}/{}".format(done, len(filepaths)))
 
-                if 2047 - (cur_length + init_length) < length + 2:
-                    final_command = [init_command, '/M']
-                    final_command.extend(cur_args)
-                    if subprocess.call(final_command):
-                        raise Exception("\nBLP convertion failed.")
-                    cur_length = 0
-                    cur_args = []
+        if failed:
+            print("\nBLP convertion failed for {} file(s):\n".format(len(failed)) + "\n".join(failed))
 
-                cur_length += length + 3
-                cur_args.append(filepath)
+        print("\nDone converting BLP textures in {:.2f} seconds.".format(time.time() - start_time))
 
-        if cur_length:
-            final_command = [init_command, '/M']
-            final_command.extend(cur_args)
-            if subprocess.call(final_command):
-                raise Exception("\nBLP convertion failed.")
+        return failed
 
 
 class WOW_FILESYSTEM_LOAD_OP(bpy.types.Operator):
@@ -195,7 +693,11 @@ class WOW_FILESYSTEM_LOAD_OP(bpy.types.Operator):
 
             preferences = bpy.context.user_preferences.addons.get("io_scene_wmo").preferences
 
-            bpy.wow_game_data = WoWFileData(preferences.wow_path, preferences.blp_path)
+            bpy.wow_game_data = WoWFileData(preferences.wow_path, preferences.blp_path,
+                                            file_cache_size=preferences.file_cache_size * 1024 * 1024,
+                                            blp_workers=preferences.blp_workers,
+                                            direct_textures=preferences.direct_textures,
+                                            pack_textures=preferences.pack_textures)
 
             if not bpy.wow_game_data.files:
                 self.report({'ERROR'}, "WoW game data is not loaded. Check settings.")
@@ -14,6 +14,8 @@ class BSPTree:
     def __init__(self):
         self.Nodes = []
         self.Faces = []
+        self.triangles = None
+        self.triangle_bounds = None
         pass
 
     # split box in two smaller, at dist calculated internally
@@ -42,6 +44,33 @@ class BSPTree:
         # ret_splitDist = splitDist - ((box[0][axis] + box[1][axis]) / 2)
         return split_dist, new_box1, new_box2
 
+    def get_faces_in_box(self, box, faces, vertices, indices):
+        """ Get the faces colliding with a box. With NumPy arrays, faces whose bounds do not overlap the box are
+        rejected for all of them at once, the same way collide_box_tri() starts, and the result is an array """
+        faces_in_box = []
+
+        if self.triangles is not None:
+            triangle_min, triangle_max = self.triangle_bounds
+            box_min = numpy.array(box[0], dtype=triangle_min.dtype)
+            box_max = numpy.array(box[1], dtype=triangle_min.dtype)
+            faces = faces[~((triangle_max[faces] < box_min) | (box_max < triangle_min[faces])).any(axis=1)]
+
+            for f, triangle in zip(faces.tolist(), self.triangles[faces].tolist()):
+                if collide_box_tri(box, (Vector(triangle[0]), Vector(triangle[1]), Vector(triangle[2]))):
+                    faces_in_box.append(f)
+
+            return numpy.array(faces_in_box, dtype=numpy.intp)
+
+        for f in faces:
+            tri = (Vector((vertices[indices[f * 3]])),
+                   Vector((vertices[indices[f * 3 + 1]])),
+                   Vector((vertices[indices[f * 3 + 2]])))
+
+            if collide_box_tri(box, tri):
+                faces_in_box.append(f)
+
+        return faces_in_box
+
     # return index of add
     def add_node(self, box, faces_in_box, vertices, indices, max_face_count):
 
@@ -58,7 +87,7 @@ class BSPTree:
             node.FirstFace = len(self.Faces)
             node.Dist = 0
 
-            self.Faces.extend(faces_in_box)
+            self.Faces.extend(int(f) for f in faces_in_box)
             return i_node
 
         # split bigger side
@@ -81,28 +110,14 @@ class BSPTree:
         split_dist = split_result[0]
 
         child1_box = split_result[1]
-        child1_faces = []
 
         # calculate faces in child1 box
-        for f in faces_in_box:
-            tri = (Vector((vertices[indices[f * 3]])),
-                   Vector((vertices[indices[f * 3 + 1]])),
-                   Vector((vertices[indices[f * 3 + 2]])))
-
-            if collide_box_tri(child1_box, tri):
-                child1_faces.append(f)
+        child1_faces = self.get_faces_in_box(child1_box, faces_in_box, vertices, indices)
 
         child2_box = split_result[2]
-        child2_faces = []
 
         # calculate faces in child2 box
-        for f in faces_in_box:
-            tri = (Vector((vertices[indices[f * 3]])),
-                   Vector((vertices[indices[f * 3 + 1]])),
-                   Vector((vertices[indices[f * 3 + 2]])))
-
-            if collide_box_tri(child2_box, tri):
-                child2_faces.append(f)
+        child2_faces = self.get_faces_in_box(child2_box, faces_in_box, vertices, indices)
 
         # dont add child if there is no faces inside
         if len(child1_faces) == 0:
@@ -128,12 +143,26 @@ class BSPTree:
         resurs_limit = sys.getrecursionlimit()
         sys.setrecursionlimit(100000)
 
-        faces = []
-        for iFace in range(len(indices) // 3):
-            faces.append(iFace)
+        if isinstance(vertices, ElementArray) and isinstance(indices, ElementArray):
+            vertices = vertices.array
+            indices = indices.array
+
+            # coordinates and bounds of all triangles, to reject faces outside of a box without testing each one
+            self.triangles = vertices[indices.reshape(-1, 3)]
+            self.triangle_bounds = (self.triangles.min(axis=1), self.triangles.max(axis=1))
+
+            faces = numpy.arange(len(indices) // 3, dtype=numpy.intp)
+            box = (Vector(vertices.min(axis=0).tolist()), Vector(vertices.max(axis=0).tolist()))
+        else:
+            faces = []
+            for iFace in range(len(indices) // 3):
+                faces.append(iFace)
+
+            box = calculate_bounding_box(vertices)
 
-        box = calculate_bounding_box(vertices)
         self.add_node(box, faces, vertices, indices, max_face_count)
+        self.triangles = None
+        self.triangle_bounds = None
 
         sys.setrecursionlimit(resurs_limit)
 
@@ -2,11 +2,12 @@ from .wmo_file import WMOFile
 from .wmo_group import WMOGroupFile
 
 import bpy
+import os
 import time
 
 
-def export_wmo_from_blender_scene(filepath, autofill_textures, export_selected):
-    """ Export WoW WMO object from Blender scene to files """
+def export_wmo_from_blender_scene(filepath, autofill_textures, export_selected, pack_mpq=False, mpq_dir=""):
+    """ Export WoW WMO object from Blender scene to files, optionally packed into a patch MPQ """
 
     start_time = time.time()
 
@@ -71,5 +72,8 @@ def export_wmo_from_blender_scene(filepath, autofill_textures, export_selected):
 
     wmo.write()
 
+    if pack_mpq:
+        wmo.write_mpq(os.path.splitext(filepath)[0] + ".MPQ", mpq_dir)
+
     print("\nExport finished successfully. "
           "\nTotal export time: ", time.strftime("%M minutes %S seconds\a", time.gmtime(time.time() - start_time)))
@@ -44,6 +44,19 @@ class IMPORT_ADT_SCENE(bpy.types.Operator):
         default=True
     )
 
+    max_texture_size = bpy.props.EnumProperty(
+        name="Max texture size",
+        description="Load textures from the first mip level not larger than this size. "
+                    "Full resolution can be loaded later for selected objects",
+        items=[('0', "Full", "Load textures at full resolution"),
+               ('1024', "1024", ""),
+               ('512', "512", ""),
+               ('256', "256", ""),
+               ('128', "128", ""),
+               ('64', "64", "")],
+        default='0'
+    )
+
     def execute(self, context):
 
         game_data = getattr(bpy, "wow_game_data", None)
@@ -120,6 +133,13 @@ class IMPORT_ADT_SCENE(bpy.types.Operator):
                                 wmo_instances[data[1]] = entry
 
 
+        if self.max_texture_size != '0' and not game_data.direct_textures:
+            self.report({'WARNING'}, "Max texture size requires loading textures in memory. "
+                                     "Textures are imported at full resolution.")
+
+        stats = dict(game_data.texture_stats)
+        max_texture_size = int(self.max_texture_size)
+
         instance_cache = {}
 
         # import M2s
@@ -134,7 +154,7 @@ class IMPORT_ADT_SCENE(bpy.types.Operator):
 
             else:
                 try:
-                    obj = m2.m2_to_blender_mesh(save_dir, doodad_path, game_data)
+                    obj = m2.m2_to_blender_mesh(save_dir, doodad_path, game_data, max_texture_size)
                 except:
                     bpy.ops.mesh.primitive_cube_add()
                     obj = bpy.context.scene.objects.active
@@ -175,7 +195,8 @@ class IMPORT_ADT_SCENE(bpy.types.Operator):
                 i += 1
 
             try:
-                obj = import_wmo.import_wmo_to_blender_scene(os.path.join(save_dir, wmo_path), True, True, True)
+                obj = import_wmo.import_wmo_to_blender_scene(os.path.join(save_dir, wmo_path), True, True, True,
+                                                             max_texture_size)
             except:
                 bpy.ops.mesh.primitive_cube_add()
                 obj = bpy.context.scene.objects.active
@@ -190,6 +211,13 @@ class IMPORT_ADT_SCENE(bpy.types.Operator):
             if self.group_objects:
                 obj.parent = parent
 
+        loaded_bytes = game_data.texture_stats['loaded_bytes'] - stats['loaded_bytes']
+        full_bytes = game_data.texture_stats['full_bytes'] - stats['full_bytes']
+
+        self.report({'INFO'}, "Loaded {} textures: {:.1f} MB, {:.1f} MB saved compared to full resolution".format(
+            game_data.texture_stats['images'] - stats['images'],
+            loaded_bytes / 1048576, (full_bytes - loaded_bytes) / 1048576))
+
         return {'FINISHED'}
 
     def invoke(self, context, event):
@@ -1051,6 +1079,44 @@ class OBJECT_OP_Invert_Portals(bpy.types.Operator):
             return {'CANCELLED'}
 
 
+class OBJECT_OP_Load_Full_Res_Textures(bpy.types.Operator):
+    bl_idname = 'scene.wow_load_full_res_textures'
+    bl_label = 'Load full resolution textures'
+    bl_description = 'Replace reduced resolution textures of selected objects with full resolution ones'
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+
+        game_data = getattr(bpy, "wow_game_data", None)
+
+        if not game_data or not game_data.files:
+            self.report({'ERROR'}, "Failed to load textures. Connect to game client first.")
+            return {'CANCELLED'}
+
+        images = set()
+
+        for ob in bpy.context.selected_objects:
+            if ob.type != 'MESH':
+                continue
+
+            for material in ob.data.materials:
+                if material:
+                    for slot in material.texture_slots:
+                        if slot and slot.texture and slot.texture.type == 'IMAGE' and slot.texture.image:
+                            images.add(slot.texture.image)
+
+            for uv_texture in ob.data.uv_textures:
+                for face in uv_texture.data:
+                    if face.image:
+                        images.add(face.image)
+
+        added_bytes = game_data.load_full_resolution(images)
+
+        self.report({'INFO'}, "Done loading full resolution textures: {:.1f} MB added".format(added_bytes / 1048576))
+
+        return {'FINISHED'}
+
+
 class OBJECT_OP_Fill_Textures(bpy.types.Operator):
     bl_idname = 'scene.wow_fill_textures'
     bl_label = 'Fill textures'
@@ -1084,14 +1150,10 @@ class OBJECT_OP_Fill_Textures(bpy.types.Operator):
                         rest_path = os.path.join(path[1], rest_path)
                         rest_path = rest_path[:-1] if rest_path.endswith("\\") else rest_path
 
-                        sys.stdout = open(os.devnull, 'w')
-
-                        if game_data.read_file(rest_path):
+                        if game_data.exists(rest_path):
                             mesh.materials[i].WowMaterial.Texture1 = rest_path
                             break
 
-                        sys.stdout = sys.__stdout__
-
             self.report({'INFO'}, "Done filling texture paths")
 
         return {'FINISHED'}
@@ -1030,6 +1030,7 @@ class WMOToolsPanelObjectMode(bpy.types.Panel):
             box_col = box.column(align=True)
             box_col.operator("scene.wow_quick_collision", text='Quick collision', icon='STYLUS_PRESSURE')
             box_col.operator("scene.wow_fill_textures", text='Fill texture paths', icon='FILE_IMAGE')
+            box_col.operator("scene.wow_load_full_res_textures", text='Full res. textures', icon='IMAGE_DATA')
             box_col.operator("scene.wow_set_portal_dir_alg", text='Set portal dir.', icon='FILE_REFRESH')
             box_col.operator("scene.wow_bake_portal_relations", text='Bake portal rels.', icon='LINKED')
             box.label(text="Doodads:")
@@ -1,6 +1,8 @@
 from .wmo_group import *
 from .wmo_format import *
 from ..m2 import import_m2 as m2
+from ..mpq.mpq_writer import MPQWriter
+from ..mpq.listfile import normalize_path
 from mathutils.kdtree import KDTree
 
 import bpy
@@ -12,6 +14,26 @@ import time
 class WMOFile:
     """ World of Warcraft WMO """
 
+    # chunks are parsed on first access, see LazyChunk
+    mver = LazyChunk('REVM', MVER_chunk)
+    mohd = LazyChunk('DHOM', MOHD_chunk)
+    motx = LazyChunk('XTOM', MOTX_chunk)
+    momt = LazyChunk('TMOM', MOMT_chunk)
+    mogn = LazyChunk('NGOM', MOGN_chunk)
+    mogi = LazyChunk('IGOM', MOGI_chunk)
+    mosb = LazyChunk('BSOM', MOSB_chunk)
+    mopv = LazyChunk('VPOM', MOPV_chunk)
+    mopt = LazyChunk('TPOM', MOPT_chunk)
+    mopr = LazyChunk('RPOM', MOPR_chunk)
+    movv = LazyChunk('VVOM', MOVV_chunk)
+    movb = LazyChunk('BVOM', MOVB_chunk)
+    molt = LazyChunk('TLOM', MOLT_chunk)
+    mods = LazyChunk('SDOM', MODS_chunk)
+    modn = LazyChunk('NDOM', MODN_chunk)
+    modd = LazyChunk('DDOM', MODD_chunk)
+    mfog = LazyChunk('GOFM', MFOG_chunk)
+    mcvp = LazyChunk('PVCM', MCVP_chunk)
+
     def __init__(self, filepath):
         self.filepath = filepath
         self.groups = []
@@ -20,84 +42,49 @@ class WMOFile:
         self.texture_lookup = {}
         self.display_name = os.path.basename(os.path.splitext(filepath)[0])
         self.parent = None
-
-        self.mver = MVER_chunk()
-        self.mohd = MOHD_chunk()
-        self.motx = MOTX_chunk()
-        self.momt = MOMT_chunk()
-        self.mogn = MOGN_chunk()
-        self.mogi = MOGI_chunk()
-        self.mosb = MOSB_chunk()
-        self.mopv = MOPV_chunk()
-        self.mopt = MOPT_chunk()
-        self.mopr = MOPR_chunk()
-        self.movv = MOVV_chunk()
-        self.movb = MOVB_chunk()
-        self.molt = MOLT_chunk()
-        self.mods = MODS_chunk()
-        self.modn = MODN_chunk()
-        self.modd = MODD_chunk()
-        self.mfog = MFOG_chunk()
-        self.mcvp = MCVP_chunk()
+        self.chunk_directory = None
 
     def read(self):
-        """ Read WMO data from files into memory """
+        """ Read WMO data from files into memory. Only chunk headers of the root and group files are scanned here,
+        chunks are parsed when they are first accessed. Call close() when done reading. """
 
         start_time = time.time()
 
         with open(self.filepath, "rb") as f:
+            self.chunk_directory = ChunkDirectory(f)
 
-            # check if file is a WMO root or a WMO group, or unknown
-            f.seek(12)
-            hdr = ChunkHeader()
-            hdr.read(f)
-            f.seek(0)
-
-            if hdr.Magic == "DHOM":
-                self.mver.read(f)
-                self.mohd.read(f)
-                self.motx.read(f)
-                self.momt.read(f)
-                self.mogn.read(f)
-                self.mogi.read(f)
-                self.mosb.read(f)
-                self.mopv.read(f)
-                self.mopt.read(f)
-                self.mopr.read(f)
-                self.movv.read(f)
-                self.movb.read(f)
-                self.molt.read(f)
-                self.mods.read(f)
-                self.modn.read(f)
-                self.modd.read(f)
-                self.mfog.read(f)
-
-                if f.tell() != os.fstat(f.fileno()).st_size:
-                    self.mcvp.read(f)
-
-                print("\nDone reading root file: <<" + os.path.basename(f.name) + ">>")
-                root_name = os.path.splitext(self.filepath)[0]
-
-
-                for i in range(self.mohd.nGroups):
-                    group_name = root_name + "_" + str(i).zfill(3) + ".wmo"
-
-                    if not os.path.isfile(group_name):
-                        raise FileNotFoundError("\nNot all referenced WMO groups are present in the directory.\a")
-
-                    group = WMOGroupFile(self)
-                    group.read(open(group_name, 'rb'))
-                    self.groups.append(group)
-
-            elif hdr.Magic == "PGOM":
-                raise NotImplementedError("\nImport of separate WMO group files is not supported. "
-                                          "Please import the root file.\a")
+        # check if file is a WMO root or a WMO group, or unknown
+        if self.chunk_directory.find('DHOM') is not None:
+            print("\nDone reading root file: <<" + os.path.basename(self.filepath) + ">>")
+            root_name = os.path.splitext(self.filepath)[0]
 
-            else:
-                raise Exception("\nFile is not a WMO file or corrupted.\a")
+            for i in range(self.mohd.nGroups):
+                group_name = root_name + "_" + str(i).zfill(3) + ".wmo"
+
+                if not os.path.isfile(group_name):
+                    raise FileNotFoundError("\nNot all referenced WMO groups are present in the directory.\a")
+
+                group = WMOGroupFile(self)
+                with open(group_name, 'rb') as f:
+                    group.read(f)
+                self.groups.append(group)
+
+        elif self.chunk_directory.find('PGOM') is not None:
+            raise NotImplementedError("\nImport of separate WMO group files is not supported. "
+                                      "Please import the root file.\a")
+
+        else:
+            raise Exception("\nFile is not a WMO file or corrupted.\a")
+
+        print("\nDone reading WMO. \nTotal reading time: ",
+              time.strftime("%M minutes %S seconds.", time.gmtime(time.time() - start_time)))
 
-            print("\nDone reading WMO. \nTotal reading time: ",
-                  time.strftime("%M minutes %S seconds.", time.gmtime(time.time() - start_time)))
+    def close(self):
+        """ Release the mapped root and group files. Chunks not accessed until now can not be parsed anymore. """
+
+        for wmo_file in [self] + self.groups:
+            if wmo_file.chunk_directory:
+                wmo_file.chunk_directory.close()
 
     def write(self):
         """ Write WMO data from memory into files """
@@ -107,34 +94,36 @@ class WMOFile:
         with open(self.filepath, 'wb') as f:
             print("\n\n=== Writing root file ===")
 
-            self.mver.write(f)
-            self.mohd.write(f)
-            self.motx.write(f)
-            self.momt.write(f)
-            self.mogn.write(f)
-            self.mogi.write(f)
-            self.mosb.write(f)
-            self.mopv.write(f)
-            self.mopt.write(f)
-            self.mopr.write(f)
-            self.movv.write(f)
-            self.movb.write(f)
-            self.molt.write(f)
-            self.mods.write(f)
-            self.modn.write(f)
-            self.modd.write(f)
-            self.mfog.write(f)
+            write_chunks(f, [self.mver, self.mohd, self.motx, self.momt, self.mogn, self.mogi, self.mosb,
+                             self.mopv, self.mopt, self.mopr, self.movv, self.movb, self.molt, self.mods,
+                             self.modn, self.modd, self.mfog])
 
             print("\nDone writing root file: <<" + os.path.basename(f.name) + ">>")
 
         print("\n\n=== Writing group files ===")
         for index, group in enumerate(self.groups):
-            with open(os.path.splitext(self.filepath)[0] + "_" + str(index).zfill(3) + ".wmo", 'wb') as f:
+            with open(self.get_group_filepath(index), 'wb') as f:
                 group.write(f)
 
         print("\nDone writing WMO. \nTotal writing time: ",
               time.strftime("%M minutes %S seconds.\a", time.gmtime(time.time() - start_time)))
 
+    def get_group_filepath(self, index):
+        """ Get path of a group file written next to the root file """
+        return os.path.splitext(self.filepath)[0] + "_" + str(index).zfill(3) + ".wmo"
+
+    def write_mpq(self, mpq_path, archive_dir):
+        """ Package written root and group files into a patch MPQ archive """
+
+        start_time = time.time()
+
+        filepaths = [self.filepath] + [self.get_group_filepath(index) for index in range(len(self.groups))]
+        with MPQWriter(mpq_path) as writer:
+            writer.add_files_from_disk(filepaths, archive_dir)
+
+        print("\nDone packing WMO into <<" + os.path.basename(mpq_path) + ">>. \nTotal packing time: ",
+              time.strftime("%M minutes %S seconds.", time.gmtime(time.time() - start_time)))
+
     def compare_materials(self, material):
         """ Compare two WoW material properties """
 
@@ -185,8 +174,6 @@ class WMOFile:
                                         int(mat.WowMaterial.EmissiveColor[2] * 255),
                                         int(mat.WowMaterial.EmissiveColor[3] * 255))
 
-                WowMat.TextureFlags1 = 0
-
                 if mat.WowMaterial.Texture2 in self.texture_lookup:
                     WowMat.Texture2Ofs = self.texture_lookup[mat.WowMaterial.Texture2]
                 else:
@@ -220,8 +207,10 @@ class WMOFile:
 
         return group_info.NameOfs, desc_ofs
 
-    def load_materials(self):
-        """ Load materials from WoW WMO root file """
+    def load_materials(self, textures=None):
+        """ Load materials from WoW WMO root file.
+        Images are taken from the given dictionary of Blender images keyed by normalized texture path if provided,
+        otherwise loaded from PNG files extracted next to the WMO """
         self.material_lookup = {}
         texture_path = os.path.dirname(self.filepath) + "\\"
 
@@ -289,7 +278,10 @@ class WMOFile:
 
                     # if image is not loaded, do it
                     if not img1_loaded:
-                        tex1_img = bpy.data.images.load(texture_path + tex1_img_filename)
+                        if textures is not None:
+                            tex1_img = textures[normalize_path(mat.WowMaterial.Texture1)]
+                        else:
+                            tex1_img = bpy.data.images.load(texture_path + tex1_img_filename)
                         tex1.image = tex1_img
                         images.append(tex1_img)
                         image_names.append(tex1_img_filename)
@@ -321,7 +313,10 @@ class WMOFile:
 
                     # if image is not loaded, do it
                     if not img2_loaded:
-                        tex2_img = bpy.data.images.load(texture_path + tex2_img_filename)
+                        if textures is not None:
+                            tex2_img = textures[normalize_path(mat.WowMaterial.Texture2)]
+                        else:
+                            tex2_img = bpy.data.images.load(texture_path + tex2_img_filename)
                         tex2.image = tex2_img
                         images.append(tex2_img)
                         image_names.append(tex2_img_filename)
@@ -437,7 +432,7 @@ class WMOFile:
             if self.parent:
                 fog.parent = self.parent
 
-    def load_doodads(self, dir=None, game_data=None):
+    def load_doodads(self, dir=None, game_data=None, max_texture_size=0):
         """ Load doodad sets to scene. Two modes are supported: data storing and actual import."""
         scene = bpy.context.scene
         if game_data and dir:
@@ -466,7 +461,7 @@ class WMOFile:
 
                     if not obj:
                         try:
-                            obj = m2.m2_to_blender_mesh(dir, doodad_path, game_data)
+                            obj = m2.m2_to_blender_mesh(dir, doodad_path, game_data, max_texture_size)
                         except:
                             bpy.ops.mesh.primitive_cube_add()
                             obj = bpy.context.scene.objects.active
@@ -906,7 +901,7 @@ class WMOFile:
             fog.EndDist2 = fog_obj.WowFog.EndDist2
             fog.Position = fog_obj.location
             fog.StartFactor = fog_obj.WowFog.StartFactor
-            fog.StarFactor2 = fog_obj.WowFog.StartFactor2
+            fog.StartFactor2 = fog_obj.WowFog.StartFactor2
 
             if fog_obj.WowFog.IgnoreRadius:
                 fog.Flags |= 0x01
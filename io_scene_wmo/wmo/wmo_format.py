@@ -1,5 +1,15 @@
 import bpy
+import io
+import mmap
+import operator
 import struct
+from array import array
+from itertools import chain
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 ###########################
@@ -15,9 +25,360 @@ class ChunkHeader:
         self.Magic = f.read(4)[0:4].decode('ascii')
         self.Size = struct.unpack("I", f.read(4))[0]
 
-    def write(self, f):
-        f.write(self.Magic[:4].encode('ascii'))
-        f.write(struct.pack('I', self.Size))
+    def pack_into(self, buffer, offset):
+        CHUNK_HEADER.pack_into(buffer, offset, self.Magic[:4].encode('ascii'), self.Size)
+        return offset + 8
+
+
+class ChunkDirectory:
+    """ Offsets and sizes of the chunks of a memory-mapped WMO file, found by scanning only their 8-byte headers.
+    Chunks listed in 'nested' are scanned for sub-chunks too, after the given size of their own fields. """
+
+    def __init__(self, f, nested=None):
+        try:
+            self.data = self.file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError, io.UnsupportedOperation):
+            # empty files can not be mapped, in-memory streams have no descriptor
+            f.seek(0)
+            self.data = f.read()
+            self.file = io.BytesIO(self.data)
+
+        self.nested = nested or {}
+        self.chunks = {}
+        self.scan(0, len(self.data))
+
+    def scan(self, start, end):
+        data = self.data
+        offset = start
+
+        while offset + 8 <= end:
+            magic = data[offset:offset + 4].decode('ascii', 'replace')
+            size = struct.unpack_from('I', data, offset + 4)[0]
+            self.chunks.setdefault(magic, []).append((offset, size))
+
+            if magic in self.nested:
+                self.scan(offset + 8 + self.nested[magic], min(offset + 8 + size, end))
+
+            offset += 8 + size
+
+    def find(self, magic, index=0):
+        """ Get the offset of the given occurence of a chunk, or None if the file does not have it """
+        chunks = self.chunks.get(magic, ())
+        return chunks[index][0] if index < len(chunks) else None
+
+    def read_chunk(self, chunk, offset):
+        if self.file.closed:
+            raise ValueError("Can not read {} chunk, the WMO file was already closed".format(type(chunk).__name__[:4]))
+        self.file.seek(offset)
+        chunk.read(self.file)
+
+    def close(self):
+        self.file.close()
+
+
+class LazyChunk:
+    """ Chunk attribute of a file class. The chunk is parsed from the chunk directory of the file on first
+    access, or created empty if the file was not read or does not contain it. 'prepare' names a method of the
+    file called with the chunk before it is parsed. """
+
+    def __init__(self, magic, chunk_type, index=0, prepare=None):
+        self.magic = magic
+        self.chunk_type = chunk_type
+        self.index = index
+        self.prepare = prepare
+        self.name = None
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        if self.name is None:
+            self.name = next(name for name, value in vars(owner).items() if value is self)
+
+        chunk = self.chunk_type()
+        directory = getattr(instance, 'chunk_directory', None)
+        offset = directory.find(self.magic, self.index) if directory else None
+
+        if offset is not None:
+            if self.prepare:
+                getattr(instance, self.prepare)(chunk)
+            directory.read_chunk(chunk, offset)
+
+        # parsed chunk is stored in the instance and takes precedence over the descriptor from now on
+        instance.__dict__[self.name] = chunk
+        return chunk
+
+
+def read_chunk_data(f, header, element_size):
+    """ Read the data of a chunk at once, trimmed to a whole number of elements """
+    data = f.read(header.Size)
+    return data[:len(data) - len(data) % element_size]
+
+# element types of array-backed chunk containers
+VECTOR2_ELEMENT = ('<f4', (2,))
+VECTOR3_ELEMENT = ('<f4', (3,))
+COLOR_ELEMENT = ('u1', (4,))
+INDEX_ELEMENT = '<u2'
+TRIANGLE_MATERIAL_ELEMENT = [('Flags', 'u1'), ('MaterialID', 'u1')]
+
+# record layouts of written chunks
+CHUNK_HEADER = struct.Struct('<4sI')
+UINT32 = struct.Struct('<I')
+FLOAT = struct.Struct('<f')
+MOHD_STRUCT = struct.Struct('<7I4BI6fI')
+MOGP_STRUCT = struct.Struct('<3I6f6H4B4I')
+MLIQ_STRUCT = struct.Struct('<4I3fH')
+WATER_VERTEX_STRUCT = struct.Struct('<4Bf')
+MAGMA_VERTEX_STRUCT = struct.Struct('<2hf')
+
+
+class ElementArray:
+    """ Growable container of fixed size chunk elements stored in a single NumPy array.
+    Behaves like the list chunks used to hold: elements read as tuples for vector types, numbers for
+    scalar types and records with attribute access for structured types. 'array' gives the used
+    part of the storage for whole-array processing. """
+
+    __slots__ = ('data', 'count')
+
+    def __init__(self, dtype, count=0, fill=0):
+        dtype = numpy.dtype(dtype)
+        self.data = numpy.empty((count,) + dtype.shape, dtype=dtype.base)
+        if dtype.names:
+            self.data = self.data.view(numpy.recarray)
+        if count:
+            self.data[:] = fill
+        self.count = count
+
+    @classmethod
+    def frombuffer(cls, dtype, data):
+        """ Make a container holding a copy of elements stored in a buffer """
+        elements = cls(dtype)
+        dtype = numpy.dtype(dtype)
+        count = len(data) // dtype.itemsize
+        array = numpy.frombuffer(data, dtype=dtype.base, count=count * (dtype.itemsize // dtype.base.itemsize))
+        elements.data = array.reshape((count,) + dtype.shape).copy().view(type(elements.data))
+        elements.count = count
+        return elements
+
+    @property
+    def array(self):
+        return self.data[:self.count]
+
+    def reserve(self, capacity):
+        if capacity > len(self.data):
+            data = numpy.empty((max(capacity, len(self.data) * 2),) + self.data.shape[1:], dtype=self.data.dtype)
+            data[:self.count] = self.data[:self.count]
+            self.data = data.view(type(self.data))
+
+    def convert(self, value):
+        """ Convert a value to a form assignable to an element, taking fields of objects for structured types """
+        names = self.data.dtype.names
+        if names and not isinstance(value, (tuple, numpy.void)):
+            return tuple(getattr(value, name) for name in names)
+        return value
+
+    def append(self, value):
+        self.reserve(self.count + 1)
+        self.data[self.count] = self.convert(value)
+        self.count += 1
+
+    def extend(self, values):
+        if self.data.dtype.names:
+            values = [self.convert(value) for value in values]
+        values = numpy.asarray(values, dtype=self.data.dtype)
+        self.reserve(self.count + len(values))
+        self.data[self.count:self.count + len(values)] = values
+        self.count += len(values)
+
+    def to_elements(self, array):
+        if self.data.dtype.names:
+            return list(array)
+        if array.ndim > 1:
+            return list(map(tuple, array.tolist()))
+        return array.tolist()
+
+    def tolist(self):
+        """ Get elements as a list of Python tuples, numbers or records """
+        return self.to_elements(self.array)
+
+    def tobytes(self):
+        return self.array.tobytes()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.to_elements(self.array[index])
+        if not -self.count <= index < self.count:
+            raise IndexError("element index out of range")
+
+        element = self.array[index]
+        if self.data.dtype.names:
+            return element
+        return tuple(element.tolist()) if self.data.ndim > 1 else element.item()
+
+    def __setitem__(self, index, value):
+        if not isinstance(index, slice) and not -self.count <= index < self.count:
+            raise IndexError("element index out of range")
+        self.array[index] = self.convert(value)
+
+    def __repr__(self):
+        return "ElementArray({})".format(self.tolist())
+
+
+def read_elements(f, header, dtype, format):
+    """ Read all elements of a chunk into an ElementArray, or into a list of tuples or numbers without NumPy """
+    data = read_chunk_data(f, header, struct.calcsize(format))
+
+    if numpy is not None:
+        return ElementArray.frombuffer(dtype, data)
+    if len(format) == 1:
+        return array(format, data).tolist()
+    return list(struct.iter_unpack(format, data))
+
+
+def new_elements(dtype, count=0, fill=0):
+    """ Make a chunk element container: an ElementArray if NumPy is available, a plain list otherwise """
+    if numpy is None:
+        return count * [fill]
+    return ElementArray(dtype, count, fill)
+
+
+def gather_elements(elements, indices):
+    """ Get the chunk elements at the given indices, as one array for an ElementArray or a list otherwise """
+    if isinstance(elements, ElementArray):
+        return elements.array[indices.array if isinstance(indices, ElementArray) else indices]
+    return [elements[i] for i in indices]
+
+
+def flatten_elements(elements, dtype):
+    """ Get chunk elements or an array gathered from them as one flat sequence, e.g. for foreach_set().
+    Arrays are converted to a contiguous array of the given NumPy type """
+    if isinstance(elements, ElementArray):
+        elements = elements.array
+    if numpy is not None and isinstance(elements, numpy.ndarray):
+        return numpy.ascontiguousarray(elements.reshape(-1), dtype=dtype)
+    if elements and isinstance(elements[0], tuple):
+        return list(chain.from_iterable(elements))
+    return list(elements)
+
+
+def pack_bytes(buffer, offset, data):
+    buffer[offset:offset + len(data)] = data
+    return offset + len(data)
+
+
+def pack_records(buffer, offset, records):
+    for record in records:
+        offset = record.pack_into(buffer, offset)
+    return offset
+
+
+def pack_elements(buffer, offset, elements, format):
+    """ Pack chunk elements into a buffer, as raw bytes for an ElementArray or with one struct call for a list """
+    if isinstance(elements, ElementArray):
+        return pack_bytes(buffer, offset, elements.tobytes())
+
+    if len(format) > 1:
+        elements = list(chain.from_iterable(elements))
+    element_format = '<{}{}'.format(len(elements), format[0])
+    struct.pack_into(element_format, buffer, offset, *elements)
+    return offset + struct.calcsize(element_format)
+
+
+def pack_chunks(chunks):
+    """ Serialize chunks into a single buffer allocated from their sizes up front """
+    buffer = bytearray(sum(8 + chunk.get_size() for chunk in chunks))
+
+    offset = 0
+    for chunk in chunks:
+        offset = chunk.pack_into(buffer, offset)
+
+    if offset != len(buffer):
+        raise Exception("Chunk data size mismatch: packed {} bytes out of {}".format(offset, len(buffer)))
+    return buffer
+
+
+def write_chunks(f, chunks):
+    """ Write chunks to a file in one sequential write """
+    f.write(pack_chunks(chunks))
+
+
+class RecordType(type):
+    """ Metaclass deriving the slots, the struct layout and the value positions of a record class from its fields """
+
+    def __new__(mcs, name, bases, namespace):
+        fields = namespace.get('fields', ())
+        namespace['__slots__'] = tuple(namespace.get('__slots__', ())) + tuple(field[0] for field in fields)
+        cls = type.__new__(mcs, name, bases, namespace)
+
+        if fields:
+            cls.layout = struct.Struct('<' + ''.join(format for _, format, _ in fields))
+            cls.get_fields = operator.attrgetter(*(field[0] for field in fields))
+
+            # position of every field in the unpacked values, a slice for fields with a repeat count
+            cls.keys = []
+            index = 0
+            for field_name, format, _ in fields:
+                count = int(format[:-1]) if format[:-1] and format[-1] != 's' else 0
+                cls.keys.append((field_name, slice(index, index + count) if count else index))
+                index += count or 1
+
+            cls.repeated = tuple(isinstance(key, slice) for _, key in cls.keys)
+
+        return cls
+
+
+class Record(metaclass=RecordType):
+    """ Fixed size chunk record. Subclasses declare 'fields' as (name, struct format, default) in file order,
+    which gives both the attributes of the record and its layout for reading and writing.
+    Fields with a repeat count, such as '3f', hold a tuple. """
+
+    fields = ()
+
+    def __init__(self, *values):
+        for (name, _, _), value in zip(self.fields, values):
+            setattr(self, name, value)
+        for name, _, default in self.fields[len(values):]:
+            setattr(self, name, default)
+
+    @classmethod
+    def from_values(cls, values):
+        record = cls.__new__(cls)
+        record.set_values(values)
+        return record
+
+    def set_values(self, values):
+        """ Set the fields from a tuple of unpacked struct values """
+        for name, key in self.keys:
+            setattr(self, name, values[key])
+
+    def get_values(self):
+        """ Get the fields as a flat list of struct values """
+        values = []
+        for value, repeated in zip(self.get_fields(self), self.repeated):
+            if repeated:
+                values.extend(value)
+            else:
+                values.append(value)
+        return values
+
+    def read(self, f):
+        self.set_values(self.layout.unpack(f.read(self.layout.size)))
+
+    def pack_into(self, buffer, offset):
+        self.layout.pack_into(buffer, offset, *self.get_values())
+        return offset + self.layout.size
+
+
+def read_records(f, header, record_type):
+    """ Read all records of a chunk with a single unpacking pass over its data """
+    data = read_chunk_data(f, header, record_type.layout.size)
+    return [record_type.from_values(values) for values in record_type.layout.iter_unpack(data)]
 
 # contain version of file
 class MVER_chunk:
@@ -30,11 +391,18 @@ class MVER_chunk:
         self.Header.read(f)
         self.Version = struct.unpack("I", f.read(4))[0]
 
-    def write(self, f):
+    def get_size(self):
+        return 4
+
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'REVM'
-        self.Header.Size = 4
-        self.Header.write(f)
-        f.write(struct.pack('I', self.Version))
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        UINT32.pack_into(buffer, offset, self.Version)
+        return offset + UINT32.size
+
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # WMO Root header
 class MOHD_chunk:
@@ -70,23 +438,20 @@ class MOHD_chunk:
         self.BoundingBoxCorner2 = struct.unpack("fff", f.read(12))
         self.Flags = struct.unpack("I", f.read(4))[0]
 
-    def write(self, f):
+    def get_size(self):
+        return MOHD_STRUCT.size
+
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'DHOM'
-        self.Header.Size = 64
-
-        self.Header.write(f)
-        f.write(struct.pack('I', self.nMaterials))
-        f.write(struct.pack('I', self.nGroups))
-        f.write(struct.pack('I', self.nPortals))
-        f.write(struct.pack('I', self.nLights))
-        f.write(struct.pack('I', self.nModels))
-        f.write(struct.pack('I', self.nDoodads))
-        f.write(struct.pack('I', self.nSets))
-        f.write(struct.pack('BBBB', *self.AmbientColor))
-        f.write(struct.pack('I', self.ID))
-        f.write(struct.pack('fff', *self.BoundingBoxCorner1))
-        f.write(struct.pack('fff', *self.BoundingBoxCorner2))
-        f.write(struct.pack('I', self.Flags))
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        MOHD_STRUCT.pack_into(buffer, offset, self.nMaterials, self.nGroups, self.nPortals, self.nLights,
+                              self.nModels, self.nDoodads, self.nSets, *self.AmbientColor, self.ID,
+                              *self.BoundingBoxCorner1, *self.BoundingBoxCorner2, self.Flags)
+        return offset + MOHD_STRUCT.size
+
+    def write(self, f):
+        write_chunks(f, (self,))
 
 
 # Texture names
@@ -100,12 +465,17 @@ class MOTX_chunk:
         self.Header.read(f)
         self.StringTable = f.read(self.Header.Size)
 
-    def write(self, f):
+    def get_size(self):
+        return len(self.StringTable)
+
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'XTOM'
-        self.Header.Size = len(self.StringTable)
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_bytes(buffer, offset, self.StringTable)
 
-        self.Header.write(f)
-        f.write(self.StringTable)
+    def write(self, f):
+        write_chunks(f, (self,))
 
     def add_string(self, s):
         padding = len(self.StringTable) % 4
@@ -141,51 +511,22 @@ class MOTX_chunk:
         return strings
 
 
-class WMO_Material:
-    def __init__(self):
-        self.Flags = 0
-        self.Shader = 0
-        self.BlendMode = 0
-        self.Texture1Ofs = 0
-        self.EmissiveColor = (0, 0, 0, 0)
-        self.SidnEmissiveColor = (0, 0, 0, 0)
-        self.Texture2Ofs = 0
-        self.DiffColor = (0, 0, 0, 0)
-        self.TerrainType = 0
-        self.Texture3Ofs = 0
-        self.Color3 = (0, 0, 0, 0)
-        self.Tex3Flags = 0
-        self.RunTimeData = (0, 0, 0, 0)
-
-    def read(self, f):
-        self.Flags = struct.unpack("I", f.read(4))[0]
-        self.Shader = struct.unpack("I", f.read(4))[0]
-        self.BlendMode = struct.unpack("I", f.read(4))[0]
-        self.Texture1Ofs = struct.unpack("I", f.read(4))[0]
-        self.EmissiveColor = struct.unpack("BBBB", f.read(4))
-        self.SidnEmissiveColor = struct.unpack("BBBB", f.read(4))
-        self.Texture2Ofs = struct.unpack("I", f.read(4))[0]
-        self.DiffColor = struct.unpack("BBBB", f.read(4))
-        self.TerrainType = struct.unpack("I", f.read(4))[0]
-        self.Texture3Ofs = struct.unpack("I", f.read(4))[0]
-        self.Color3 = struct.unpack("BBBB", f.read(4))
-        self.Tex3Flags = struct.unpack("I", f.read(4))[0]
-        self.RunTimeData = struct.unpack("IIII", f.read(16))[0]
-
-    def write(self, f):
-        f.write(struct.pack('I', self.Flags))
-        f.write(struct.pack('I', self.Shader))
-        f.write(struct.pack('I', self.BlendMode))
-        f.write(struct.pack('I', self.Texture1Ofs))
-        f.write(struct.pack('BBBB', *self.EmissiveColor))
-        f.write(struct.pack('BBBB', *self.SidnEmissiveColor))
-        f.write(struct.pack('I', self.Texture2Ofs))
-        f.write(struct.pack('BBBB', *self.DiffColor))
-        f.write(struct.pack('I', self.TerrainType))
-        f.write(struct.pack('I', self.Texture3Ofs))
-        f.write(struct.pack('BBBB', *self.Color3))
-        f.write(struct.pack('I', self.Tex3Flags))
-        f.write(struct.pack('IIII', *self.RunTimeData))
+class WMO_Material(Record):
+    fields = (
+        ('Flags', 'I', 0),
+        ('Shader', 'I', 0),
+        ('BlendMode', 'I', 0),
+        ('Texture1Ofs', 'I', 0),
+        ('EmissiveColor', '4B', (0, 0, 0, 0)),
+        ('SidnEmissiveColor', '4B', (0, 0, 0, 0)),
+        ('Texture2Ofs', 'I', 0),
+        ('DiffColor', '4B', (0, 0, 0, 0)),
+        ('TerrainType', 'I', 0),
+        ('Texture3Ofs', 'I', 0),
+        ('Color3', '4B', (0, 0, 0, 0)),
+        ('Tex3Flags', 'I', 0),
+        ('RunTimeData', '4I', (0, 0, 0, 0)),
+    )
 
 # Materials
 class MOMT_chunk:
@@ -197,19 +538,19 @@ class MOMT_chunk:
         # read header
         self.Header.read(f)
 
-        self.Materials = []
-        for i in range(self.Header.Size // 64):
-            mat = WMO_Material()
-            mat.read(f)
-            self.Materials.append(mat)
+        self.Materials = read_records(f, self.Header, WMO_Material)
 
-    def write(self, f):
+    def get_size(self):
+        return len(self.Materials) * WMO_Material.layout.size
+
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'TMOM'
-        self.Header.Size = len(self.Materials) * 64
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_records(buffer, offset, self.Materials)
 
-        self.Header.write(f)
-        for mat in self.Materials:
-            mat.write(f)
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # group names
 class MOGN_chunk:
@@ -222,19 +563,19 @@ class MOGN_chunk:
         self.Header.read(f)
         self.StringTable = f.read(self.Header.Size)
 
-    def write(self, f):
-        self.Header.Magic = 'NGOM'
+    def get_size(self):
+        return len(self.StringTable) + (-len(self.StringTable) % 4)
 
-        # padd 4 bytes after
-        padding = len(self.StringTable) % 4
-        if(padding > 0):
-            for iPad in range(4 - padding):
-                self.StringTable.append(0)
-
-        self.Header.Size = len(self.StringTable)
+    def pack_into(self, buffer, offset):
+        self.Header.Magic = 'NGOM'
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        # padded to 4 bytes, buffer is zero-filled
+        pack_bytes(buffer, offset, self.StringTable)
+        return offset + self.Header.Size
 
-        self.Header.write(f)
-        f.write(self.StringTable)
+    def write(self, f):
+        write_chunks(f, (self,))
 
     def add_string(self, s):
         ofs = len(self.StringTable)
@@ -251,24 +592,13 @@ class MOGN_chunk:
             i += 1
         return self.StringTable[start:i].decode('ascii')
 
-class GroupInfo:
-    def __init__(self):
-        self.Flags = 0
-        self.BoundingBoxCorner1 = (0, 0, 0)
-        self.BoundingBoxCorner2 = (0, 0, 0)
-        self.NameOfs = 0
-
-    def read(self, f):
-        self.Flags = struct.unpack("I", f.read(4))[0]
-        self.BoundingBoxCorner1 = struct.unpack("fff", f.read(12))
-        self.BoundingBoxCorner2 = struct.unpack("fff", f.read(12))
-        self.NameOfs = struct.unpack("I", f.read(4))[0]
-
-    def write(self, f):
-        f.write(struct.pack('I', self.Flags))
-        f.write(struct.pack('fff', *self.BoundingBoxCorner1))
-        f.write(struct.pack('fff', *self.BoundingBoxCorner2))
-        f.write(struct.pack('I', self.NameOfs))
+class GroupInfo(Record):
+    fields = (
+        ('Flags', 'I', 0),
+        ('BoundingBoxCorner1', '3f', (0, 0, 0)),
+        ('BoundingBoxCorner2', '3f', (0, 0, 0)),
+        ('NameOfs', 'I', 0),
+    )
 
 
 # group informations
@@ -281,21 +611,19 @@ class MOGI_chunk:
         # read header
         self.Header.read(f)
 
-        count = self.Header.Size // 32
+        self.Infos = read_records(f, self.Header, GroupInfo)
 
-        self.Infos = []
-        for i in range(count):
-            info = GroupInfo()
-            info.read(f)
-            self.Infos.append(info)
+    def get_size(self):
+        return len(self.Infos) * GroupInfo.layout.size
 
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'IGOM'
-        self.Header.Size = len(self.Infos) * 32
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_records(buffer, offset, self.Infos)
 
-        self.Header.write(f)
-        for info in self.Infos:
-            info.write(f)
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # skybox
 class MOSB_chunk:
@@ -306,18 +634,20 @@ class MOSB_chunk:
     def read(self, f):
         # read header
         self.Header.read(f)
-        self.Skybox = f.read(self.Header.Size).decode('ascii')
-
-    def write(self, f):
-        self.Header.Magic = 'BSOM'
+        # the terminator and padding are added back on write
+        self.Skybox = f.read(self.Header.Size).decode('ascii').rstrip('\x00')
 
-        if not self.Skybox:
-            self.Skybox = '\x00\x00\x00'
+    def get_size(self):
+        return len(self.Skybox or '\x00\x00\x00') + 1
 
-        self.Header.Size = len(self.Skybox) + 1
+    def pack_into(self, buffer, offset):
+        self.Header.Magic = 'BSOM'
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_bytes(buffer, offset, (self.Skybox or '\x00\x00\x00').encode('ascii') + b'\x00')
 
-        self.Header.write(f)
-        f.write(self.Skybox.encode('ascii') + b'\x00')
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # portal vertices
 class MOPV_chunk:
@@ -343,32 +673,25 @@ class MOPV_chunk:
                 #print(self.mopt.Infos[i].nVertices)
             #self.Portals.append(self.PortalVertices)
 
-    def write(self, f):
-        self.Header.Magic = 'VPOM'
-        self.Header.Size = len(self.PortalVertices) * 12
+    def get_size(self):
+        return len(self.PortalVertices) * 12
 
-        self.Header.write(f)
-        for v in self.PortalVertices:
-            f.write(struct.pack('fff', *v))
-
-class PortalInfo:
-    def __init__(self):
-        self.StartVertex = 0
-        self.nVertices = 0
-        self.Normal = (0, 0, 0)
-        self.Unknown = 0
-
-    def read(self, f):
-        self.StartVertex = struct.unpack("H", f.read(2))[0]
-        self.nVertices = struct.unpack("H", f.read(2))[0]
-        self.Normal = struct.unpack("fff", f.read(12))
-        self.Unknown = struct.unpack("f", f.read(4))[0]
+    def pack_into(self, buffer, offset):
+        self.Header.Magic = 'VPOM'
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_elements(buffer, offset, self.PortalVertices, 'fff')
 
     def write(self, f):
-        f.write(struct.pack('H', self.StartVertex))
-        f.write(struct.pack('H', self.nVertices))
-        f.write(struct.pack('fff', *self.Normal))
-        f.write(struct.pack('f', self.Unknown))
+        write_chunks(f, (self,))
+
+class PortalInfo(Record):
+    fields = (
+        ('StartVertex', 'H', 0),
+        ('nVertices', 'H', 0),
+        ('Normal', '3f', (0, 0, 0)),
+        ('Unknown', 'f', 0),
+    )
 
 
 # portal infos
@@ -381,40 +704,27 @@ class MOPT_chunk:
         # read header
         self.Header.read(f)
 
-        self.Infos = []
+        self.Infos = read_records(f, self.Header, PortalInfo)
 
-        # 20 = sizeof(PortalInfo)
-        for i in range(self.Header.Size // 20):
-            info = PortalInfo()
-            info.read(f)
-            self.Infos.append(info)
+    def get_size(self):
+        return len(self.Infos) * PortalInfo.layout.size
 
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'TPOM'
-        self.Header.Size = len(self.Infos) * 20
-
-        self.Header.write(f)
-        for info in self.Infos:
-            info.write(f)
-
-class PortalRelationship:
-    def __init__(self):
-        self.PortalIndex = 0
-        self.GroupIndex = 0
-        self.Side = 0
-        self.Padding = 0
-
-    def read(self, f):
-        self.PortalIndex = struct.unpack("H", f.read(2))[0]
-        self.GroupIndex = struct.unpack("H", f.read(2))[0]
-        self.Side = struct.unpack("h", f.read(2))[0]
-        self.Padding = struct.unpack("H", f.read(2))[0]
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_records(buffer, offset, self.Infos)
 
     def write(self, f):
-        f.write(struct.pack('H', self.PortalIndex))
-        f.write(struct.pack('H', self.GroupIndex))
-        f.write(struct.pack('h', self.Side))
-        f.write(struct.pack('H', self.Padding))
+        write_chunks(f, (self,))
+
+class PortalRelationship(Record):
+    fields = (
+        ('PortalIndex', 'H', 0),
+        ('GroupIndex', 'H', 0),
+        ('Side', 'h', 0),
+        ('Padding', 'H', 0),
+    )
 
 # portal link 2 groups
 class MOPR_chunk:
@@ -426,21 +736,19 @@ class MOPR_chunk:
         # read header
         self.Header.read(f)
 
-        self.Relationships = []
+        self.Relationships = read_records(f, self.Header, PortalRelationship)
 
-        for i in range(self.Header.Size // 8):
-            relationship = PortalRelationship()
-            relationship.read(f)
-            self.Relationships.append(relationship)
+    def get_size(self):
+        return len(self.Relationships) * PortalRelationship.layout.size
 
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'RPOM'
-        self.Header.Size = len(self.Relationships) * 8
-
-        self.Header.write(f)
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_records(buffer, offset, self.Relationships)
 
-        for rel in self.Relationships:
-            rel.write(f)
+    def write(self, f):
+        write_chunks(f, (self,))
 
 
 # visible vertices
@@ -458,27 +766,23 @@ class MOVV_chunk:
         for i in range(self.Header.Size // 12):
             self.VisibleVertices.append(struct.unpack("fff", f.read(12)))
 
-    def write(self, f):
-        self.Header.Magic = 'VVOM'
-        self.Header.Size = len(self.VisibleVertices) * 12
-
-        self.Header.write(f)
-
-        for v in self.VisibleVertices:
-            f.write(struct.pack('fff', *v))
-
-class VisibleBatch:
-    def __init__(self):
-        self.StartVertex = 0
-        self.nVertices = 0
+    def get_size(self):
+        return len(self.VisibleVertices) * 12
 
-    def read(self, f):
-        self.StartVertex = struct.unpack("H", f.read(2))[0]
-        self.nVertices = struct.unpack("H", f.read(2))[0]
+    def pack_into(self, buffer, offset):
+        self.Header.Magic = 'VVOM'
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_elements(buffer, offset, self.VisibleVertices, 'fff')
 
     def write(self, f):
-        f.write(struct.pack('H', self.StartVertex))
-        f.write(struct.pack('H', self.nVertices))
+        write_chunks(f, (self,))
+
+class VisibleBatch(Record):
+    fields = (
+        ('StartVertex', 'H', 0),
+        ('nVertices', 'H', 0),
+    )
 
 # visible batches
 class MOVB_chunk:
@@ -490,68 +794,36 @@ class MOVB_chunk:
         # read header
         self.Header.read(f)
 
-        count = self.Header.Size // 4
-
-        self.Batches = []
+        self.Batches = read_records(f, self.Header, VisibleBatch)
 
-        for i in range(count):
-            batch = VisibleBatch()
-            batch.read(f)
-            self.Batches.append(batch)
+    def get_size(self):
+        return len(self.Batches) * VisibleBatch.layout.size
 
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'BVOM'
-        self.Header.Size = len(self.Batches) * 4
-
-        self.Header.write(f)
-        for batch in self.Batches:
-            batch.write(f)
-
-class Light:
-    def __init__(self):
-        self.LightType = 0
-        self.Type = 1
-        self.UseAttenuation = 1
-        self.Padding = 1
-        self.Color = (0, 0, 0, 0)
-        self.Position = (0, 0, 0)
-        self.Intensity = 0
-        self.AttenuationStart = 0
-        self.AttenuationEnd = 0
-        self.Unknown1 = 0
-        self.Unknown2 = 0
-        self.Unknown3 = 0
-        self.Unknown4 = 0
-
-    def read(self, f):
-        self.LightType = struct.unpack("B", f.read(1))[0]
-        self.Type = struct.unpack("B", f.read(1))[0]
-        self.UseAttenuation = struct.unpack("B", f.read(1))[0]
-        self.Padding = struct.unpack("B", f.read(1))[0]
-        self.Color = struct.unpack("BBBB", f.read(4))
-        self.Position = struct.unpack("fff", f.read(12))
-        self.Intensity = struct.unpack("f", f.read(4))[0]
-        self.AttenuationStart = struct.unpack("f", f.read(4))[0]
-        self.AttenuationEnd = struct.unpack("f", f.read(4))[0]
-        self.Unknown1 = struct.unpack("f", f.read(4))[0]
-        self.Unknown2 = struct.unpack("f", f.read(4))[0]
-        self.Unknown3 = struct.unpack("f", f.read(4))[0]
-        self.Unknown4 = struct.unpack("f", f.read(4))[0]
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_records(buffer, offset, self.Batches)
 
     def write(self, f):
-        f.write(struct.pack('B', self.LightType))
-        f.write(struct.pack('B', self.Type))
-        f.write(struct.pack('B', self.UseAttenuation))
-        f.write(struct.pack('B', self.Padding))
-        f.write(struct.pack('BBBB', *self.Color))
-        f.write(struct.pack('fff', *self.Position))
-        f.write(struct.pack('f', self.Intensity))
-        f.write(struct.pack('f', self.AttenuationStart))
-        f.write(struct.pack('f', self.AttenuationEnd))
-        f.write(struct.pack('f', self.Unknown1))
-        f.write(struct.pack('f', self.Unknown2))
-        f.write(struct.pack('f', self.Unknown3))
-        f.write(struct.pack('f', self.Unknown4))
+        write_chunks(f, (self,))
+
+class Light(Record):
+    fields = (
+        ('LightType', 'B', 0),
+        ('Type', 'B', 1),
+        ('UseAttenuation', 'B', 1),
+        ('Padding', 'B', 1),
+        ('Color', '4B', (0, 0, 0, 0)),
+        ('Position', '3f', (0, 0, 0)),
+        ('Intensity', 'f', 0),
+        ('AttenuationStart', 'f', 0),
+        ('AttenuationEnd', 'f', 0),
+        ('Unknown1', 'f', 0),
+        ('Unknown2', 'f', 0),
+        ('Unknown3', 'f', 0),
+        ('Unknown4', 'f', 0),
+    )
 
 
 # lights
@@ -564,41 +836,36 @@ class MOLT_chunk:
         # read header
         self.Header.read(f)
 
-        # 48 = sizeof(Light)
-        count = self.Header.Size // 48
+        self.Lights = read_records(f, self.Header, Light)
 
-        self.Lights = []
-        for i in range(count):
-            light = Light()
-            light.read(f)
-            self.Lights.append(light)
+    def get_size(self):
+        return len(self.Lights) * Light.layout.size
 
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'TLOM'
-        self.Header.Size = len(self.Lights) * 48
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_records(buffer, offset, self.Lights)
 
-        self.Header.write(f)
-        for light in self.Lights:
-            light.write(f)
+    def write(self, f):
+        write_chunks(f, (self,))
 
-class DoodadSet:
-    def __init__(self):
-        self.Name = ''
-        self.StartDoodad = 0
-        self.nDoodads = 0
-        self.Padding = 0
+class DoodadSet(Record):
+    fields = (
+        ('Name', '20s', ''),
+        ('StartDoodad', 'I', 0),
+        ('nDoodads', 'I', 0),
+        ('Padding', 'I', 0),
+    )
 
-    def read(self, f):
-        self.Name = f.read(20).decode("ascii")
-        self.StartDoodad = struct.unpack("I", f.read(4))[0]
-        self.nDoodads = struct.unpack("I", f.read(4))[0]
-        self.Padding = struct.unpack("I", f.read(4))[0]
+    def set_values(self, values):
+        Record.set_values(self, values)
+        self.Name = self.Name.decode("ascii")
 
-    def write(self, f):
-        f.write(self.Name.ljust(20, '\0').encode('ascii'))
-        f.write(struct.pack('I', self.StartDoodad))
-        f.write(struct.pack('I', self.nDoodads))
-        f.write(struct.pack('I', self.Padding))
+    def get_values(self):
+        values = Record.get_values(self)
+        values[0] = self.Name.ljust(20, '\0').encode('ascii')
+        return values
 
 # doodad sets
 class MODS_chunk:
@@ -610,22 +877,19 @@ class MODS_chunk:
         # read header
         self.Header.read(f)
 
-        count = self.Header.Size // 32
+        self.Sets = read_records(f, self.Header, DoodadSet)
 
-        self.Sets = []
+    def get_size(self):
+        return len(self.Sets) * DoodadSet.layout.size
 
-        for i in range(count):
-            set = DoodadSet()
-            set.read(f)
-            self.Sets.append(set)
-
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'SDOM'
-        self.Header.Size = len(self.Sets) * 32
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_records(buffer, offset, self.Sets)
 
-        self.Header.write(f)
-        for set in self.Sets:
-            set.write(f)
+    def write(self, f):
+        write_chunks(f, (self,))
 
 
 # doodad names
@@ -639,12 +903,17 @@ class MODN_chunk:
         self.Header.read(f)
         self.StringTable = f.read(self.Header.Size)
 
-    def write(self, f):
+    def get_size(self):
+        return len(self.StringTable)
+
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'NDOM'
-        self.Header.Size = len(self.StringTable)
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_bytes(buffer, offset, self.StringTable)
 
-        self.Header.write(f)
-        f.write(self.StringTable)
+    def write(self, f):
+        write_chunks(f, (self,))
 
     def AddString(self, s):
         padding = len(self.StringTable) % 4
@@ -666,31 +935,31 @@ class MODN_chunk:
             i += 1
         return self.StringTable[start:i].decode('ascii')
 
-class DoodadDefinition:
-    def __init__(self):
-        self.NameOfs = 0
+class DoodadDefinition(Record):
+    __slots__ = ('Flags',)
+
+    # the first field holds the name offset in its low 24 bits and the flags in the high 8 bits
+    fields = (
+        ('NameOfs', 'I', 0),
+        ('Position', '3f', (0, 0, 0)),
+        ('Rotation', '4f', (0, 0, 0, 0)),
+        ('Scale', 'f', 0),
+        ('Color', '4B', (0, 0, 0, 0)),
+    )
+
+    def __init__(self, *values):
+        Record.__init__(self, *values)
         self.Flags = 0
-        self.Position = (0, 0, 0)
-        self.Rotation = [0, 0, 0, 0]
-        self.Scale = 0
-        self.Color = [0, 0, 0, 0]
 
-    def read(self, f):
-        weirdThing = struct.unpack("I", f.read(4))[0]
-        self.NameOfs = weirdThing & 0xFFFFFF
-        self.Flags = (weirdThing >> 24) & 0xFF
-        self.Position = struct.unpack("fff", f.read(12))
-        self.Rotation = struct.unpack("ffff", f.read(16))
-        self.Scale = struct.unpack("f", f.read(4))[0]
-        self.Color = struct.unpack("BBBB", f.read(4))
+    def set_values(self, values):
+        Record.set_values(self, values)
+        self.Flags = (self.NameOfs >> 24) & 0xFF
+        self.NameOfs &= 0xFFFFFF
 
-    def write(self, f):
-        weirdThing = ((self.Flags & 0xFF) << 24) | (self.NameOfs & 0xFFFFFF)
-        f.write(struct.pack('I', weirdThing))
-        f.write(struct.pack('fff', *self.Position))
-        f.write(struct.pack('ffff', *self.Rotation))
-        f.write(struct.pack('f', self.Scale))
-        f.write(struct.pack('BBBB', *self.Color))
+    def get_values(self):
+        values = Record.get_values(self)
+        values[0] = ((self.Flags & 0xFF) << 24) | (self.NameOfs & 0xFFFFFF)
+        return values
 
 # doodad definition
 class MODD_chunk:
@@ -702,59 +971,34 @@ class MODD_chunk:
         # read header
         self.Header.read(f)
 
-        count = self.Header.Size // 40
+        self.Definitions = read_records(f, self.Header, DoodadDefinition)
 
-        self.Definitions = []
-        for i in range(count):
-            defi = DoodadDefinition()
-            defi.read(f)
-            self.Definitions.append(defi)
+    def get_size(self):
+        return len(self.Definitions) * DoodadDefinition.layout.size
 
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'DDOM'
-        self.Header.Size = len(self.Definitions) * 40
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_records(buffer, offset, self.Definitions)
 
-        self.Header.write(f)
-        for defi in self.Definitions:
-            defi.write(f)
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # fog
-class Fog:
-    def __init__(self):
-        self.Flags = 0
-        self.Position = (0, 0, 0)
-        self.SmallRadius = 0
-        self.BigRadius = 0
-        self.EndDist = 0
-        self.StartFactor = 0
-        self.Color1 = (0, 0, 0, 0)
-        self.EndDist2 = 0
-        self.StartFactor2 = 0
-        self.Color2 = (0, 0, 0, 0)
-
-    def read(self, f):
-        self.Flags = struct.unpack("I", f.read(4))[0]
-        self.Position = struct.unpack("fff", f.read(12))
-        self.SmallRadius = struct.unpack("f", f.read(4))[0]
-        self.BigRadius = struct.unpack("f", f.read(4))[0]
-        self.EndDist = struct.unpack("f", f.read(4))[0]
-        self.StartFactor = struct.unpack("f", f.read(4))[0]
-        self.Color1 = struct.unpack("BBBB", f.read(4))
-        self.EndDist2 = struct.unpack("f", f.read(4))[0]
-        self.StartFactor2 = struct.unpack("f", f.read(4))[0]
-        self.Color2 = struct.unpack("BBBB", f.read(4))
-
-    def write(self, f):
-        f.write(struct.pack('I', self.Flags))
-        f.write(struct.pack('fff', *self.Position))
-        f.write(struct.pack('f', self.SmallRadius))
-        f.write(struct.pack('f', self.BigRadius))
-        f.write(struct.pack('f', self.EndDist))
-        f.write(struct.pack('f', self.StartFactor))
-        f.write(struct.pack('BBBB', *self.Color1))
-        f.write(struct.pack('f', self.EndDist2))
-        f.write(struct.pack('f', self.StartFactor2))
-        f.write(struct.pack('BBBB', *self.Color2))
+class Fog(Record):
+    fields = (
+        ('Flags', 'I', 0),
+        ('Position', '3f', (0, 0, 0)),
+        ('SmallRadius', 'f', 0),
+        ('BigRadius', 'f', 0),
+        ('EndDist', 'f', 0),
+        ('StartFactor', 'f', 0),
+        ('Color1', '4B', (0, 0, 0, 0)),
+        ('EndDist2', 'f', 0),
+        ('StartFactor2', 'f', 0),
+        ('Color2', '4B', (0, 0, 0, 0)),
+    )
 
 class MFOG_chunk:
     def __init__(self):
@@ -765,21 +1009,19 @@ class MFOG_chunk:
         # read header
         self.Header.read(f)
 
-        count = self.Header.Size // 48
+        self.Fogs = read_records(f, self.Header, Fog)
 
-        self.Fogs = []
-        for i in range(count):
-            fog = Fog()
-            fog.read(f)
-            self.Fogs.append(fog)
+    def get_size(self):
+        return len(self.Fogs) * Fog.layout.size
 
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'GOFM'
-        self.Header.Size = len(self.Fogs) * 48
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_records(buffer, offset, self.Fogs)
 
-        self.Header.write(f)
-        for fog in self.Fogs:
-            fog.write(f)
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # Convex volume plane, used only for transport objects
 class MCVP_chunk:
@@ -795,13 +1037,17 @@ class MCVP_chunk:
         for i in range(0, count):
             self.convex_volume_planes.append(struct.unpack('ffff', f.read(16)))
 
-    def write(self, f):
+    def get_size(self):
+        return len(self.convex_volume_planes) * 16
+
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'PVCM'
-        self.Header.Size = len(self.convex_volume_planes) * 16
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_elements(buffer, offset, self.convex_volume_planes, 'ffff')
 
-        self.Header.write(f)
-        for i in self.convex_volume_planes:
-            f.write(struct.pack('ffff', self.convex_volume_planes[i]))
+    def write(self, f):
+        write_chunks(f, (self,))
 
 ###########################
 # WMO GROUP
@@ -866,201 +1112,166 @@ class MOGP_chunk:
         self.Unknown1 = struct.unpack("I", f.read(4))[0]
         self.Unknown2 = struct.unpack("I", f.read(4))[0]
 
-    def write(self, f):
+    def get_size(self):
+        return MOGP_STRUCT.size
+
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'PGOM'
+        offset = self.Header.pack_into(buffer, offset)
+        # header size covers the group sub-chunks too and is set by the group file
+        MOGP_STRUCT.pack_into(buffer, offset, self.GroupNameOfs, self.DescGroupNameOfs, self.Flags,
+                              *self.BoundingBoxCorner1, *self.BoundingBoxCorner2,
+                              self.PortalStart, self.PortalCount, self.nBatchesA, self.nBatchesB,
+                              self.nBatchesC, self.nBatchesD, *self.FogIndices,
+                              self.LiquidType, self.GroupID, self.Unknown1, self.Unknown2)
+        return offset + MOGP_STRUCT.size
 
-        self.Header.write(f)
-        f.write(struct.pack('I', self.GroupNameOfs))
-        f.write(struct.pack('I', self.DescGroupNameOfs))
-        f.write(struct.pack('I', self.Flags))
-        f.write(struct.pack('fff', *self.BoundingBoxCorner1))
-        f.write(struct.pack('fff', *self.BoundingBoxCorner2))
-        f.write(struct.pack('H', self.PortalStart))
-        f.write(struct.pack('H', self.PortalCount))
-        f.write(struct.pack('H', self.nBatchesA))
-        f.write(struct.pack('H', self.nBatchesB))
-        f.write(struct.pack('H', self.nBatchesC))
-        f.write(struct.pack('H', self.nBatchesD))
-        f.write(struct.pack('BBBB', *self.FogIndices))
-        f.write(struct.pack('I', self.LiquidType))
-        f.write(struct.pack('I', self.GroupID))
-        f.write(struct.pack('I', self.Unknown1))
-        f.write(struct.pack('I', self.Unknown2))
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # Material information
-class TriangleMaterial:
-    def __init__(self):
-        self.Flags = 0
-        self.MaterialID = 0
-
-    def read(self, f):
-        self.Flags = struct.unpack("B", f.read(1))[0]
-        self.MaterialID = struct.unpack("B", f.read(1))[0]
-
-    def write(self, f):
-        f.write(struct.pack('B', self.Flags))
-        f.write(struct.pack('B', self.MaterialID))
+class TriangleMaterial(Record):
+    fields = (
+        ('Flags', 'B', 0),
+        ('MaterialID', 'B', 0),
+    )
 
 # contain list of triangle materials. One for each triangle
 class MOPY_chunk:
     def __init__(self):
         self.Header = ChunkHeader()
-        self.TriangleMaterials = []
+        self.TriangleMaterials = new_elements(TRIANGLE_MATERIAL_ELEMENT)
 
     def read(self, f):
         # read header
         self.Header.read(f)
 
-        count = self.Header.Size // 2
-
-        self.TriangleMaterials = []
+        if numpy is not None:
+            self.TriangleMaterials = read_elements(f, self.Header, TRIANGLE_MATERIAL_ELEMENT, "BB")
+        else:
+            self.TriangleMaterials = read_records(f, self.Header, TriangleMaterial)
 
-        for i in range(count):
-            tri = TriangleMaterial()
-            tri.read(f)
-            self.TriangleMaterials.append(tri)
+    def get_size(self):
+        return len(self.TriangleMaterials) * 2
 
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'YPOM'
-        self.Header.Size = len(self.TriangleMaterials) * 2
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        if isinstance(self.TriangleMaterials, ElementArray):
+            return pack_bytes(buffer, offset, self.TriangleMaterials.tobytes())
+        return pack_elements(buffer, offset, [(tri.Flags, tri.MaterialID) for tri in self.TriangleMaterials], 'BB')
 
-        self.Header.write(f)
-        for tri in self.TriangleMaterials:
-            tri.write(f)
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # Indices
 class MOVI_chunk:
     def __init__(self):
         self.Header = ChunkHeader()
-        self.Indices = []
+        self.Indices = new_elements(INDEX_ELEMENT)
 
     def read(self, f):
         # read header
         self.Header.read(f)
 
-        # 2 = sizeof(unsigned short)
-        count = self.Header.Size // 2
-
-        self.Indices = []
+        self.Indices = read_elements(f, self.Header, INDEX_ELEMENT, "H")
 
-        for i in range(count):
-            self.Indices.append(struct.unpack("H", f.read(2))[0])
+    def get_size(self):
+        return len(self.Indices) * 2
 
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'IVOM'
-        self.Header.Size = len(self.Indices) * 2
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_elements(buffer, offset, self.Indices, 'H')
 
-        self.Header.write(f)
-        for i in self.Indices:
-            f.write(struct.pack('H', i))
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # Vertices
 class MOVT_chunk:
     def __init__(self):
         self.Header = ChunkHeader()
-        self.Vertices = []
+        self.Vertices = new_elements(VECTOR3_ELEMENT)
 
     def read(self, f):
         # read header
         self.Header.read(f)
 
-        # 4 * 3 = sizeof(float) * 3
-        count = self.Header.Size // (4 * 3)
+        self.Vertices = read_elements(f, self.Header, VECTOR3_ELEMENT, "fff")
 
-        self.Vertices = []
+    def get_size(self):
+        return len(self.Vertices) * 12
 
-        for i in range(count):
-            self.Vertices.append(struct.unpack("fff", f.read(12)))
-
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'TVOM'
-        self.Header.Size = len(self.Vertices) * 12
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_elements(buffer, offset, self.Vertices, 'fff')
 
-        self.Header.write(f)
-        for v in self.Vertices:
-            f.write(struct.pack('fff', *v))
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # Normals
 class MONR_chunk:
     def __init__(self):
         self.Header = ChunkHeader()
-        self.Normals = []
+        self.Normals = new_elements(VECTOR3_ELEMENT)
 
     def read(self, f):
         # read header
         self.Header.read(f)
 
-        # 4 * 3 = sizeof(float) * 3
-        count = self.Header.Size // (4 * 3)
+        self.Normals = read_elements(f, self.Header, VECTOR3_ELEMENT, "fff")
 
-        self.Normals = []
+    def get_size(self):
+        return len(self.Normals) * 12
 
-        for i in range(count):
-            self.Normals.append(struct.unpack("fff", f.read(12)))
-
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'RNOM'
-        self.Header.Size = len(self.Normals) * 12
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_elements(buffer, offset, self.Normals, 'fff')
 
-        self.Header.write(f)
-        for n in self.Normals:
-            f.write(struct.pack('fff', *n))
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # Texture coordinates
 class MOTV_chunk:
     def __init__(self):
         self.Header = ChunkHeader()
-        self.TexCoords = []
+        self.TexCoords = new_elements(VECTOR2_ELEMENT)
 
     def read(self, f):
         # read header
         self.Header.read(f)
 
-        # 4 * 2 = sizeof(float) * 2
-        count = self.Header.Size // (4 * 2)
+        self.TexCoords = read_elements(f, self.Header, VECTOR2_ELEMENT, "ff")
 
-        self.TexCoords = []
+    def get_size(self):
+        return len(self.TexCoords) * 8
 
-        for i in range(count):
-            self.TexCoords.append(struct.unpack("ff", f.read(8)))
-
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'VTOM'
-        self.Header.Size = len(self.TexCoords) * 8
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_elements(buffer, offset, self.TexCoords, 'ff')
 
-        self.Header.write(f)
-        for tc in self.TexCoords:
-            f.write(struct.pack('ff', *tc))
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # batch
-class Batch:
-    def __init__(self):
-        self.BoundingBox = (0, 0, 0, 0, 0, 0)
-        self.StartTriangle = 0
-        self.nTriangle = 0
-        self.StartVertex = 0
-        self.LastVertex = 0
-        self.Unknown = 0
-        self.MaterialID = 0
-
-    def read(self, f):
-        #not sure
-        self.BoundingBox = struct.unpack("hhhhhh", f.read(12))
-        self.StartTriangle = struct.unpack("I", f.read(4))[0]
-        self.nTriangle = struct.unpack("H", f.read(2))[0]
-        self.StartVertex = struct.unpack("H", f.read(2))[0]
-        self.LastVertex = struct.unpack("H", f.read(2))[0]
-        self.Unknown = struct.unpack("B", f.read(1))[0]
-        self.MaterialID = struct.unpack("B", f.read(1))[0]
-
-    def write(self, f):
-        f.write(struct.pack('hhhhhh', *self.BoundingBox))
-        f.write(struct.pack('I', self.StartTriangle))
-        f.write(struct.pack('H', self.nTriangle))
-        f.write(struct.pack('H', self.StartVertex))
-        f.write(struct.pack('H', self.LastVertex))
-        f.write(struct.pack('B', self.Unknown))
-        f.write(struct.pack('B', self.MaterialID))
+class Batch(Record):
+    fields = (
+        ('BoundingBox', '6h', (0, 0, 0, 0, 0, 0)),  # not sure
+        ('StartTriangle', 'I', 0),
+        ('nTriangle', 'H', 0),
+        ('StartVertex', 'H', 0),
+        ('LastVertex', 'H', 0),
+        ('Unknown', 'B', 0),
+        ('MaterialID', 'B', 0),
+    )
 
 # batches
 class MOBA_chunk:
@@ -1072,22 +1283,19 @@ class MOBA_chunk:
         # read header
         self.Header.read(f)
 
-        count = self.Header.Size // 24
+        self.Batches = read_records(f, self.Header, Batch)
 
-        self.Batches = []
+    def get_size(self):
+        return len(self.Batches) * Batch.layout.size
 
-        for i in range(count):
-            batch = Batch()
-            batch.read(f)
-            self.Batches.append(batch)
-
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'ABOM'
-        self.Header.Size = len(self.Batches) * 24
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_records(buffer, offset, self.Batches)
 
-        self.Header.write(f)
-        for b in self.Batches:
-            b.write(f)
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # lights
 class MOLR_chunk:
@@ -1107,13 +1315,17 @@ class MOLR_chunk:
         for i in range(count):
             self.LightRefs.append(struct.unpack("h", f.read(2))[0])
 
-    def write(self, f):
+    def get_size(self):
+        return len(self.LightRefs) * 2
+
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'RLOM'
-        self.Header.Size = len(self.LightRefs) * 2
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_elements(buffer, offset, self.LightRefs, 'h')
 
-        self.Header.write(f)
-        for lr in self.LightRefs:
-            f.write(struct.pack('h', lr))
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # doodads
 class MODR_chunk:
@@ -1133,13 +1345,17 @@ class MODR_chunk:
         for i in range(count):
             self.DoodadRefs.append(struct.unpack("h", f.read(2))[0])
 
-    def write(self, f):
+    def get_size(self):
+        return len(self.DoodadRefs) * 2
+
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'RDOM'
-        self.Header.Size = len(self.DoodadRefs) * 2
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_elements(buffer, offset, self.DoodadRefs, 'h')
 
-        self.Header.write(f)
-        for dr in self.DoodadRefs:
-            f.write(struct.pack('h', dr))
+    def write(self, f):
+        write_chunks(f, (self,))
 
 class BSP_PLANE_TYPE:
     YZ_plane = 0
@@ -1147,27 +1363,14 @@ class BSP_PLANE_TYPE:
     XY_plane = 2
     Leaf = 4 # end node, contains polygons
 
-class BSP_Node:
-    def __init__(self):
-        self.PlaneType = 0
-        self.Children = (0, 0)
-        self.NumFaces = 0
-        self.FirstFace = 0
-        self.Dist = 0
-
-    def read(self, f):
-        self.PlaneType = struct.unpack("h", f.read(2))[0]
-        self.Children = struct.unpack("hh", f.read(4))
-        self.NumFaces = struct.unpack("H", f.read(2))[0]
-        self.FirstFace = struct.unpack("I", f.read(4))[0]
-        self.Dist = struct.unpack("f", f.read(4))[0]
-
-    def write(self, f):
-        f.write(struct.pack('h', self.PlaneType))
-        f.write(struct.pack('hh', *self.Children))
-        f.write(struct.pack('H', self.NumFaces))
-        f.write(struct.pack('I', self.FirstFace))
-        f.write(struct.pack('f', self.Dist))
+class BSP_Node(Record):
+    fields = (
+        ('PlaneType', 'h', 0),
+        ('Children', '2h', (0, 0)),
+        ('NumFaces', 'H', 0),
+        ('FirstFace', 'I', 0),
+        ('Dist', 'f', 0),
+    )
 
 # collision geometry
 class MOBN_chunk:
@@ -1179,72 +1382,66 @@ class MOBN_chunk:
         # read header
         self.Header.read(f)
 
-        count = self.Header.Size // 0x10
+        self.Nodes = read_records(f, self.Header, BSP_Node)
 
-        self.Nodes = []
+    def get_size(self):
+        return len(self.Nodes) * BSP_Node.layout.size
 
-        for i in range(count):
-            node = BSP_Node()
-            node.read(f)
-            self.Nodes.append(node)
-
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'NBOM'
-        self.Header.Size = len(self.Nodes) * 0x10
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_records(buffer, offset, self.Nodes)
 
-        self.Header.write(f)
-        for node in self.Nodes:
-            node.write(f)
+    def write(self, f):
+        write_chunks(f, (self,))
 
 class MOBR_chunk:
     def __init__(self):
         self.Header = ChunkHeader()
-        self.Faces = []
+        self.Faces = new_elements(INDEX_ELEMENT)
 
     def read(self, f):
         # read header
         self.Header.read(f)
 
-        count = self.Header.Size // 2
-
-        self.Faces = []
+        self.Faces = read_elements(f, self.Header, INDEX_ELEMENT, "H")
 
-        for i in range(count):
-            self.Faces.append(struct.unpack("H", f.read(2))[0])
+    def get_size(self):
+        return len(self.Faces) * 2
 
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'RBOM'
-        self.Header.Size = len(self.Faces) * 2
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_elements(buffer, offset, self.Faces, 'H')
 
-        self.Header.write(f)
-        for face in self.Faces:
-            f.write(struct.pack('H', face))
+    def write(self, f):
+        write_chunks(f, (self,))
 
 # vertex colors
 class MOCV_chunk:
     def __init__(self):
         self.Header = ChunkHeader()
-        self.vertColors = []
+        self.vertColors = new_elements(COLOR_ELEMENT)
 
     def read(self, f):
         # read header
         self.Header.read(f)
 
-        # 4 = sizeof(unsigned char) * 4
-        count = self.Header.Size // 4
+        self.vertColors = read_elements(f, self.Header, COLOR_ELEMENT, "BBBB")
 
-        self.vertColors = []
-
-        for i in range(count):
-            self.vertColors.append(struct.unpack("BBBB", f.read(4)))
+    def get_size(self):
+        return len(self.vertColors) * 4
 
-    def write(self, f):
+    def pack_into(self, buffer, offset):
         self.Header.Magic = 'VCOM'
-        self.Header.Size = len(self.vertColors) * 4
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        return pack_elements(buffer, offset, self.vertColors, 'BBBB')
 
-        self.Header.write(f)
-        for vc in self.vertColors:
-            f.write(struct.pack('BBBB', *vc))
+    def write(self, f):
+        write_chunks(f, (self,))
 
 class LiquidVertex:
     def __init__(self):
@@ -1252,11 +1449,12 @@ class LiquidVertex:
         self.height = 0
 
     def read(self, f):
-        self.height = struct.unpack("f", f.read(4))
+        self.height = struct.unpack("f", f.read(4))[0]
 
 
-    def write(self, f):
-        f.write(struct.pack('f', self.height))
+    def pack_into(self, buffer, offset):
+        FLOAT.pack_into(buffer, offset, self.height)
+        return offset + FLOAT.size
 
 class WaterVertex(LiquidVertex):
     def __init__(self):
@@ -1274,13 +1472,9 @@ class WaterVertex(LiquidVertex):
         LiquidVertex.read(self, f) # Python, wtf?
 
 
-    def write(self, f):
-
-        f.write(struct.pack('B', self.flow1))
-        f.write(struct.pack('B', self.flow2))
-        f.write(struct.pack('B', self.flow1Pct))
-        f.write(struct.pack('B', self.filler))
-        LiquidVertex.write(self, f) # Python, wtf?
+    def pack_into(self, buffer, offset):
+        WATER_VERTEX_STRUCT.pack_into(buffer, offset, self.flow1, self.flow2, self.flow1Pct, self.filler, self.height)
+        return offset + WATER_VERTEX_STRUCT.size
 
 
 class MagmaVertex(LiquidVertex):
@@ -1293,10 +1487,9 @@ class MagmaVertex(LiquidVertex):
         self.v = struct.unpack("h", f.read(2))[0]
         LiquidVertex.read(self, f)
 
-    def write(self, f):
-        f.write(struct.pack('h', self.u))
-        f.write(struct.pack('h', self.v))
-        LiquidVertex.write(self, f)
+    def pack_into(self, buffer, offset):
+        MAGMA_VERTEX_STRUCT.pack_into(buffer, offset, self.u, self.v, self.height)
+        return offset + MAGMA_VERTEX_STRUCT.size
 
 
 class MLIQ_chunk:
@@ -1340,21 +1533,18 @@ class MLIQ_chunk:
             self.TileFlags.append(struct.unpack("B", f.read(1))[0])
 
 
-    def write(self, f):
-        self.Header.Magic = 'QILM'
-        self.Header.Size = 30 + self.xVerts * self.yVerts * 8 + self.xTiles * self.yTiles
+    def get_size(self):
+        return 30 + self.xVerts * self.yVerts * 8 + self.xTiles * self.yTiles
 
-        self.Header.write(f)
-
-        f.write(struct.pack('I', self.xVerts))
-        f.write(struct.pack('I', self.yVerts))
-        f.write(struct.pack('I', self.xTiles))
-        f.write(struct.pack('I', self.yTiles))
-        f.write(struct.pack('fff', *self.Position))
-        f.write(struct.pack('H', self.materialID))
+    def pack_into(self, buffer, offset):
+        self.Header.Magic = 'QILM'
+        self.Header.Size = self.get_size()
+        offset = self.Header.pack_into(buffer, offset)
+        MLIQ_STRUCT.pack_into(buffer, offset, self.xVerts, self.yVerts, self.xTiles, self.yTiles,
+                              *self.Position, self.materialID)
+        offset = pack_records(buffer, offset + MLIQ_STRUCT.size, self.VertexMap)
+        return pack_bytes(buffer, offset, bytes(self.TileFlags))
 
-        for vtx in self.VertexMap:
-            vtx.write(f)
-        for tile_flag in self.TileFlags:
-            f.write(struct.pack('B', tile_flag))
+    def write(self, f):
+        write_chunks(f, (self,))
 
@@ -10,106 +10,95 @@ import sys
 import mathutils
 
 
-class WMOGroupFile:
-    def __init__(self, root):
-
-        self.root = root
-
-        self.mver = MVER_chunk()
-        self.mogp = MOGP_chunk()
-        self.mopy = MOPY_chunk()
-        self.movi = MOVI_chunk()
-        self.movt = MOVT_chunk()
-        self.monr = MONR_chunk()
-        self.motv = MOTV_chunk()
-        self.moba = MOBA_chunk()
-        self.molr = MOLR_chunk()
-        self.modr = MODR_chunk()
-        self.mobn = MOBN_chunk()
-        self.mobr = MOBR_chunk()
-        self.mocv = MOCV_chunk()
-        self.mliq = MLIQ_chunk()
-        self.motv2 = MOTV_chunk()
-        self.mocv2 = MOCV_chunk()
+def get_loop_colors(colors):
+    """ Convert BGRA vertex colors gathered per loop to the flat RGB floats of Blender vertex color layers """
+    if numpy is not None and isinstance(colors, numpy.ndarray):
+        return flatten_elements(colors[:, 2::-1] / 255, 'f4')
+    return [channel / 255 for color in colors for channel in (color[2], color[1], color[0])]
+
+
+def get_loop_uvs(tex_coords):
+    """ Convert texture coordinates gathered per loop to the flat, V flipped floats of Blender UV layers """
+    if numpy is not None and isinstance(tex_coords, numpy.ndarray):
+        uvs = tex_coords.astype(numpy.float64)
+        uvs[:, 1] = 1 - uvs[:, 1]
+        return flatten_elements(uvs, 'f4')
+    return [value for uv in tex_coords for value in (uv[0], 1 - uv[1])]
+
+
+def add_alpha_weights(vertex_group, colors, indices):
+    """ Add the vertices used by faces to a vertex group, weighted by the alpha of their vertex color """
+    if isinstance(colors, ElementArray):
+        vertices = numpy.unique(indices.array)
+        alphas = colors.array[vertices, 3]
+        for alpha in numpy.unique(alphas):
+            vertex_group.add(vertices[alphas == alpha].tolist(), int(alpha) / 255, 'ADD')
+    else:
+        weighted_vertices = {}
+        for i in set(indices):
+            weighted_vertices.setdefault(colors[i][3], []).append(i)
+        for alpha, vertices in weighted_vertices.items():
+            vertex_group.add(vertices, alpha / 255, 'ADD')
 
-    def read(self, f):
-        """ Read WoW WMO group file """
-
-        self.mver.read(f)
-        self.mogp.read(f)
-        self.mopy.read(f)
-        self.movi.read(f)
-        self.movt.read(f)
-        self.monr.read(f)
-        self.motv.read(f)
-        self.moba.read(f)
 
-        if self.mogp.Flags & MOGP_FLAG.HasLight:
-            self.molr.read(f)
+class WMOGroupFile:
 
-        if self.mogp.Flags & MOGP_FLAG.HasDoodads:
-            self.modr.read(f)
+    # chunks are parsed on first access, see LazyChunk
+    mver = LazyChunk('REVM', MVER_chunk)
+    mogp = LazyChunk('PGOM', MOGP_chunk)
+    mopy = LazyChunk('YPOM', MOPY_chunk)
+    movi = LazyChunk('IVOM', MOVI_chunk)
+    movt = LazyChunk('TVOM', MOVT_chunk)
+    monr = LazyChunk('RNOM', MONR_chunk)
+    motv = LazyChunk('VTOM', MOTV_chunk)
+    moba = LazyChunk('ABOM', MOBA_chunk)
+    molr = LazyChunk('RLOM', MOLR_chunk)
+    modr = LazyChunk('RDOM', MODR_chunk)
+    mobn = LazyChunk('NBOM', MOBN_chunk)
+    mobr = LazyChunk('RBOM', MOBR_chunk)
+    mocv = LazyChunk('VCOM', MOCV_chunk)
+    mliq = LazyChunk('QILM', MLIQ_chunk, prepare='prepare_liquid')
+    motv2 = LazyChunk('VTOM', MOTV_chunk, index=1)
+    mocv2 = LazyChunk('VCOM', MOCV_chunk, index=1)
 
-        if self.mogp.Flags & MOGP_FLAG.HasCollision:
-            self.mobn.read(f)
-            self.mobr.read(f)
+    def __init__(self, root):
 
-        if self.mogp.Flags & MOGP_FLAG.HasVertexColor:
-            self.mocv.read(f)
+        self.root = root
+        self.chunk_directory = None
 
-        if self.mogp.Flags & MOGP_FLAG.HasWater:
-            if self.mogp.LiquidType in {3, 4, 7, 8, 11, 12}:
-                self.mliq.LiquidMaterial = False
-            self.mliq.read(f)
+    def read(self, f):
+        """ Read WoW WMO group file. Only chunk headers are scanned here, including the sub-chunks of MOGP,
+        chunks are parsed when they are first accessed. """
 
-        if self.mogp.Flags & MOGP_FLAG.HasTwoMOTV:
-            self.motv2.read(f)
+        # 0x44 = size of MOGP fields preceding the sub-chunks
+        self.chunk_directory = ChunkDirectory(f, nested={'PGOM': 0x44})
 
-        if self.mogp.Flags & MOGP_FLAG.HasTwoMOCV:
-            self.mocv2.read(f)
+    def prepare_liquid(self, mliq):
+        if self.mogp.LiquidType in {3, 4, 7, 8, 11, 12}:
+            mliq.LiquidMaterial = False
 
     def write(self, f):
         """ Write a saved WoW WMO group to a file """
         print("\nWriting file: <<" +  os.path.basename(f.name) + ">>")
 
-        self.mver.write(f)
-
-        f.seek(0x58)
-        self.mopy.write(f)
-        self.movi.write(f)
-        self.movt.write(f)
-        self.monr.write(f)
-        self.motv.write(f)
-        self.moba.write(f)
+        chunks = [self.mopy, self.movi, self.movt, self.monr, self.motv, self.moba]
 
         if self.molr:
-            self.molr.write(f)
+            chunks.append(self.molr)
 
         if self.modr:
-            self.modr.write(f)
-
-        self.mobn.write(f)
-        self.mobr.write(f)
+            chunks.append(self.modr)
 
-        if self.mocv:
-            self.mocv.write(f)
+        chunks += [self.mobn, self.mobr]
 
-        if self.mliq:
-            self.mliq.write(f)
+        for chunk in (self.mocv, self.mliq, self.motv2, self.mocv2):
+            if chunk:
+                chunks.append(chunk)
 
-        if self.motv2:
-            self.motv2.write(f)
+        # MOGP wraps the sub-chunks, so its size is known before anything is packed
+        self.mogp.Header.Size = self.mogp.get_size() + sum(8 + chunk.get_size() for chunk in chunks)
 
-        if self.mocv2:
-            self.mocv2.write(f)
-
-        # get file size
-        f.seek(0, 2)
-        self.mogp.Header.Size = f.tell() - 20
-
-        # write header
-        f.seek(0xC)
-        self.mogp.write(f)
+        write_chunks(f, [self.mver, self.mogp] + chunks)
 
     @staticmethod
     def get_avg(list):
@@ -192,7 +181,7 @@ class WMOGroupFile:
             y_pos = self.mliq.Position[1] + y * 4.1666625
             for x in range(0 , self.mliq.xVerts):
                 x_pos = self.mliq.Position[0] + x * 4.1666625
-                vertices.append((x_pos, y_pos, self.mliq.VertexMap[y * self.mliq.xVerts + x].height[0]))
+                vertices.append((x_pos, y_pos, self.mliq.VertexMap[y * self.mliq.xVerts + x].height))
 
         # calculate faces
         indices = []
@@ -283,8 +272,7 @@ class WMOGroupFile:
         # last node in branch
         node_indices = []
         if nodes[i_node].PlaneType & BSP_PLANE_TYPE.Leaf:
-            for i in range(nodes[i_node].FirstFace, nodes[i_node].FirstFace + nodes[i_node].NumFaces):
-                node_indices.append(faces[i])
+            node_indices.extend(faces[nodes[i_node].FirstFace:nodes[i_node].FirstFace + nodes[i_node].NumFaces])
 
         if nodes[i_node].Children[0] != -1:
             node_indices.extend(self.get_bsp_node_indices(nodes[i_node].Children[0], nodes, faces, indices))
@@ -296,32 +284,42 @@ class WMOGroupFile:
 
     def get_collision_indices(self):
         """ Get indices of a WMO BSP tree nodes that have collision """
-        node_indices = self.get_bsp_node_indices(0, self.mobn.Nodes, self.mobr.Faces, self.movi.Indices)
+        group_indices = self.movi.Indices
+        node_indices = self.get_bsp_node_indices(0, self.mobn.Nodes, self.mobr.Faces, group_indices)
+
+        if isinstance(group_indices, ElementArray):
+            node_indices = numpy.array(node_indices, dtype=numpy.intp)
+            node_indices = node_indices[(self.mopy.TriangleMaterials.array.Flags[node_indices] & 0x04) == 0]
+            return group_indices.array.reshape(-1, 3)[node_indices].reshape(-1).tolist()
+
+        flags = [tri.Flags for tri in self.mopy.TriangleMaterials]
         indices = []
         for i in node_indices:
-            if not self.mopy.TriangleMaterials[i].Flags & 0x04:
-                indices.append(self.movi.Indices[i * 3])
-                indices.append(self.movi.Indices[i * 3 + 1])
-                indices.append(self.movi.Indices[i * 3 + 2])
+            if not flags[i] & 0x04:
+                indices.append(group_indices[i * 3])
+                indices.append(group_indices[i * 3 + 1])
+                indices.append(group_indices[i * 3 + 2])
 
         return indices
 
     # Create mesh from file data
     def load_object(self, obj_name, editable_doodads):
         """ Load WoW WMO group as an object to the Blender scene """
-        custom_normals = []
-        faces = []
-
         vertices = self.movt.Vertices
         normals = self.monr.Normals
-        tex_coords = self.motv.TexCoords
+        indices = self.movi.Indices
+        n_faces = len(indices) // 3
 
-        for i in range(0, len(self.movi.Indices), 3):
-            faces.append(self.movi.Indices[i:i+3])
-
-        # create mesh
+        # create mesh, the same way as from_pydata() but from whole arrays
         mesh = bpy.data.meshes.new(obj_name)
-        mesh.from_pydata(vertices, [], faces)
+        mesh.vertices.add(len(vertices))
+        mesh.vertices.foreach_set("co", flatten_elements(vertices, 'f4'))
+        mesh.loops.add(len(indices))
+        mesh.loops.foreach_set("vertex_index", flatten_elements(indices, 'i4'))
+        mesh.polygons.add(n_faces)
+        mesh.polygons.foreach_set("loop_start", range(0, len(indices), 3))
+        mesh.polygons.foreach_set("loop_total", (3,) * n_faces)
+        mesh.update(calc_edges=True)
 
         # create object
         scn = bpy.context.scene
@@ -332,19 +330,12 @@ class WMOGroupFile:
         nobj = bpy.data.objects.new(obj_name, mesh)
         scn.objects.link(nobj)
 
-        for poly in mesh.polygons:
-            poly.use_smooth = True
-
-        # set normals
-        for i in range(len(normals)):
-            mesh.vertices[i].normal = normals[i]
+        mesh.polygons.foreach_set("use_smooth", (True,) * n_faces)
 
+        # set normals, loops are in the same order as indices
+        mesh.vertices.foreach_set("normal", flatten_elements(normals, 'f4'))
         mesh.use_auto_smooth = True
-        for loop in mesh.loops:
-            mesh.vertices[loop.vertex_index].normal = normals[loop.vertex_index]
-            custom_normals.append(normals[loop.vertex_index])
-
-        mesh.normals_split_custom_set(custom_normals)
+        mesh.normals_split_custom_set(gather_elements(normals, indices))
 
         # set vertex color
         if self.mogp.Flags & MOGP_FLAG.HasVertexColor:
@@ -355,41 +346,27 @@ class WMOGroupFile:
 
             lightmap = nobj.vertex_groups.new("Lightmap")
             nobj.WowVertexInfo.Lightmap = lightmap.name
-            lightmap.add(self.movi.Indices, 1.0, 'ADD')
+            add_alpha_weights(lightmap, self.mocv.vertColors, indices)
 
-            # loops and vertex_color are in the same order, so we use it to find vertex index
-            for i in range(len(mesh.loops)):
-
-                vert_color_layer1.data[i].color = (self.mocv.vertColors[mesh.loops[i].vertex_index][2] / 255,
-                                                  self.mocv.vertColors[mesh.loops[i].vertex_index][1] / 255,
-                                                  self.mocv.vertColors[mesh.loops[i].vertex_index][0] / 255)
-
-                mesh.vertices[mesh.loops[i].vertex_index].groups[lightmap.index].weight \
-                = self.mocv.vertColors[mesh.loops[i].vertex_index][3] / 255
+            # loops and vertex_color are in the same order, so colors are gathered by indices
+            vert_color_layer1.data.foreach_set("color", get_loop_colors(gather_elements(self.mocv.vertColors,
+                                                                                        indices)))
 
         if self.mogp.Flags & MOGP_FLAG.HasTwoMOCV:
             blendmap = nobj.vertex_groups.new("Blendmap")
             nobj.WowVertexInfo.Blendmap = blendmap.name
-            blendmap.add(self.movi.Indices, 1.0, 'ADD')
-
-            for vertex in mesh.vertices:
-                vertex.groups[blendmap.index].weight = self.mocv2.vertColors[vertex.index][3] / 255
+            add_alpha_weights(blendmap, self.mocv2.vertColors, indices)
 
         # set uv
         uv1 = mesh.uv_textures.new("UVMap")
         uv_layer1 = mesh.uv_layers[0]
-        for i in range(len(uv_layer1.data)):
-            uv = tex_coords[mesh.loops[i].vertex_index]
-            uv_layer1.data[i].uv = (uv[0], 1 - uv[1])
+        uv_layer1.data.foreach_set("uv", get_loop_uvs(gather_elements(self.motv.TexCoords, indices)))
 
         if self.mogp.Flags & MOGP_FLAG.HasTwoMOTV:
             uv2 = mesh.uv_textures.new("UVMap_2")
             nobj.WowVertexInfo.SecondUV = uv2.name
             uv_layer2 = mesh.uv_layers[1]
-
-            for j in range(len(uv_layer2.data)):
-                uv = self.motv2.TexCoords[mesh.loops[j].vertex_index]
-                uv_layer2.data[j].uv = (uv[0], 1 - uv[1])
+            uv_layer2.data.foreach_set("uv", get_loop_uvs(gather_elements(self.motv2.TexCoords, indices)))
 
         # map root material ID to index in mesh materials
         material_indices = {}
@@ -433,34 +410,42 @@ class WMOGroupFile:
                 material.WowMaterial.Enabled = True
 
             if i < self.mogp.nBatchesA:
-                batch_map_a.add(self.movi.Indices[self.moba.Batches[i].StartTriangle
+                batch_map_a.add(indices[self.moba.Batches[i].StartTriangle
                               : self.moba.Batches[i].StartTriangle + self.moba.Batches[i].nTriangle], 1.0, 'ADD')
 
             elif i < self.mogp.nBatchesA + self.mogp.nBatchesB:
-                batch_map_b.add(self.movi.Indices[self.moba.Batches[i].StartTriangle
+                batch_map_b.add(indices[self.moba.Batches[i].StartTriangle
                               : self.moba.Batches[i].StartTriangle + self.moba.Batches[i].nTriangle], 1.0, 'ADD')
 
             batch_material_map[(self.moba.Batches[i].StartTriangle // 3, (self.moba.Batches[i].StartTriangle + self.moba.Batches[i].nTriangle) // 3)] = self.moba.Batches[i].MaterialID
 
-        # add ghost material
-        for i in self.mopy.TriangleMaterials:
-            if i.MaterialID == 0xFF:
-                mat_ghost__id = len(mesh.materials)
-                mesh.materials.append(self.root.material_lookup[0xFF])
-                material_viewport_textures[mat_ghost__id] = None
-                material_indices[0xFF] = mat_ghost__id
-                break
+        if isinstance(self.mopy.TriangleMaterials, ElementArray):
+            material_ids = self.mopy.TriangleMaterials.array.MaterialID
+        else:
+            material_ids = [tri.MaterialID for tri in self.mopy.TriangleMaterials]
 
-        # set faces material
-        for i in range(len(mesh.polygons)):
-            mat_id = self.mopy.TriangleMaterials[i].MaterialID
+        # add ghost material
+        if 0xFF in material_ids:
+            mat_ghost__id = len(mesh.materials)
+            mesh.materials.append(self.root.material_lookup[0xFF])
+            material_viewport_textures[mat_ghost__id] = None
+            material_indices[0xFF] = mat_ghost__id
+
+        # set faces material, material IDs are bytes so they are mapped through a lookup table
+        material_lookup = [material_indices.get(mat_id, 0) for mat_id in range(256)]
+        if numpy is not None:
+            face_materials = numpy.array(material_lookup, dtype=numpy.int32)[material_ids]
+        else:
+            face_materials = [material_lookup[mat_id] for mat_id in material_ids]
 
-            mesh.polygons[i].material_index = material_indices[mat_id]
+        mesh.polygons.foreach_set("material_index", face_materials)
 
-            # set texture displayed in viewport
-            img = material_viewport_textures[material_indices[mat_id]]
-            if img is not None:
-                uv1.data[i].image = img
+        # set texture displayed in viewport
+        if any(img is not None for img in material_viewport_textures.values()):
+            for i, mat_index in enumerate(face_materials):
+                img = material_viewport_textures[mat_index]
+                if img is not None:
+                    uv1.data[i].image = img
 
         # set textured solid in all 3D views and switch to textured mode
         for area in bpy.context.screen.areas:
@@ -898,12 +883,12 @@ class WMOGroupFile:
 
         # resize chunk containers
         self.moba.Batches = (n_batches_a + n_batches_b + n_batches_c) * [Batch()]
-        self.movt.Vertices = vertex_size * [(0, 0, 0)]
-        self.monr.Normals = vertex_size * [(0, 0, 0)]
-        self.motv.TexCoords = vertex_size * [(0, 0)]
-        self.motv2.TexCoords = vertex_size * [(0, 0)]
-        self.mocv.vertColors = vertex_size * [(0x7F, 0x7F, 0x7F, 0x00)]
-        self.mocv2.vertColors = vertex_size * [(0x7F, 0x7F, 0x7F, 0x00)]
+        self.movt.Vertices = new_elements(VECTOR3_ELEMENT, vertex_size, (0, 0, 0))
+        self.monr.Normals = new_elements(VECTOR3_ELEMENT, vertex_size, (0, 0, 0))
+        self.motv.TexCoords = new_elements(VECTOR2_ELEMENT, vertex_size, (0, 0))
+        self.motv2.TexCoords = new_elements(VECTOR2_ELEMENT, vertex_size, (0, 0))
+        self.mocv.vertColors = new_elements(COLOR_ELEMENT, vertex_size, (0x7F, 0x7F, 0x7F, 0x00))
+        self.mocv2.vertColors = new_elements(COLOR_ELEMENT, vertex_size, (0x7F, 0x7F, 0x7F, 0x00))
 
         vertex_map = {}
         normal_map = {}
@@ -1010,12 +995,13 @@ class WMOGroupFile:
                 for vertex_index in mesh.polygons[poly].vertices:
                     new_index = vertex_map.get(vertex_index)
                     self.monr.Normals[new_index] = self.get_avg(normal_map.get(new_index))
+                    position = self.movt.Vertices[new_index]
 
                     for i in range(0, 2):
                         for j in range(0, 3):
                             idx = i * 3 + j
-                            bounding_box[idx] = min(bounding_box[idx], floor(self.movt.Vertices[new_index][j])) \
-                                               if i == 0 else max(bounding_box[idx], ceil(self.movt.Vertices[new_index][j]))
+                            bounding_box[idx] = min(bounding_box[idx], floor(position[j])) \
+                                               if i == 0 else max(bounding_box[idx], ceil(position[j]))
 
             # skip batch writing if processed polyBatch is collision
             if batch_key[0] == 0xFF:
@@ -0,0 +1,53 @@
+""" Test setup.
+The addon runs inside Blender, whose bpy and mathutils modules are not importable from a plain Python.
+When they are missing, minimal stand-ins are installed so that the file format and game data modules can be
+imported. The addon package is mapped without running its __init__, which registers the Blender UI.
+Tests only exercise code that does not call into Blender. """
+
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def user_resource(resource_type, path="", autocreate=False):
+    """ Stand-in with the signature of bpy.utils.user_resource in Blender 2.7x. """
+    raise RuntimeError("Tests must replace bpy.utils.user_resource")
+
+
+def install_blender_stubs():
+    try:
+        import bpy
+    except ImportError:
+        bpy = types.ModuleType('bpy')
+        bpy.utils = types.SimpleNamespace(user_resource=user_resource)
+        bpy.data = types.SimpleNamespace(images=[])
+        bpy.types = types.SimpleNamespace(Operator=object, PropertyGroup=object, Panel=object, Menu=object,
+                                          UIList=object)
+        bpy.props = types.SimpleNamespace(**{name: (lambda *args, **kwargs: None) for name in
+                                             ('StringProperty', 'BoolProperty', 'IntProperty', 'FloatProperty',
+                                              'EnumProperty', 'PointerProperty', 'CollectionProperty',
+                                              'FloatVectorProperty', 'IntVectorProperty')})
+        sys.modules['bpy'] = bpy
+
+    try:
+        import mathutils
+    except ImportError:
+        mathutils = types.ModuleType('mathutils')
+        mathutils.Vector = tuple
+        mathutils.kdtree = types.ModuleType('mathutils.kdtree')
+        mathutils.kdtree.KDTree = object
+        sys.modules['mathutils'] = mathutils
+        sys.modules['mathutils.kdtree'] = mathutils.kdtree
+
+
+def map_addon_package():
+    if 'io_scene_wmo' not in sys.modules:
+        package = types.ModuleType('io_scene_wmo')
+        package.__path__ = [os.path.join(ROOT, 'io_scene_wmo')]
+        sys.modules['io_scene_wmo'] = package
+
+
+install_blender_stubs()
+map_addon_package()
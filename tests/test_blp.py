@@ -0,0 +1,113 @@
+import struct
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from io_scene_wmo.mpq import blp
+
+RED = (255, 0, 0, 255)
+BLUE = (0, 0, 255, 255)
+
+# color part of a DXT block: red and blue RGB565 endpoints, pixels use colors 0, 1, 2, 3 from left to right
+COLOR_BLOCK = struct.pack('<2H', 0xF800, 0x001F) + bytes([0xE4] * 4)
+
+
+def make_blp2(compression, alpha_depth, alpha_type, width, height, mips, palette=bytes(1024)):
+    """ Make a BLP2 texture from the data of its mip levels. """
+    offsets = []
+    offset = 148 + len(palette)
+    for mip in mips:
+        offsets.append(offset)
+        offset += len(mip)
+
+    header = struct.pack('<4sI4B2I', b'BLP2', 1, compression, alpha_depth, alpha_type, len(mips) > 1, width, height)
+    header += struct.pack('<16I', *(offsets + [0] * (16 - len(mips))))
+    header += struct.pack('<16I', *([len(mip) for mip in mips] + [0] * (16 - len(mips))))
+    return header + palette + b''.join(mips)
+
+
+def test_dxt1_four_colors():
+    pixels = blp.decode_dxt(COLOR_BLOCK, 4, 4, 0, blp.BLP_ALPHA_DXT1)
+
+    assert pixels.shape == (4, 4, 4) and pixels.dtype == numpy.uint8
+    assert pixels.tolist() == [[list(RED), list(BLUE), [170, 0, 85, 255], [85, 0, 170, 255]]] * 4
+
+
+def test_dxt1_three_colors_and_transparent_black():
+    block = struct.pack('<2H', 0x001F, 0xF800) + bytes([0xE4] * 4)
+
+    assert blp.decode_dxt(block, 4, 4, 1, blp.BLP_ALPHA_DXT1)[0].tolist() == \
+        [list(BLUE), list(RED), [127, 0, 127, 255], [0, 0, 0, 0]]
+    assert blp.decode_dxt(block, 4, 4, 0, blp.BLP_ALPHA_DXT1)[0, 3].tolist() == [0, 0, 0, 255]
+
+
+def test_dxt3_alpha():
+    alpha = bytes([0x10, 0x32, 0x54, 0x76, 0x98, 0xBA, 0xDC, 0xFE])
+
+    pixels = blp.decode_dxt(alpha + COLOR_BLOCK, 4, 4, 8, blp.BLP_ALPHA_DXT3)
+
+    assert pixels[:, :, 3].reshape(-1).tolist() == [17 * i for i in range(16)]
+    assert pixels[0, :, :3].tolist() == [[255, 0, 0], [0, 0, 255], [170, 0, 85], [85, 0, 170]]
+
+
+@pytest.mark.parametrize("a0, a1, expected", [
+    (255, 0, [255, 0, 218, 182, 145, 109, 72, 36]),
+    (0, 255, [0, 255, 51, 102, 153, 204, 0, 255]),
+])
+def test_dxt5_alpha(a0, a1, expected):
+    # pixel i uses alpha index i % 8
+    bits = sum((i % 8) << (3 * i) for i in range(16))
+    alpha = bytes([a0, a1]) + bits.to_bytes(6, 'little')
+
+    pixels = blp.decode_dxt(alpha + COLOR_BLOCK, 4, 4, 8, blp.BLP_ALPHA_DXT5)
+
+    assert pixels[:, :, 3].reshape(-1).tolist() == expected * 2
+
+
+def test_dxt_image_smaller_than_a_block():
+    pixels = blp.decode_dxt(COLOR_BLOCK, 2, 1, 0, blp.BLP_ALPHA_DXT1)
+
+    assert pixels.tolist() == [[list(RED), list(BLUE)]]
+
+
+@pytest.mark.parametrize("alpha_depth, alpha_data, expected", [
+    (0, b'', [255, 255, 255, 255]),
+    (1, bytes([0b0101]), [255, 0, 255, 0]),
+    (4, bytes([0x0F, 0x51]), [255, 0, 17, 85]),
+    (8, bytes([1, 2, 3, 4]), [1, 2, 3, 4]),
+])
+def test_palette(alpha_depth, alpha_data, expected):
+    # palette entries are BGRA
+    palette = numpy.zeros((256, 4), dtype=numpy.uint8)
+    palette[1] = (30, 20, 10, 0)
+    palette[2] = (60, 50, 40, 0)
+
+    pixels = blp.decode_palette(bytes([1, 2, 2, 1]) + alpha_data, palette, 2, 2, alpha_depth)
+
+    assert pixels[:, :, :3].reshape(-1, 3).tolist() == [[10, 20, 30], [40, 50, 60], [40, 50, 60], [10, 20, 30]]
+    assert pixels[:, :, 3].reshape(-1).tolist() == expected
+
+
+def test_decode_blp_mip_levels():
+    palette = bytes(4) + bytes([30, 20, 10, 0]) + bytes(1016)
+    mips = [bytes([1] * 16) + bytes([0x80] * 16), bytes([1] * 4) + bytes([0x40] * 4), bytes([0, 0xFF])]
+    data = make_blp2(blp.BLP_COMPRESSION_PALETTE, 8, 0, 4, 4, mips, palette)
+
+    header = blp.read_header(data)
+    assert blp.get_mip_count(header) == 3
+    assert blp.get_mip_level_for_size(header, 2) == 1
+    assert blp.get_mip_level_for_size(header, 1) == 2
+
+    assert blp.decode_blp(data).tolist() == [[[10, 20, 30, 0x80]] * 4] * 4
+    assert blp.decode_blp(data, 1).tolist() == [[[10, 20, 30, 0x40]] * 2] * 2
+    assert blp.decode_blp(data, 2).tolist() == [[[0, 0, 0, 0xFF]]]
+    assert blp.decode_blp(data, 5).shape == (1, 1, 4)
+
+
+def test_decode_blp_dxt_and_argb():
+    dxt = make_blp2(blp.BLP_COMPRESSION_DXT, 0, blp.BLP_ALPHA_DXT1, 4, 4, [COLOR_BLOCK])
+    argb = make_blp2(blp.BLP_COMPRESSION_ARGB8888, 8, 0, 1, 2, [bytes([3, 2, 1, 4, 7, 6, 5, 8])])
+
+    assert blp.decode_blp(dxt)[3].tolist() == [list(RED), list(BLUE), [170, 0, 85, 255], [85, 0, 170, 255]]
+    assert blp.decode_blp(argb).tolist() == [[[1, 2, 3, 4]], [[5, 6, 7, 8]]]
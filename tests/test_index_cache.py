@@ -0,0 +1,110 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from io_scene_wmo.mpq import index_cache
+from io_scene_wmo.mpq import mpyq
+from io_scene_wmo.mpq.mpq_writer import MPQWriter
+
+
+def make_archive(entries, block_table):
+    """ Stand-in for an MPQArchive, with a hash index of {(hash_a, hash_b): block index}. """
+    hash_index = {key: mpyq.MPQHashTableEntry(key[0], key[1], 0, 0, block) for key, block in entries.items()}
+    return SimpleNamespace(hash_index=hash_index, block_table=block_table)
+
+
+def block(flags=mpyq.MPQ_FILE_EXISTS, archived_size=16):
+    return mpyq.MPQBlockTableEntry(0, archived_size, archived_size, flags)
+
+
+def test_build_file_index_skips_invalid_entries():
+    patch = make_archive({(1, 1): 5, (2, 2): 0, (3, 3): 1}, [block(), block(flags=0)])
+    base = make_archive({(1, 1): 0, (2, 2): 1, (3, 3): 0, (4, 4): 0xFFFFFFFF}, [block(), block()])
+
+    file_index = index_cache.build_file_index([(patch, True), (base, True)])
+
+    # out of range block indices and deleted blocks of the patch fall back to the base archive
+    assert len(file_index) == 3
+    assert (file_index.owners[0], file_index.blocks[0]) == (1, 0)
+    assert (file_index.owners[1], file_index.blocks[1]) == (0, 0)
+    assert (file_index.owners[2], file_index.blocks[2]) == (1, 0)
+    assert file_index.get((4, 4)) is None
+
+
+@pytest.fixture
+def packages(tmp_path):
+    """ A folder patch, a patch archive and a base archive, in load order. """
+    folder_patch = tmp_path / "patch-folder"
+    (folder_patch / "World" / "wmo").mkdir(parents=True)
+    (folder_patch / "World" / "wmo" / "loose.wmo").write_bytes(b'loose file')
+
+    patch_path = str(tmp_path / "patch.MPQ")
+    with MPQWriter(patch_path, workers=1) as writer:
+        writer.add_file("World\\wmo\\test.wmo", b'patched file')
+
+    base_path = str(tmp_path / "common.MPQ")
+    with MPQWriter(base_path, workers=1) as writer:
+        writer.add_file("World\\wmo\\test.wmo", b'original file')
+        writer.add_file("World\\wmo\\loose.wmo", b'archived file')
+        writer.add_file("World\\wmo\\test_000.wmo", b'group file' * 1000)
+
+    return [str(folder_patch), patch_path, base_path]
+
+
+def open_resources(packages):
+    return [(package, False) if os.path.isdir(package) else (mpyq.MPQArchive(package, listfile=False), True)
+            for package in packages]
+
+
+def read(file_index, path):
+    storage, block_entry = file_index.get(index_cache.hash_path(path))
+    if block_entry is None:
+        with open(storage, 'rb') as f:
+            return f.read()
+    return bytes(storage.read_entry(block_entry))
+
+
+def test_cache_round_trip(tmp_path, packages):
+    cache_path = str(tmp_path / "cache" / "index.cache")
+    resource_map = open_resources(packages)
+    file_index = index_cache.build_file_index(resource_map)
+
+    index_cache.save_cache(cache_path, packages, resource_map, file_index)
+    cached_resource_map, cached_index = index_cache.load_cache(cache_path, packages, {'listfile': False})
+
+    assert list(cached_index.keys) == list(file_index.keys)
+    assert list(cached_index.owners) == list(file_index.owners)
+    assert list(cached_index.blocks) == list(file_index.blocks)
+    assert cached_index.loose_files == file_index.loose_files
+    for (archive, type), (cached_archive, cached_type) in zip(resource_map[1:], cached_resource_map[1:]):
+        assert cached_type and cached_archive.header == archive.header
+        assert list(cached_archive.hash_table) == list(archive.hash_table)
+        assert list(cached_archive.block_table) == list(archive.block_table)
+
+    assert read(cached_index, "World\\wmo\\loose.wmo") == b'loose file'
+    assert read(cached_index, "World\\wmo\\test.wmo") == b'patched file'
+    assert read(cached_index, "World\\wmo\\test_000.wmo") == b'group file' * 1000
+    assert cached_index.get(index_cache.hash_path("World\\wmo\\test_001.wmo")) is None
+
+
+def test_stale_cache_is_not_loaded(tmp_path, packages):
+    cache_path = str(tmp_path / "index.cache")
+    resource_map = open_resources(packages)
+    index_cache.save_cache(cache_path, packages, resource_map, index_cache.build_file_index(resource_map))
+
+    assert index_cache.load_cache(cache_path, packages[1:], {}) is None
+
+    with MPQWriter(packages[1], workers=1) as writer:
+        writer.add_file("World\\wmo\\test.wmo", b'patched file, second version')
+
+    assert index_cache.load_cache(cache_path, packages, {}) is None
+
+
+def test_missing_or_foreign_cache_is_not_loaded(tmp_path, packages):
+    cache_path = tmp_path / "index.cache"
+
+    assert index_cache.load_cache(str(cache_path), packages, {}) is None
+
+    cache_path.write_bytes(b'not a cache file')
+    assert index_cache.load_cache(str(cache_path), packages, {}) is None
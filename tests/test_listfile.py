@@ -0,0 +1,55 @@
+import pytest
+
+from io_scene_wmo.mpq.listfile import PathTrie, read_listfile
+
+LISTFILE = (b"World\\wmo\\Azeroth\\Buildings\\Inn.wmo\r\n"
+            b"World\\wmo\\Azeroth\\Buildings\\Inn_000.wmo\r\n"
+            b"world\\WMO\\azeroth\\buildings\\INN.WMO\r\n"
+            b"World\\wmo\\Azeroth\\Buildings\\Textures\\Wall.blp;"
+            b"World/wmo/Kalimdor/Tower.wmo\n"
+            b"Textures\\Water.blp\n\n")
+
+
+@pytest.fixture
+def trie():
+    trie = PathTrie()
+    for path in read_listfile(LISTFILE):
+        trie.add(path)
+    return trie
+
+
+def test_read_listfile():
+    assert read_listfile(LISTFILE)[3:] == ["World\\wmo\\Azeroth\\Buildings\\Textures\\Wall.blp",
+                                          "World/wmo/Kalimdor/Tower.wmo", "Textures\\Water.blp"]
+
+
+def test_find_keeps_first_spelling(trie):
+    assert len(trie) == 5
+    assert trie.find("WORLD/WMO/AZEROTH/BUILDINGS/inn.wmo") == "World\\wmo\\Azeroth\\Buildings\\Inn.wmo"
+    assert trie.find("World\\wmo\\Kalimdor\\Tower.wmo") == "World\\wmo\\Kalimdor\\Tower.wmo"
+    assert trie.find("World\\wmo\\Azeroth") is None
+    assert "world\\wmo\\azeroth\\buildings\\inn_001.wmo" not in trie
+
+
+def test_listdir(trie):
+    assert trie.listdir("world/wmo/azeroth/buildings") == ["Inn.wmo", "Inn_000.wmo", "Textures\\"]
+    assert trie.listdir() == ["Textures\\", "World\\"]
+    assert trie.listdir("World\\wmo\\Azeroth\\Buildings\\Inn.wmo") == []
+
+
+@pytest.mark.parametrize("pattern, expected", [
+    ("world\\wmo\\*\\buildings\\inn*.wmo", ["World\\wmo\\Azeroth\\Buildings\\Inn.wmo",
+                                            "World\\wmo\\Azeroth\\Buildings\\Inn_000.wmo"]),
+    ("WORLD/WMO/**/*.wmo", ["World\\wmo\\Azeroth\\Buildings\\Inn.wmo", "World\\wmo\\Azeroth\\Buildings\\Inn_000.wmo",
+                            "World\\wmo\\Kalimdor\\Tower.wmo"]),
+    ("**\\*.blp", ["Textures\\Water.blp", "World\\wmo\\Azeroth\\Buildings\\Textures\\Wall.blp"]),
+    ("world\\**", ["World\\wmo\\Azeroth\\Buildings\\Inn.wmo", "World\\wmo\\Azeroth\\Buildings\\Inn_000.wmo",
+                   "World\\wmo\\Azeroth\\Buildings\\Textures\\Wall.blp", "World\\wmo\\Kalimdor\\Tower.wmo"]),
+    ("world\\wmo\\azeroth\\buildings\\inn_00[0-9].wmo", ["World\\wmo\\Azeroth\\Buildings\\Inn_000.wmo"]),
+    ("world\\wmo\\?alimdor\\tower.wmo", ["World\\wmo\\Kalimdor\\Tower.wmo"]),
+    # directories are not returned, and wildcards do not cross directories
+    ("world\\wmo\\*", []),
+    ("world\\*.wmo", []),
+])
+def test_glob(trie, pattern, expected):
+    assert trie.glob(pattern) == expected
@@ -0,0 +1,62 @@
+import os
+import random
+
+import pytest
+
+from io_scene_wmo.mpq import mpyq
+from io_scene_wmo.mpq.mpq_writer import MPQWriter
+
+
+def make_files():
+    rng = random.Random(15)
+    sector_size = 512 << 3
+    return {
+        "World\\wmo\\small.wmo": b'small file',
+        "World\\wmo\\one_sector.wmo": b'x' * sector_size,
+        "World\\wmo\\text.wmo": b''.join(b'line %d\r\n' % i for i in range(5000)),
+        "Textures\\noise.blp": bytes(rng.getrandbits(8) for _ in range(3 * sector_size + 17)),
+    }
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    archive_path = str(tmp_path / "patch.MPQ")
+
+    with MPQWriter(archive_path, workers=2) as writer:
+        writer.add_file("World/wmo/small.wmo", b'replaced')
+        for name, data in make_files().items():
+            writer.add_file(name, data)
+
+    assert not os.path.exists(archive_path + '.tmp')
+    return archive_path
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+@pytest.mark.parametrize("sector_workers", [0, 3])
+def test_written_files_read_back(archive_path, use_mmap, sector_workers, monkeypatch):
+    monkeypatch.setattr(mpyq, 'PARALLEL_DECOMPRESSION_MIN_SIZE', 0)
+    archive = mpyq.MPQArchive(archive_path, use_mmap=use_mmap, sector_workers=sector_workers)
+    files = make_files()
+
+    try:
+        assert sorted(archive.files) == sorted(name.encode() for name in files)
+        for name, data in files.items():
+            assert bytes(archive.read_file(name)) == data
+            assert bytes(archive.read_file(name.lower())) == data
+        assert archive.read_file("World\\wmo\\missing.wmo") is None
+    finally:
+        archive.close()
+
+
+def test_written_files_stream(archive_path):
+    archive = mpyq.MPQArchive(archive_path)
+    data = make_files()["World\\wmo\\text.wmo"]
+
+    try:
+        stream = archive.open_file("World\\wmo\\text.wmo")
+        stream.seek(10000)
+        assert stream.read(5000) == data[10000:15000]
+        stream.seek(0)
+        assert stream.read() == data
+    finally:
+        archive.close()
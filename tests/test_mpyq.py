@@ -0,0 +1,87 @@
+import struct
+
+import pytest
+
+from io_scene_wmo.mpq import mpyq
+
+
+def test_sector_pool_stays_usable_when_more_workers_are_requested():
+    pool = mpyq.get_sector_pool(2)
+    larger_pool = mpyq.get_sector_pool(5)
+
+    assert pool.submit(sum, (1, 2)).result() == 3
+    assert larger_pool.submit(sum, (3, 4)).result() == 7
+    assert mpyq.get_sector_pool(2) is pool
+
+
+@pytest.mark.parametrize("data, pc, pb, expected", [
+    # test vectors of lookup3.c driver5()
+    (b"", 0, 0, (0xdeadbeef, 0xdeadbeef)),
+    (b"", 0, 0xdeadbeef, (0xbd5b7dde, 0xdeadbeef)),
+    (b"", 0xdeadbeef, 0xdeadbeef, (0x9c093ccd, 0xbd5b7dde)),
+    (b"Four score and seven years ago", 0, 0, (0x17770551, 0xce7226e6)),
+    (b"Four score and seven years ago", 0, 1, (0xe3607cae, 0xbd371de4)),
+    (b"Four score and seven years ago", 1, 0, (0xcd628161, 0x6cbea4b3)),
+])
+def test_hashlittle2(data, pc, pb, expected):
+    assert mpyq.hashlittle2(data, pc, pb) == expected
+
+
+def pack_bits(values, bit_count):
+    """ Pack unsigned integers into a little-endian bit array. """
+    packed = 0
+    for i, value in enumerate(values):
+        packed |= value << (i * bit_count)
+    return packed.to_bytes((len(values) * bit_count + 7) // 8, 'little')
+
+
+def make_ext_tables(names, block_table):
+    """ Make decrypted HET and BET tables of files, with 64-bit name hashes and 32-bit file table fields. """
+    name_hashes = [mpyq.MPQArchive._hash_jenkins(name) | 1 << 63 for name in names]
+
+    total_count = len(names) * 2
+    het_hashes = bytearray(total_count)
+    het_indices = [0] * total_count
+    for i, name_hash in enumerate(name_hashes):
+        index = name_hash % total_count
+        while het_hashes[index]:
+            index = (index + 1) % total_count
+        het_hashes[index] = name_hash >> 56
+        het_indices[index] = i
+    indices = pack_bits(het_indices, 8)
+    het_header = (12 + 32 + total_count + len(indices), len(names), total_count, 64, 8, 0, 8, len(indices))
+    het = struct.pack('<4s2I', b'HET\x1a', 1, 0) + struct.pack('<8I', *het_header) + bytes(het_hashes) + indices
+
+    flags = sorted(set(entry.flags for entry in block_table))
+    fields = []
+    for entry in block_table:
+        fields.append(entry.offset | entry.size << 32 | entry.archived_size << 64 | flags.index(entry.flags) << 96)
+    table = pack_bits(fields, 104)
+    bet_names = pack_bits([name_hash & (1 << 56) - 1 for name_hash in name_hashes], 56)
+    bet_header = (12 + 76 + 4 * len(flags) + len(table) + len(bet_names), len(names), 0x10, 104,
+                  0, 32, 64, 96, 104, 32, 32, 32, 8, 0, 56, 0, 56, len(bet_names), len(flags))
+    bet = (struct.pack('<4s2I', b'BET\x1a', 1, 0) + struct.pack('<19I', *bet_header) +
+           struct.pack('<%dI' % len(flags), *flags) + table + bet_names)
+
+    return mpyq.MPQHetTable(het), mpyq.MPQBetTable(bet)
+
+
+def test_het_bet_lookup():
+    names = ["World\\wmo\\test.wmo", "World\\wmo\\test_000.wmo", "(listfile)", "Textures\\a.blp"]
+    block_table = [
+        mpyq.MPQBlockTableEntry(0x20, 100, 300, mpyq.MPQ_FILE_EXISTS | mpyq.MPQ_FILE_COMPRESS),
+        mpyq.MPQBlockTableEntry(0x84, 5000, 5000, mpyq.MPQ_FILE_EXISTS),
+        mpyq.MPQBlockTableEntry(0x140C, 20, 40, mpyq.MPQ_FILE_EXISTS | mpyq.MPQ_FILE_COMPRESS),
+        mpyq.MPQBlockTableEntry(0x1420, 0, 0, 0),
+    ]
+
+    archive = mpyq.MPQArchive.__new__(mpyq.MPQArchive)
+    archive._het_table, archive._bet_table = make_ext_tables(names, block_table)
+
+    # names are case insensitive and may use forward slashes
+    assert archive.get_block_table_entry("world/WMO/Test.wmo") == block_table[0]
+    assert archive.get_block_table_entry("World\\wmo\\test_000.wmo") == block_table[1]
+    assert archive.get_block_table_entry("(listfile)") == block_table[2]
+    # deleted and missing files
+    assert archive.get_block_table_entry("Textures\\a.blp") is None
+    assert archive.get_block_table_entry("World\\wmo\\test_001.wmo") is None
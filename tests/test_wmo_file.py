@@ -0,0 +1,175 @@
+import random
+import struct
+
+import pytest
+
+from io_scene_wmo.wmo import wmo_format
+from io_scene_wmo.wmo.wmo_file import WMOFile
+from io_scene_wmo.wmo.wmo_group import WMOGroupFile
+
+
+def make_wmo(filepath, n_vertices=60, n_records=4):
+    """ A root file with every chunk populated, and one group file with liquid and second UV and color sets. """
+    rng = random.Random(24)
+
+    root = WMOFile(filepath)
+    root.mver.Version = 17
+    root.mohd.nGroups = 1
+    root.mohd.AmbientColor = (1, 2, 3, 4)
+    root.mohd.BoundingBoxCorner1 = (-1.5, -2.0, -3.0)
+    root.mohd.BoundingBoxCorner2 = (4.0, 5.25, 6.0)
+    root.motx.add_string("textures\\a.blp")
+    root.modn.AddString("doodads\\a.m2")
+    root.mosb.Skybox = "environments\\sky.m2"
+
+    for i in range(n_records):
+        material = wmo_format.WMO_Material()
+        material.Texture1Ofs = i
+        material.DiffColor = (9, 8, 7, 6)
+        root.momt.Materials.append(material)
+
+        group_info = wmo_format.GroupInfo()
+        group_info.BoundingBoxCorner1 = (rng.random(), rng.random(), rng.random())
+        root.mogi.Infos.append(group_info)
+        group_info.NameOfs = root.mogn.add_string("group %d" % i)
+
+        light = wmo_format.Light()
+        light.Color = (1, 2, 3, 4)
+        light.Position = (rng.random(), rng.random(), rng.random())
+        root.molt.Lights.append(light)
+
+        doodad = wmo_format.DoodadDefinition()
+        doodad.Position = (rng.random(), rng.random(), rng.random())
+        doodad.Rotation = (0.0, 0.0, 0.0, 1.0)
+        doodad.Color = (1, 2, 3, 4)
+        doodad.Scale = 1.5
+        root.modd.Definitions.append(doodad)
+
+        doodad_set = wmo_format.DoodadSet()
+        doodad_set.Name = "Set_%d" % i
+        root.mods.Sets.append(doodad_set)
+
+        fog = wmo_format.Fog()
+        fog.Position = (rng.random(), rng.random(), rng.random())
+        fog.Color1 = (1, 2, 3, 4)
+        fog.StartFactor2 = 0.25
+        root.mfog.Fogs.append(fog)
+
+        portal_info = wmo_format.PortalInfo()
+        portal_info.Normal = (0.0, 0.0, 1.0)
+        root.mopt.Infos.append(portal_info)
+        root.mopr.Relationships.append(wmo_format.PortalRelationship())
+        root.mopv.PortalVertices.append((rng.random(), rng.random(), rng.random()))
+
+    group = WMOGroupFile(root)
+    group.mver.Version = 17
+    group.mogp.BoundingBoxCorner1 = (-1.0, -2.0, -3.0)
+    group.mogp.FogIndices = (1, 2, 3, 4)
+    group.movt.Vertices.extend([(rng.random(), rng.random(), rng.random()) for _ in range(n_vertices)])
+    group.monr.Normals.extend([(0.0, 0.0, 1.0)] * n_vertices)
+    group.motv.TexCoords.extend([(rng.random(), rng.random()) for _ in range(n_vertices)])
+    group.motv2.TexCoords.extend([(0.1, 0.2)] * n_vertices)
+    group.mocv.vertColors.extend([tuple(rng.randrange(256) for _ in range(4)) for _ in range(n_vertices)])
+    group.mocv2.vertColors.extend([(1, 2, 3, 4)] * n_vertices)
+    group.movi.Indices.extend([rng.randrange(n_vertices) for _ in range(3 * n_vertices)])
+    group.mopy.TriangleMaterials.extend([wmo_format.TriangleMaterial(0x20, i % 3) for i in range(n_vertices)])
+    group.mobr.Faces.extend(range(n_vertices))
+    group.molr.LightRefs = [0, 1, 2]
+    group.modr.DoodadRefs = [0, 1]
+
+    for i in range(n_records):
+        batch = wmo_format.Batch()
+        batch.BoundingBox = (1, 2, 3, 4, 5, 6)
+        batch.nTriangle = 3
+        group.moba.Batches.append(batch)
+
+        node = wmo_format.BSP_Node()
+        node.Children = (-1, -1)
+        node.Dist = 1.5
+        group.mobn.Nodes.append(node)
+
+    group.mliq.xVerts = group.mliq.yVerts = 3
+    group.mliq.xTiles = group.mliq.yTiles = 2
+    group.mliq.Position = (1.0, 2.0, 3.0)
+    for i in range(9):
+        vertex = wmo_format.WaterVertex()
+        vertex.height = 0.5 * i
+        group.mliq.VertexMap.append(vertex)
+    group.mliq.TileFlags = [1, 2, 3, 4]
+
+    root.groups = [group]
+    return root
+
+
+def read_bytes(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read()
+
+
+def test_read_write_is_byte_identical(tmp_path):
+    written = make_wmo(str(tmp_path / "written.wmo"))
+    written.write()
+
+    root = WMOFile(written.filepath)
+    root.read()
+    root.filepath = str(tmp_path / "rewritten.wmo")
+    try:
+        root.write()
+    finally:
+        root.close()
+
+    assert read_bytes(root.filepath) == read_bytes(written.filepath)
+    assert read_bytes(root.get_group_filepath(0)) == read_bytes(written.get_group_filepath(0))
+
+
+def test_read_chunks(tmp_path):
+    written = make_wmo(str(tmp_path / "written.wmo"))
+    written.write()
+
+    root = WMOFile(written.filepath)
+    root.read()
+    try:
+        group = root.groups[0]
+        assert [root.mogn.get_string(info.NameOfs) for info in root.mogi.Infos] == ["group %d" % i for i in range(4)]
+        assert root.mosb.Skybox == "environments\\sky.m2"
+        assert [fog.StartFactor2 for fog in root.mfog.Fogs] == [0.25] * 4
+        assert list(group.mocv.vertColors) == list(written.groups[0].mocv.vertColors)
+        assert list(group.movi.Indices) == list(written.groups[0].movi.Indices)
+        assert [vertex.height for vertex in group.mliq.VertexMap] == [0.5 * i for i in range(9)]
+        assert group.movt.Vertices[1] == pytest.approx(written.groups[0].movt.Vertices[1])
+    finally:
+        root.close()
+
+
+def chunk_bytes(magic, data):
+    return struct.pack('<4sI', magic, len(data)) + data
+
+
+def test_pack_into_layouts():
+    mver = wmo_format.MVER_chunk(version=17)
+    mosb = wmo_format.MOSB_chunk()
+
+    movi = wmo_format.MOVI_chunk()
+    movi.Indices.extend([0, 1, 2, 65535])
+    mopy = wmo_format.MOPY_chunk()
+    mopy.TriangleMaterials.extend([wmo_format.TriangleMaterial(0x20, 1), wmo_format.TriangleMaterial(0x04, 0xFF)])
+
+    mliq = wmo_format.MLIQ_chunk()
+    mliq.xVerts, mliq.yVerts, mliq.xTiles, mliq.yTiles = 2, 1, 1, 1
+    mliq.Position = (1.0, 2.0, 3.0)
+    mliq.materialID = 7
+    for height in (0.5, -1.25):
+        vertex = wmo_format.WaterVertex()
+        vertex.flow1, vertex.flow2, vertex.flow1Pct, vertex.filler = 1, 2, 3, 4
+        vertex.height = height
+        mliq.VertexMap.append(vertex)
+    mliq.TileFlags = [0x40]
+
+    assert bytes(wmo_format.pack_chunks([mver, mosb, movi, mopy, mliq])) == b''.join([
+        chunk_bytes(b'REVM', struct.pack('<I', 17)),
+        chunk_bytes(b'BSOM', b'\0' * 4),
+        chunk_bytes(b'IVOM', struct.pack('<4H', 0, 1, 2, 65535)),
+        chunk_bytes(b'YPOM', bytes([0x20, 1, 0x04, 0xFF])),
+        chunk_bytes(b'QILM', struct.pack('<4I3fH', 2, 1, 1, 1, 1.0, 2.0, 3.0, 7) +
+                    struct.pack('<4Bf', 1, 2, 3, 4, 0.5) + struct.pack('<4Bf', 1, 2, 3, 4, -1.25) + bytes([0x40])),
+    ])
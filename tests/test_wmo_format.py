@@ -0,0 +1,91 @@
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from io_scene_wmo.wmo import wmo_format
+from io_scene_wmo.wmo import wmo_group
+from io_scene_wmo.wmo.wmo_format import ElementArray
+
+
+VERTICES = [(0.0, 1.0, 2.0), (3.5, -4.0, 5.0), (6.0, 7.0, -8.25), (9.0, 10.0, 11.0)]
+INDICES = [0, 1, 2, 2, 3, 0]
+COLORS = [(10, 20, 30, 0), (40, 50, 60, 255), (70, 80, 90, 128), (100, 110, 120, 255)]
+TEX_COORDS = [(0.0, 0.0), (0.5, 0.25), (1.0, 1.0), (0.75, 2.0)]
+
+
+def as_element_array(dtype, elements):
+    return ElementArray.frombuffer(dtype, numpy.array(elements, dtype=numpy.dtype(dtype).base).tobytes())
+
+
+class VertexGroup:
+    def __init__(self):
+        self.weights = {}
+
+    def add(self, vertices, weight, mode):
+        assert mode == 'ADD'
+        for vertex in vertices:
+            assert type(vertex) is int
+            self.weights[vertex] = weight
+
+
+def test_element_array_reads_like_a_list():
+    vertices = as_element_array(('<f4', 3), VERTICES)
+
+    assert len(vertices) == len(VERTICES)
+    assert list(vertices) == VERTICES
+    assert vertices[1] == VERTICES[1]
+    assert vertices[1:3] == VERTICES[1:3]
+    assert vertices.array.shape == (4, 3)
+
+
+def test_gather_elements():
+    vertices = as_element_array(('<f4', 3), VERTICES)
+    indices = as_element_array('<u2', INDICES)
+
+    gathered = wmo_format.gather_elements(vertices, indices)
+
+    assert isinstance(gathered, numpy.ndarray)
+    assert gathered.tolist() == [list(VERTICES[i]) for i in INDICES]
+    assert wmo_format.gather_elements(VERTICES, INDICES) == [VERTICES[i] for i in INDICES]
+
+
+def test_flatten_elements():
+    flat = wmo_format.flatten_elements(as_element_array(('<f4', 3), VERTICES), 'f4')
+
+    assert flat.dtype == numpy.dtype('f4') and flat.flags['C_CONTIGUOUS']
+    assert flat.tolist() == [value for vertex in VERTICES for value in vertex]
+    assert wmo_format.flatten_elements(VERTICES, 'f4') == [value for vertex in VERTICES for value in vertex]
+    assert wmo_format.flatten_elements(as_element_array('<u2', INDICES), 'i4').tolist() == INDICES
+    assert wmo_format.flatten_elements(INDICES, 'i4') == INDICES
+
+
+def test_loop_colors_match_list_path():
+    colors = as_element_array(('<u1', 4), COLORS)
+    indices = as_element_array('<u2', INDICES)
+
+    array_colors = wmo_group.get_loop_colors(wmo_format.gather_elements(colors, indices))
+    list_colors = wmo_group.get_loop_colors(wmo_format.gather_elements(COLORS, INDICES))
+
+    assert list_colors[:3] == [30 / 255, 20 / 255, 10 / 255]
+    assert array_colors.tolist() == pytest.approx(list_colors)
+
+
+def test_loop_uvs_match_list_path():
+    tex_coords = as_element_array(('<f4', 2), TEX_COORDS)
+    indices = as_element_array('<u2', INDICES)
+
+    array_uvs = wmo_group.get_loop_uvs(wmo_format.gather_elements(tex_coords, indices))
+    list_uvs = wmo_group.get_loop_uvs(wmo_format.gather_elements(TEX_COORDS, INDICES))
+
+    assert list_uvs[2:4] == [0.5, 0.75]
+    assert array_uvs.tolist() == list_uvs
+
+
+def test_alpha_weights_match_list_path():
+    array_group = VertexGroup()
+    list_group = VertexGroup()
+
+    wmo_group.add_alpha_weights(array_group, as_element_array(('<u1', 4), COLORS), as_element_array('<u2', INDICES))
+    wmo_group.add_alpha_weights(list_group, COLORS, INDICES)
+
+    assert array_group.weights == list_group.weights == {0: 0.0, 1: 1.0, 2: 128 / 255, 3: 1.0}
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from io_scene_wmo.mpq import wow
+from io_scene_wmo.mpq.mpq_writer import MPQWriter
+
+
+@pytest.fixture
+def config_dir(tmp_path, monkeypatch):
+    """ Point bpy.utils.user_resource to a temporary directory, with the Blender 2.7x signature. """
+    config_dir = tmp_path / "config"
+
+    def user_resource(resource_type, path="", autocreate=False):
+        target = os.path.join(str(config_dir), path)
+        if autocreate:
+            os.makedirs(target, exist_ok=True)
+        return target
+
+    monkeypatch.setattr(wow.bpy.utils, 'user_resource', user_resource)
+    return config_dir
+
+
+@pytest.fixture
+def wow_path(tmp_path):
+    """ A client directory with a single archive. """
+    wow_path = tmp_path / "wow"
+    data_path = os.path.join(str(wow_path), "Data\\")
+    os.makedirs(data_path)
+    (wow_path / "Wow.exe").write_bytes(b'')
+
+    with MPQWriter(os.path.join(data_path, "common.MPQ"), workers=1) as writer:
+        writer.add_file("World\\wmo\\test.wmo", b'root file')
+        writer.add_file("World\\wmo\\test_000.wmo", b'group file' * 1000)
+
+    return str(wow_path)
+
+
+def test_default_cache_path(config_dir, wow_path):
+    cache_path = wow.WoWFileData.get_default_cache_path(wow_path)
+
+    assert os.path.dirname(cache_path) == os.path.join(str(config_dir), "io_scene_wmo")
+    assert os.path.isdir(os.path.dirname(cache_path))
+    assert cache_path == wow.WoWFileData.get_default_cache_path(wow_path)
+
+
+def test_load_with_default_cache_path(config_dir, wow_path):
+    game_data = wow.WoWFileData(wow_path, None)
+
+    assert os.path.isfile(game_data.cache_path)
+    assert bytes(game_data.read_file("world/wmo/TEST.wmo")) == b'root file'
+
+    # the second load is served from the index cache
+    cached_game_data = wow.WoWFileData(wow_path, None)
+
+    assert cached_game_data.cache_path == game_data.cache_path
+    assert bytes(cached_game_data.read_file("World\\wmo\\test_000.wmo")) == b'group file' * 1000
+    assert not cached_game_data.exists("World\\wmo\\test_001.wmo")
+
+
+def test_file_cache_stores_bytes_copies():
+    file_cache = wow.FileCache(1024)
+    data = bytearray(b'texture data')
+
+    cached = file_cache.put('file', memoryview(data))
+    data[:7] = b'changed'
+
+    assert type(cached) is bytes and cached == b'texture data'
+    assert file_cache.get('file') is cached
+    assert file_cache.put('file', b'other data') is cached
+
+    big_file = bytearray(512)
+    assert file_cache.put('big file', big_file) is big_file
+    assert file_cache.get('big file') is None
+
+
+def test_read_file_with_file_cache(config_dir, wow_path):
+    game_data = wow.WoWFileData(wow_path, None, file_cache_size=1 << 20)
+
+    data = game_data.read_file("World\\wmo\\test_000.wmo")
+
+    assert type(data) is bytes and data == b'group file' * 1000
+    assert game_data.read_file("World\\wmo\\test_000.wmo") is data
+    assert game_data.file_cache.stats()['hits'] == 1